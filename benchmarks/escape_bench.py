@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark the generator's XML escaping against xml.sax.saxutils.escape.
+
+Escapes every string a render escapes (titles, subtitles, channel ids and
+durations) both ways, then times full renders of a synthetic guide with the
+generator's memoised escapers and with plain saxutils escaping.
+
+Usage:
+    PYTHONPATH=src python benchmarks/escape_bench.py --channels 1000
+"""
+
+import argparse
+import os
+import sys
+import time
+from xml.sax.saxutils import escape  # nosec B406 - benchmark baseline only
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=wrong-import-position
+from synthetic import make_guide  # noqa: E402
+from tvtv2xmltv.escaping import escape_attr, escape_text, memoize  # noqa: E402
+from tvtv2xmltv.xmltv_generator import XMLTVGenerator  # noqa: E402
+
+
+def best_of(repeat, func, *args):
+    """Return the best wall time of `repeat` calls"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def escape_all(values, text, attr):
+    """Escape values the way one render does"""
+    for channel_id, duration, title, subtitle in values:
+        attr(channel_id)
+        attr(duration)
+        text(title)
+        text(subtitle)
+
+
+def saxutils_generator():
+    """A generator escaping every string with saxutils, as before"""
+    generator = XMLTVGenerator()
+    generator._text = generator._attr = lambda value: escape(str(value))
+    return generator
+
+
+def main():
+    """Run the benchmark"""
+    # pylint: disable=protected-access
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=8)
+    parser.add_argument("--per-day", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    lineup_data, listings_by_day = make_guide(args.channels, args.days, args.per_day)
+    values = [
+        (channel["channelNumber"], program["duration"], program["title"], program["subtitle"])
+        for day in listings_by_day
+        for channel, programs in zip(lineup_data, day)
+        for program in programs
+    ]
+    print(f"{len(values)} programmes, {len(values) * 4} escapes per render")
+
+    sax = best_of(
+        args.repeat, escape_all, values, lambda v: escape(str(v)), lambda v: escape(str(v))
+    )
+    fast = best_of(
+        args.repeat,
+        escape_all,
+        values,
+        lambda v: escape_text(str(v)),
+        lambda v: escape_attr(str(v)),
+    )
+    memo = best_of(args.repeat, escape_all, values, memoize(escape_text), memoize(escape_attr))
+    print(f"escape   saxutils: {sax:.3f}s")
+    print(f"escape  fast path: {fast:.3f}s ({sax / fast:.2f}x)")
+    print(f"escape   memoised: {memo:.3f}s ({sax / memo:.2f}x)")
+
+    baseline = saxutils_generator()
+    generator = XMLTVGenerator()
+    assert baseline.generate(lineup_data, listings_by_day) == generator.generate(
+        lineup_data, listings_by_day
+    ), "escaping changed the output"
+    before = best_of(args.repeat, baseline.generate, lineup_data, listings_by_day)
+    after = best_of(args.repeat, generator.generate, lineup_data, listings_by_day)
+    print(f"render   saxutils: {before:.2f}s")
+    print(f"render   memoised: {after:.2f}s ({before / after:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Measure start-up import time of the convert and serve modes.
+
+Runs fresh interpreters with `-X importtime`, importing what each mode of
+src/main.py loads, and reports the median total and the slowest top-level
+imports. With --budget-ms the exit status is 1 when the convert path exceeds
+the budget, so the check can run in CI.
+
+Usage:
+    python benchmarks/import_bench.py --runs 7 --budget-ms 150
+"""
+
+import argparse
+import os
+import statistics
+import subprocess  # nosec B404 - runs this interpreter only
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+MODES = {
+    "convert": "import main; import tvtv2xmltv.converter",
+    "serve": "import main; import tvtv2xmltv.server",
+}
+
+
+def import_times(code):
+    """
+    Import time of a snippet in a fresh interpreter.
+
+    Returns:
+        Tuple of (total microseconds, {module: cumulative microseconds}) for the
+        top-level imports and the modules they import directly
+    """
+    result = subprocess.run(  # nosec B603 - fixed arguments
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # Header line
+        # Names are indented by two spaces per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            total += int(cumulative)
+        if depth <= 1:
+            modules[name.strip()] = int(cumulative)
+    return total, modules
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--budget-ms", type=float, help="Fail if convert start-up exceeds this")
+    args = parser.parse_args()
+
+    totals = {}
+    for mode, code in MODES.items():
+        runs = [import_times(code) for _ in range(args.runs)]
+        totals[mode] = statistics.median(total for total, _ in runs) / 1000
+        print(f"{mode:<8} {totals[mode]:7.1f} ms (median of {args.runs})")
+        _, modules = runs[-1]
+        for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[: args.top]:
+            print(f"    {cumulative / 1000:7.1f} ms  {name}")
+
+    print(f"convert/serve: {totals['convert'] / totals['serve']:.0%}")
+    if args.budget_ms is not None and totals["convert"] > args.budget_ms:
+        print(f"convert start-up exceeds the {args.budget_ms} ms budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
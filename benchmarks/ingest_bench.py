@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark streaming grid ingestion against decoding whole responses.
+
+Builds synthetic grid responses (one per 20-station batch per day) and measures
+the time and the peak traced memory of ingesting a full refresh both ways.
+
+Usage:
+    PYTHONPATH=src python benchmarks/ingest_bench.py --channels 500
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=wrong-import-position
+from synthetic import make_guide  # noqa: E402
+from tvtv2xmltv.grid_stream import parse_grid  # noqa: E402
+
+
+def chunked(body, size=64 * 1024):
+    """Yield a body in network-sized chunks"""
+    for start in range(0, len(body), size):
+        yield body[start : start + size]
+
+
+def ingest_whole(responses):
+    """Previous path: decode each body in full (as `response.json()` does)"""
+    days = []
+    for day_bodies in responses:
+        listings = []
+        for body in day_bodies:
+            listings.extend(json.loads(body.decode("utf-8")))
+        days.append(listings)
+    return days
+
+
+def ingest_streaming(responses):
+    """Streaming path: parse each body incrementally into slim programmes"""
+    days = []
+    strings = {}  # Shared across the refresh, as TVTVClient does
+    for day_bodies in responses:
+        listings = []
+        for body in day_bodies:
+            stations, _ = parse_grid(chunked(body), strings=strings)
+            listings.extend(stations)
+        days.append(listings)
+    return days
+
+
+def measure(ingest, responses):
+    """Return (seconds, peak traced MB) for ingesting and retaining a refresh"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = ingest(responses)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak / 1024 / 1024
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--channels", type=int, default=500)
+    parser.add_argument("--days", type=int, default=8)
+    parser.add_argument("--per-day", type=int, default=24)
+    parser.add_argument("--batch", type=int, default=20)
+    args = parser.parse_args()
+
+    _, listings_by_day = make_guide(args.channels, args.days, args.per_day)
+    responses = [
+        [
+            json.dumps(day[start : start + args.batch]).encode("utf-8")
+            for start in range(0, len(day), args.batch)
+        ]
+        for day in listings_by_day
+    ]
+    del listings_by_day
+    total = sum(len(body) for day in responses for body in day)
+    print(
+        f"{args.channels} channels x {args.days} days x {args.per_day}/day, "
+        f"{total / 1024 / 1024:.1f} MB of responses"
+    )
+
+    assert ingest_whole(responses[:1]) == ingest_streaming(responses[:1])
+    for name, ingest in (("whole", ingest_whole), ("streaming", ingest_streaming)):
+        elapsed, peak = measure(ingest, responses)
+        print(f"{name:<10} {elapsed:>7.2f}s  peak {peak:>7.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Load test comparing the Flask development server with the production serving mode.
+
+Serves a synthetic guide file from a separate process for each mode and hammers it
+with concurrent clients, reporting throughput and latency percentiles.
+
+Usage:
+    PYTHONPATH=src python benchmarks/load_test.py --clients 32 --duration 10
+"""
+
+import argparse
+import os
+import socket
+import subprocess  # nosec B404 - launches this script as the server process
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+
+def write_guide(path, size_mb):
+    """Write a synthetic XMLTV file of roughly `size_mb` megabytes"""
+    programme = (
+        '<programme start="20250101000000 +0000" stop="20250101003000 +0000" '
+        'duration="1800" channel="2.1"><title lang="en">Synthetic Show</title></programme>\r\n'
+    )
+    count = max(1, int(size_mb * 1024 * 1024 / len(programme)))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\r\n<tv>\r\n')
+        f.write(programme * count)
+        f.write("</tv>")
+
+
+def serve(mode, port, guide_file, threads):
+    """Run an XMLTVServer (without background updates) serving `guide_file`"""
+    sys.path.insert(0, SRC_DIR)
+    # pylint: disable=import-outside-toplevel
+    from tvtv2xmltv.config import Config
+    from tvtv2xmltv.server import XMLTVServer
+
+    config = Config()
+    config.lineups = ["BENCH"]
+    config.output_file = guide_file
+    config.host = "127.0.0.1"
+    config.port = port
+    config.server_mode = mode
+    config.server_threads = threads
+    server = XMLTVServer(config)
+    server.lineup_files["BENCH"] = guide_file
+    server.serve()
+
+
+def free_port():
+    """Return an unused local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, timeout=15):
+    """Wait until the server answers"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):  # nosec B310 - local URL
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+def run_load(url, clients, duration):
+    """Issue requests from `clients` threads for `duration` seconds"""
+    deadline = time.monotonic() + duration
+
+    def worker():
+        latencies = []
+        errors = 0
+        received = 0
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                with urllib.request.urlopen(url, timeout=60) as response:  # nosec B310
+                    chunk = response.read(1024 * 1024)
+                    while chunk:
+                        received += len(chunk)
+                        chunk = response.read(1024 * 1024)
+                latencies.append(time.monotonic() - started)
+            except OSError:
+                errors += 1
+        return latencies, errors, received
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = [f.result() for f in [pool.submit(worker) for _ in range(clients)]]
+
+    latencies = sorted(lat for lats, _, _ in results for lat in lats)
+    errors = sum(err for _, err, _ in results)
+    received = sum(size for _, _, size in results)
+    return latencies, errors, received
+
+
+def percentile(values, pct):
+    """Return the `pct` percentile of sorted values"""
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    """Run the comparison"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modes", default="flask,waitress")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--size-mb", type=float, default=2.0)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--path", default="/BENCH.xml")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--guide", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.guide, args.threads)
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        guide = os.path.join(tmp, "guide.xml")
+        write_guide(guide, args.size_mb)
+        print(
+            f"{args.clients} clients, {args.duration:.0f}s, "
+            f"{os.path.getsize(guide) / 1024 / 1024:.1f} MB guide, path {args.path}"
+        )
+        print(f"{'mode':<10} {'req/s':>8} {'MB/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+
+        for mode in args.modes.split(","):
+            port = free_port()
+            # Arguments are fixed values built by this script
+            proc = subprocess.Popen(  # nosec B603
+                [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    "--serve",
+                    mode,
+                    "--port",
+                    str(port),
+                    "--guide",
+                    guide,
+                    "--threads",
+                    str(args.threads),
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_for(f"http://127.0.0.1:{port}/health")
+                latencies, errors, received = run_load(
+                    f"http://127.0.0.1:{port}{args.path}", args.clients, args.duration
+                )
+            finally:
+                proc.terminate()
+                proc.wait(timeout=15)
+
+            rate = len(latencies) / args.duration
+            throughput = received / args.duration / 1024 / 1024
+            print(
+                f"{mode:<10} {rate:>8.1f} {throughput:>8.1f} "
+                f"{percentile(latencies, 50) * 1000:>8.1f} "
+                f"{percentile(latencies, 95) * 1000:>8.1f} {errors:>7}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark serial vs process-pool XMLTV rendering on a synthetic large lineup.
+
+Usage:
+    PYTHONPATH=src python benchmarks/render_bench.py --channels 2000 --workers 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=wrong-import-position
+from synthetic import make_guide  # noqa: E402
+from tvtv2xmltv.xmltv_generator import XMLTVGenerator  # noqa: E402
+
+
+def timed(generator, lineup_data, listings_by_day, repeat):
+    """Return the best wall time over `repeat` renders"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        generator.generate(lineup_data, listings_by_day)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--channels", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=8)
+    parser.add_argument("--per-day", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    lineup_data, listings_by_day = make_guide(args.channels, args.days, args.per_day)
+    total = args.channels * args.days * args.per_day
+    print(f"{total} programmes, {os.cpu_count()} CPUs")
+
+    serial = timed(XMLTVGenerator(), lineup_data, listings_by_day, args.repeat)
+    print(f"serial:            {serial:.2f}s")
+
+    pooled = XMLTVGenerator(render_workers=args.workers, parallel_threshold=0)
+    try:
+        # Warm up the pool so process start-up is not counted
+        pooled.generate(lineup_data[:1], [day[:1] for day in listings_by_day])
+        parallel = timed(pooled, lineup_data, listings_by_day, args.repeat)
+    finally:
+        pooled.close()
+    print(f"{args.workers} workers:         {parallel:.2f}s ({serial / parallel:.2f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
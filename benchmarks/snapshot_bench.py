@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark snapshot size and reload time against the rendered XMLTV document.
+
+Usage:
+    PYTHONPATH=src python benchmarks/snapshot_bench.py --channels 500
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# pylint: disable=wrong-import-position
+from synthetic import make_guide  # noqa: E402
+from tvtv2xmltv.snapshot import load_snapshot, write_snapshot  # noqa: E402
+from tvtv2xmltv.xmltv_generator import XMLTVGenerator  # noqa: E402
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--channels", type=int, default=500)
+    parser.add_argument("--days", type=int, default=8)
+    parser.add_argument("--per-day", type=int, default=24)
+    args = parser.parse_args()
+
+    lineup_data, listings_by_day = make_guide(args.channels, args.days, args.per_day)
+    guide = {
+        "lineup_data": lineup_data,
+        "listings_by_day": listings_by_day,
+        "channel_key": None,
+        "fetched_at": datetime.now(timezone.utc),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snap = os.path.join(tmp, "guide.snap")
+        started = time.perf_counter()
+        xml = XMLTVGenerator().generate(lineup_data, listings_by_day)
+        render = time.perf_counter() - started
+
+        started = time.perf_counter()
+        write_snapshot(snap, "BENCH", guide)
+        write = time.perf_counter() - started
+
+        started = time.perf_counter()
+        load_snapshot(snap)
+        load = time.perf_counter() - started
+
+        total = args.channels * args.days * args.per_day
+        print(f"{total} programmes")
+        print(f"XMLTV:    {len(xml.encode('utf-8')) / 1024 / 1024:8.2f} MB, render {render:.3f}s")
+        print(f"snapshot: {os.path.getsize(snap) / 1024 / 1024:8.2f} MB, write {write:.3f}s")
+        print(f"snapshot load: {load * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""
+Synthetic guide data for benchmarks
+"""
+
+from datetime import datetime, timedelta, timezone
+
+TITLES = [
+    "Evening News",
+    "Law & Order",
+    "Jeopardy!",
+    "Wheel of Fortune",
+    "The Tonight Show",
+    "Movie: <Untitled>",
+    "Sports Center",
+    "Cartoon Hour",
+]
+
+
+def make_guide(channels=500, days=8, programmes_per_day=24):
+    """
+    Build synthetic guide data in the converter's layout.
+
+    Returns:
+        Tuple of (lineup_data, listings_by_day)
+    """
+    lineup_data = [
+        {
+            "channelNumber": f"{n // 10 + 2}.{n % 10 + 1}",
+            "stationId": 10000 + n,
+            "stationCallSign": f"W{n:04d}",
+            "logo": f"/logos/s{10000 + n}.png",
+        }
+        for n in range(channels)
+    ]
+    base = datetime(2025, 1, 1, 4, tzinfo=timezone.utc)
+    runtime = 24 * 60 // programmes_per_day
+    listings_by_day = []
+    for day in range(days):
+        day_listings = []
+        for n in range(channels):
+            programs = []
+            for i in range(programmes_per_day):
+                start = base + timedelta(days=day, minutes=i * runtime)
+                programs.append(
+                    {
+                        "programId": f"EP{n:05d}{day}{i:03d}",
+                        "title": TITLES[(n + i) % len(TITLES)],
+                        "subtitle": f"Episode {i}" if i % 3 else "",
+                        "startTime": start.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                        "duration": runtime * 60,
+                        "runTime": runtime,
+                        "type": "SMNS"[i % 4],
+                        "flags": ["HD", "Stereo"] if i % 2 else ["New"],
+                    }
+                )
+            day_listings.append(programs)
+        listings_by_day.append(day_listings)
+    return lineup_data, listings_by_day
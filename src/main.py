@@ -2,11 +2,20 @@
 """
 Main entry point for tvtv2xmltv application
 """
+
 import sys
+import signal
 import argparse
+import json
+import logging
 from tvtv2xmltv.config import Config
-from tvtv2xmltv.converter import TVTVConverter
-from tvtv2xmltv.server import XMLTVServer
+from tvtv2xmltv.log import configure_from
+
+logger = logging.getLogger("tvtv2xmltv.main")
+
+# The modes import what they need when they run: one-shot conversions (e.g.
+# from cron) then don't load Flask, Werkzeug and the server modules.
+# pylint: disable=import-outside-toplevel
 
 
 def main():
@@ -14,59 +23,182 @@ def main():
     parser = argparse.ArgumentParser(description="Convert TVTV data to XMLTV format")
     parser.add_argument(
         "--mode",
-        choices=["convert", "serve"],
+        choices=["convert", "serve", "plan", "worker", "history"],
         default="serve",
-        help="Mode of operation: convert (one-time) or serve (HTTP server)",
+        help="Mode of operation: convert (one-time), serve (HTTP server), plan (dry run), "
+        "worker (fetch jobs from TVTV_WORK_QUEUE) or history (read TVTV_HISTORY_DIR)",
+    )
+    parser.add_argument("--output", help="Output filename (only for convert and history modes)")
+    parser.add_argument("--lineup", help="Lineup ID (only for history mode)")
+    parser.add_argument(
+        "--at",
+        help="Write the guide published at this ISO-8601 time (only for history mode; "
+        "without it the archived versions are listed)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=1.0,
+        help="Assumed seconds per upstream response (only for plan mode)",
+    )
+    parser.add_argument(
+        "--fetch-channels",
+        action="store_true",
+        help="Fetch the channels of lineups that were never cached (only for plan mode; "
+        "this sends one upstream request per such lineup)",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the plan (or history entries) as JSON"
     )
-    parser.add_argument("--output", help="Output filename (only for convert mode)")
 
     args = parser.parse_args()
 
     config = Config()
+    # The plan and history are printed to stdout; keep log records out of them
+    configure_from(config, sys.stderr if args.mode in ("plan", "history") else None)
+
+    if args.mode == "plan":
+        from tvtv2xmltv.converter import TVTVConverter
+        from tvtv2xmltv.planner import build_plan, format_plan
+
+        # Dry run: report the upstream requests a refresh would make
+        try:
+            plan = build_plan(
+                TVTVConverter(config), latency=args.latency, fetch_channels=args.fetch_channels
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        print(json.dumps(plan, indent=2) if args.json else format_plan(plan))
+        return 0
+
+    if args.mode == "worker":
+        from tvtv2xmltv.converter import TVTVConverter
+        from tvtv2xmltv.work_queue import QueueWorker, WorkQueue
+
+        # Fetch lineup x day jobs queued by a serve/convert coordinator
+        if not config.work_queue:
+            print("Error: worker mode requires TVTV_WORK_QUEUE", file=sys.stderr)
+            return 1
+        worker = QueueWorker(
+            WorkQueue(config.work_queue, lease=config.work_queue_lease),
+            TVTVConverter(config).create_client,
+        )
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            logger.info("Shutting down")
+        return 0
+
+    if args.mode == "history":
+        return show_history(config, args)
 
     if args.mode == "convert":
+        from tvtv2xmltv.converter import TVTVConverter
+
         # One-time conversion
         converter = TVTVConverter(config)
         output_file = args.output or config.output_file
 
-        print("Converting TVTV data to XMLTV format...")
-        print(f"Lineups: {', '.join(config.lineups)}")
-        print(f"Timezone: {config.timezone}")
-        print(f"Days: {config.days}")
+        logger.info(
+            "Converting TVTV data to XMLTV format",
+            extra={
+                "lineups": ",".join(config.lineups),
+                "timezone": config.timezone,
+                "days": config.days,
+            },
+        )
 
         try:
             result_files = converter.save_to_file(output_file)
-            if len(result_files) == 1:
-                print(f"XMLTV file saved to: {result_files[0]}")
-            else:
-                print("XMLTV files saved:")
-                for f in result_files:
-                    print(f"  - {f}")
+            logger.info("XMLTV files saved", extra={"files": ",".join(result_files)})
             return 0
         except Exception as e:  # pylint: disable=broad-except
             print(f"Error: {e}", file=sys.stderr)
             return 1
     else:
         # Server mode
-        print("Starting XMLTV server...")
-        print(f"Host: {config.host}")
-        print(f"Port: {config.port}")
-        print(f"Lineups: {', '.join(config.lineups)}")
-        print(f"Timezone: {config.timezone}")
-        print(f"Days: {config.days}")
-        print(f"Update interval: {config.update_interval} seconds")
+        logger.info(
+            "Starting XMLTV server",
+            extra={
+                "host": config.host,
+                "port": config.port,
+                "lineups": ",".join(config.lineups),
+                "timezone": config.timezone,
+                "days": config.days,
+                "update_interval": config.update_interval,
+            },
+        )
 
         try:
+            from tvtv2xmltv.server import XMLTVServer
+
             server = XMLTVServer(config)
             server.run()
             return 0
         except KeyboardInterrupt:
-            print("\nShutting down...")
+            logger.info("Shutting down")
             return 0
         except Exception as e:  # pylint: disable=broad-except
             print(f"Error: {e}", file=sys.stderr)
             return 1
 
 
+def show_history(config, args):
+    """List a lineup's archived guide versions, or write the one published at `--at`"""
+    from datetime import datetime, timezone
+
+    from tvtv2xmltv.history import HistoryError
+
+    if not config.history_dir:
+        print("Error: history mode requires TVTV_HISTORY_DIR", file=sys.stderr)
+        return 1
+    lineup_id = args.lineup or config.lineups[0]
+    try:
+        at = datetime.fromisoformat(args.at.replace("Z", "+00:00")) if args.at else None
+    except ValueError:
+        print(f"Error: invalid --at time: {args.at}", file=sys.stderr)
+        return 1
+    if at is not None and at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+
+    from tvtv2xmltv.converter import TVTVConverter, write_atomic
+
+    converter = TVTVConverter(config)
+    try:
+        if at is None:
+            entries = converter.history.entries(lineup_id)
+            if args.json:
+                print(json.dumps(entries, indent=2))
+            else:
+                for entry in entries:
+                    print(f"{entry['published_at']}  {entry['kind']:<5}  {entry['bytes']:>9} bytes")
+            return 0
+        archived = converter.history.guide_at(lineup_id, at)
+    except HistoryError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if archived is None:
+        print(f"Error: no guide archived for {lineup_id} at {at.isoformat()}", file=sys.stderr)
+        return 1
+
+    guide, published_at = archived
+    xmltv_data = converter.generator.generate(
+        guide["lineup_data"],
+        guide["listings_by_day"],
+        f"{config.external_url}/{lineup_id}.xml",
+    )
+    if args.output:
+        write_atomic(args.output, xmltv_data)
+        logger.info(
+            "Archived guide saved",
+            extra={"file": args.output, "published_at": published_at.isoformat()},
+        )
+    else:
+        sys.stdout.write(xmltv_data)
+    return 0
+
+
 if __name__ == "__main__":
     sys.exit(main())
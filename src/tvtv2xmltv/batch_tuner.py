@@ -0,0 +1,106 @@
+"""
+Adaptive grid batch sizing module
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+
+class AdaptiveBatchSizer:
+    """Tune the number of stations requested per grid call
+
+    The batch size grows additively while requests complete quickly and shrinks
+    multiplicatively on throttling, timeouts, slow or oversized responses, so the
+    client converges on the largest batch the upstream currently tolerates.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(
+        self,
+        initial=20,
+        minimum=5,
+        maximum=50,
+        step=5,
+        fast_latency=2.0,
+        slow_latency=10.0,
+        max_response_bytes=4 * 1024 * 1024,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.step = max(1, step)
+        self.fast_latency = fast_latency
+        self.slow_latency = slow_latency
+        self.max_response_bytes = max_response_bytes
+        self.batch_size = self._clamp(initial)
+
+    def _clamp(self, value):
+        return max(self.minimum, min(int(value), self.maximum))
+
+    def _grow(self):
+        self.batch_size = self._clamp(self.batch_size + self.step)
+
+    def _shrink(self):
+        self.batch_size = self._clamp(self.batch_size // 2)
+
+    def record_success(self, latency, response_bytes=0):
+        """Record a successful batch and adjust the batch size"""
+        if latency > self.slow_latency or response_bytes > self.max_response_bytes:
+            self._shrink()
+        elif latency <= self.fast_latency:
+            self._grow()
+
+    def record_throttle(self):
+        """Record a batch that was rate limited (HTTP 429)"""
+        self._shrink()
+
+    def record_timeout(self):
+        """Record a batch that timed out"""
+        self._shrink()
+
+    @classmethod
+    def load(cls, path, lineup_id, **kwargs):
+        """
+        Create a sizer for a lineup, restoring its learned batch size if persisted.
+
+        Args:
+            path: JSON state file (None to skip persistence)
+            lineup_id: Lineup the state belongs to
+            **kwargs: Arguments passed to the constructor
+
+        Returns:
+            AdaptiveBatchSizer instance
+        """
+        sizer = cls(**kwargs)
+        state = _read_state(path).get(lineup_id)
+        if isinstance(state, dict) and isinstance(state.get("batch_size"), int):
+            sizer.batch_size = sizer._clamp(state["batch_size"])
+        return sizer
+
+    def save(self, path, lineup_id):
+        """Persist the learned batch size for a lineup (no-op when path is None)"""
+        if not path:
+            return
+        state = _read_state(path)
+        state[lineup_id] = {
+            "batch_size": self.batch_size,
+            "updated": datetime.now(timezone.utc).isoformat(),
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def _read_state(path):
+    """Read the persisted state file, returning an empty dict if unavailable"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
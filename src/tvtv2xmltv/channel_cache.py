@@ -0,0 +1,135 @@
+"""
+Channel lineup metadata cache module
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ChannelCache:
+    """Cache channel lineups separately from grid data
+
+    Channel lineups change rarely, so they are kept (in memory and optionally on
+    disk) with their own TTL. Each entry carries a digest of the channel data so
+    consumers can detect when a lineup actually changed.
+    """
+
+    def __init__(self, cache_dir=None, ttl=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._entries = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock_for(self, lineup_id):
+        with self._locks_guard:
+            return self._locks.setdefault(lineup_id, threading.Lock())
+
+    def _path(self, lineup_id):
+        return os.path.join(self.cache_dir, f"{lineup_id}.json")
+
+    def _load(self, lineup_id):
+        """Load a persisted entry from disk, or None"""
+        if not self.cache_dir or not os.path.exists(self._path(lineup_id)):
+            return None
+        try:
+            with open(self._path(lineup_id), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Entries written by older versions or cut short are treated as missing
+        if (
+            not isinstance(entry, dict)
+            or not isinstance(entry.get("channels"), list)
+            or not isinstance(entry.get("digest"), str)
+            or not isinstance(entry.get("fetched_at"), (int, float))
+        ):
+            return None
+        return entry
+
+    def _store(self, lineup_id, entry):
+        """Keep an entry in memory and persist it when a cache directory is set"""
+        self._entries[lineup_id] = entry
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self._path(lineup_id)}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(lineup_id))
+
+    def is_fresh(self, lineup_id):
+        """Return True if a cached entry exists and is within its TTL"""
+        entry = self._entries.get(lineup_id) or self._load(lineup_id)
+        return entry is not None and time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    def peek(self, lineup_id):
+        """Return the cached channel list (fresh or expired) without fetching, or None"""
+        entry = self._entries.get(lineup_id) or self._load(lineup_id)
+        return entry["channels"] if entry is not None else None
+
+    def get(self, lineup_id, fetch):
+        """
+        Return the channel lineup, fetching it only when missing or expired.
+
+        Concurrent callers for the same lineup share a single fetch. If a refetch
+        fails, the expired entry is served rather than failing the refresh.
+
+        Args:
+            lineup_id: The lineup ID
+            fetch: Callable returning the channel list from upstream
+
+        Returns:
+            Tuple of (channel list, digest of the channel data)
+        """
+        with self._lock_for(lineup_id):
+            entry = self._entries.get(lineup_id) or self._load(lineup_id)
+            if entry is not None and time.time() - entry.get("fetched_at", 0) < self.ttl:
+                self._entries[lineup_id] = entry
+                return entry["channels"], entry["digest"]
+
+            try:
+                channels = fetch()
+            except Exception:  # pylint: disable=broad-except
+                if entry is None:
+                    raise
+                logger.warning(
+                    "Channel refresh failed; using cached lineup", extra={"lineup": lineup_id}
+                )
+                return entry["channels"], entry["digest"]
+
+            if not channels:
+                if entry is None:
+                    return channels, None
+                logger.warning(
+                    "Empty channel lineup returned; using cached lineup",
+                    extra={"lineup": lineup_id},
+                )
+                return entry["channels"], entry["digest"]
+
+            digest = channel_digest(channels)
+            if entry is not None and entry.get("digest") != digest:
+                logger.info("Channel lineup changed", extra={"lineup": lineup_id})
+            self._store(
+                lineup_id, {"fetched_at": time.time(), "digest": digest, "channels": channels}
+            )
+            return channels, digest
+
+    def invalidate(self, lineup_id):
+        """Force the next `get` for a lineup to refetch"""
+        entry = self._entries.get(lineup_id) or self._load(lineup_id)
+        if entry is not None:
+            entry["fetched_at"] = 0
+            self._entries[lineup_id] = entry
+
+
+def channel_digest(channels):
+    """Return a stable digest of channel lineup data"""
+    payload = json.dumps(channels, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
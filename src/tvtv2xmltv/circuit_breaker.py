@@ -0,0 +1,121 @@
+"""
+Circuit breaker for upstream requests
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request while the circuit is open"""
+
+
+class CircuitBreaker:
+    """Stop calling tvtv.us during outages
+
+    After `failure_threshold` consecutive failed requests (throttling, server
+    errors, timeouts or connection errors) the circuit opens and requests fail
+    immediately. Once `reset_timeout` has passed, a single probe request is let
+    through: success closes the circuit, failure opens it again with the timeout
+    doubled (up to `max_reset_timeout`).
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=300, max_reset_timeout=3600):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max(reset_timeout, max_reset_timeout)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._timeout = reset_timeout
+        self._retry_at = 0.0
+        self._probe = None
+        self._lock = threading.Lock()
+
+    def allow(self, owner=None):
+        """
+        Return True if a request may be sent now.
+
+        While open, the first caller after the reset timeout becomes the probe
+        (the circuit turns half-open); everyone else is refused until it reports.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self._retry_at:
+                self.state = HALF_OPEN
+                self._probe = owner
+                return True
+            return False
+
+    def release(self, owner=None):
+        """
+        Give up the probe without an outcome (e.g. the request was never sent).
+
+        The circuit opens again with the probe due right away, so the next
+        caller can probe instead of being refused indefinitely.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN and self._probe is owner:
+                self.state = OPEN
+                self._retry_at = time.monotonic()
+                self._probe = None
+
+    def record_success(self):
+        """Record a request that reached a healthy upstream"""
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Upstream recovered; closing circuit breaker")
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self.last_error = None
+            self._timeout = self.reset_timeout
+
+    def record_failure(self, error=None):
+        """Record a failed request, opening the circuit when failures persist"""
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error) if error is not None else None
+            if self.state == HALF_OPEN:
+                self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+                self._open()
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._retry_at = time.monotonic() + self._timeout
+        if self.opened_at is None:
+            self.opened_at = datetime.now(timezone.utc)
+        logger.warning(
+            "Circuit breaker open; probing upstream again later",
+            extra={"failures": self.failures, "retry_in": self._timeout},
+        )
+
+    def retry_in(self):
+        """Seconds until a probe is allowed (0 when closed or already due)"""
+        with self._lock:
+            if self.state != OPEN:
+                return 0
+            return max(0.0, self._retry_at - time.monotonic())
+
+    def status(self):
+        """Breaker state for reporting"""
+        retry_in = self.retry_in()
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened_at": self.opened_at.isoformat() if self.opened_at else None,
+            "retry_in": round(retry_in, 1) if self.state == OPEN else None,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,125 @@
+"""
+Leader election and shared guide storage for multi-replica deployments
+"""
+
+import json
+import os
+import socket
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from .converter import write_atomic
+from .snapshot import load_snapshot, snapshot_path
+
+
+class ClusterCoordinator:
+    """Coordinate replicas that share one output directory
+
+    Exactly one replica holds an exclusive lock on `leader.lock` in the shared
+    directory and fetches guide data; it publishes the XMLTV files, the fetched
+    data and a `manifest.json` describing them. The other replicas only read the
+    manifest. The lock is released by the operating system when the leader
+    exits, so a follower takes over on its next poll. The fetched data is shared
+    as the binary snapshots saved next to each XMLTV file.
+    """
+
+    LOCK_FILE = "leader.lock"
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, shared_dir):
+        if fcntl is None:
+            raise RuntimeError("TVTV_SHARED_DIR requires file locking support (fcntl)")
+        self.shared_dir = os.path.abspath(shared_dir)
+        self.identity = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self._lock_file = None
+        os.makedirs(self.shared_dir, exist_ok=True)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.shared_dir, self.MANIFEST_FILE)
+
+    def path(self, name):
+        """Resolve a manifest entry (stored relative to the shared directory)"""
+        return os.path.join(self.shared_dir, name)
+
+    def try_acquire(self):
+        """
+        Try to become the leader without blocking.
+
+        Returns:
+            True if this process holds the leader lock
+        """
+        if self.is_leader:
+            return True
+        lock_file = open(  # pylint: disable=consider-using-with
+            os.path.join(self.shared_dir, self.LOCK_FILE), "a+", encoding="utf-8"
+        )
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(self.identity)
+        lock_file.flush()
+        self._lock_file = lock_file
+        self.is_leader = True
+        return True
+
+    def release(self):
+        """Give up leadership"""
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+        self.is_leader = False
+
+    def read_manifest(self):
+        """Return the published manifest, or None if missing or unreadable"""
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifest if isinstance(manifest, dict) else None
+
+    def publish(self, lineup_files, published_at, merged_file=None):
+        """
+        Publish fetched data and the manifest (leader only).
+
+        Args:
+            lineup_files: Mapping of lineup_id to the saved XMLTV file path
+            published_at: Timezone-aware datetime of the update
+            merged_file: Path of the merged guide, if one was saved
+
+        Returns:
+            The manifest dictionary that was written
+        """
+        lineups = {}
+        for lineup_id, filename in lineup_files.items():
+            entry = {"file": os.path.relpath(filename, self.shared_dir)}
+            if os.path.exists(snapshot_path(filename)):
+                entry["data"] = os.path.relpath(snapshot_path(filename), self.shared_dir)
+            lineups[lineup_id] = entry
+
+        manifest = {
+            "leader": self.identity,
+            "published_at": published_at.isoformat(),
+            "lineups": lineups,
+        }
+        if merged_file:
+            manifest["merged"] = os.path.relpath(merged_file, self.shared_dir)
+        write_atomic(self.manifest_path, json.dumps(manifest, indent=2))
+        return manifest
+
+    def load_guide(self, name):
+        """Load a published snapshot in the converter's `guide_data` layout"""
+        guide = load_snapshot(self.path(name))
+        guide.pop("lineup_id", None)
+        return guide
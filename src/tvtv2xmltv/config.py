@@ -4,27 +4,81 @@ Configuration module for tvtv2xmltv
 
 import os
 
+# Settings only applied at startup; a reload keeps the running values
+RESTART_SETTINGS = frozenset(
+    [
+        "host",
+        "port",
+        "server_mode",
+        "server_threads",
+        "server_connection_limit",
+        "shared_dir",
+        "cache_dir",
+        "config_file",
+        "work_queue",
+        "history_dir",
+    ]
+)
+
+
+def read_config_file(path):
+    """
+    Read `KEY=VALUE` settings (the environment variable names) from a file.
+
+    Blank lines and lines starting with # are ignored, an optional `export `
+    prefix is accepted and values may be quoted.
+
+    Raises:
+        OSError: If the file cannot be read
+        ValueError: If a line is not a `KEY=VALUE` setting
+    """
+    settings = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("export "):
+                line = line[len("export ") :].strip()
+            key, sep, value = line.partition("=")
+            key = key.strip()
+            if not sep or not key:
+                raise ValueError(f"{path}:{number}: expected KEY=VALUE")
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+                value = value[1:-1]
+            settings[key] = value
+    return settings
+
 
 class Config:
     """Configuration class that loads settings from environment variables
 
     Supports multiple lineups via the `TVTV_LINEUPS` env var (comma-separated).
     Backwards-compatible with the single `TVTV_LINEUP_ID` env var.
+
+    When `TVTV_CONFIG_FILE` names a file of `KEY=VALUE` settings, its values
+    override the environment. The server re-reads it on change or SIGHUP.
     """
 
-    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-instance-attributes,too-many-statements
+
+    def __init__(self, environ=None):
+        env = dict(os.environ if environ is None else environ)
+        self.config_file = env.get("TVTV_CONFIG_FILE")
+        if self.config_file:
+            env.update(read_config_file(self.config_file))
 
-    def __init__(self):
-        self.timezone = os.getenv("TVTV_TIMEZONE", "America/New_York")
+        self.timezone = env.get("TVTV_TIMEZONE", "America/New_York")
 
         # Support multiple lineups via TVTV_LINEUPS (comma-separated). Fall back
         # to TVTV_LINEUP_ID for backwards compatibility.
-        lineup_env = os.getenv("TVTV_LINEUPS")
+        lineup_env = env.get("TVTV_LINEUPS")
         if lineup_env:
             # Split by comma and strip whitespace, ignore empty entries
             self.lineups = [lineup.strip() for lineup in lineup_env.split(",") if lineup.strip()]
         else:
-            single = os.getenv("TVTV_LINEUP_ID", "USA-OTA30236")
+            single = env.get("TVTV_LINEUP_ID", "USA-OTA30236")
             self.lineups = [single]
 
         # Keep `lineup_id` attribute for compatibility with existing code/tests
@@ -32,32 +86,286 @@ class Config:
 
         # Parse integer environment variables with validation
         try:
-            self.days = int(os.getenv("TVTV_DAYS", "8"))
+            self.days = int(env.get("TVTV_DAYS", "8"))
         except ValueError:
             self.days = 8
 
-        self.output_file = os.getenv("TVTV_OUTPUT_FILE", "xmltv.xml")
+        self.output_file = env.get("TVTV_OUTPUT_FILE", "xmltv.xml")
 
         try:
-            self.update_interval = int(os.getenv("TVTV_UPDATE_INTERVAL", "3600"))
+            self.update_interval = int(env.get("TVTV_UPDATE_INTERVAL", "3600"))
         except ValueError:
             self.update_interval = 3600
 
+        # Refreshes start on a fixed cadence, each delayed by up to `update_jitter`
+        # seconds. A refresh stops fetching after `refresh_deadline` seconds (0: the
+        # update interval) and a lineup after `lineup_deadline` (0: no own limit),
+        # publishing what was fetched by then
+        try:
+            self.update_jitter = int(env.get("TVTV_UPDATE_JITTER", "30"))
+        except ValueError:
+            self.update_jitter = 30
+        try:
+            self.refresh_deadline = int(env.get("TVTV_REFRESH_DEADLINE", "0"))
+        except ValueError:
+            self.refresh_deadline = 0
         try:
-            self.port = int(os.getenv("TVTV_PORT", "8080"))
+            self.lineup_deadline = int(env.get("TVTV_LINEUP_DEADLINE", "0"))
+        except ValueError:
+            self.lineup_deadline = 0
+
+        # Demand-driven refreshes: a lineup requested `demand_rate` times an hour
+        # refreshes every `update_interval`, busier ones down to
+        # `min_update_interval` and idle ones up to `max_update_interval` (0: four
+        # update intervals); stale data is also refreshed when it is requested
+        self.demand_refresh = env.get("TVTV_DEMAND_REFRESH", "false").lower() in (
+            "true",
+            "1",
+            "yes",
+        )
+        try:
+            self.demand_rate = int(env.get("TVTV_DEMAND_RATE", "6"))
+        except ValueError:
+            self.demand_rate = 6
+        try:
+            self.min_update_interval = int(env.get("TVTV_MIN_UPDATE_INTERVAL", "900"))
+        except ValueError:
+            self.min_update_interval = 900
+        try:
+            self.max_update_interval = int(env.get("TVTV_MAX_UPDATE_INTERVAL", "0"))
+        except ValueError:
+            self.max_update_interval = 0
+
+        try:
+            self.port = int(env.get("TVTV_PORT", "8080"))
         except ValueError:
             self.port = 8080
         # Binding to 0.0.0.0 is intentional for Docker/server deployment
-        self.host = os.getenv("TVTV_HOST", "0.0.0.0")  # nosec B104
+        self.host = env.get("TVTV_HOST", "0.0.0.0")  # nosec B104
+
+        # HTTP serving mode: "flask" (development server) or "waitress" (production)
+        self.server_mode = env.get("TVTV_SERVER", "flask").strip().lower()
+        if self.server_mode not in ("flask", "waitress"):
+            self.server_mode = "flask"
+
+        try:
+            self.server_threads = int(env.get("TVTV_SERVER_THREADS", "8"))
+        except ValueError:
+            self.server_threads = 8
+
+        try:
+            self.server_connection_limit = int(env.get("TVTV_SERVER_CONNECTION_LIMIT", "100"))
+        except ValueError:
+            self.server_connection_limit = 100
+
+        # Seconds to wait for an in-progress update when shutting down
+        try:
+            self.shutdown_timeout = int(env.get("TVTV_SHUTDOWN_TIMEOUT", "10"))
+        except ValueError:
+            self.shutdown_timeout = 10
+
+        # Internal nginx location serving the output directory (optional). When set,
+        # guide downloads are handed to nginx via X-Accel-Redirect.
+        self.x_accel_prefix = env.get("TVTV_X_ACCEL_PREFIX") or None
 
         # Mock mode for local testing without hitting the real API
-        self.mock_mode = os.getenv("TVTV_MOCK_MODE", "false").lower() in ("true", "1", "yes")
+        self.mock_mode = env.get("TVTV_MOCK_MODE", "false").lower() in ("true", "1", "yes")
 
         # Base URL for stream URLs in XMLTV channels (optional)
-        self.stream_base_url = os.getenv("TVTV_STREAM_BASE_URL")
+        self.stream_base_url = env.get("TVTV_STREAM_BASE_URL")
 
         # External URL for source-info-url in XMLTV (optional, defaults to localhost)
-        self.external_url = os.getenv("TVTV_EXTERNAL_URL", f"http://localhost:{self.port}")
+        self.external_url = env.get("TVTV_EXTERNAL_URL", f"http://localhost:{self.port}")
+
+        # Directory for persisted state and caches (optional; state is kept in
+        # memory only when unset)
+        self.cache_dir = env.get("TVTV_CACHE_DIR")
+
+        # Save a binary snapshot of the fetched data alongside each XMLTV file
+        self.snapshots = env.get("TVTV_SNAPSHOTS", "true").lower() in ("true", "1", "yes")
+
+        # Also publish a merged guide of all lineups as all.xml
+        self.merged_output = env.get("TVTV_MERGED_OUTPUT", "false").lower() in (
+            "true",
+            "1",
+            "yes",
+        )
+
+        # Process pool rendering for very large lineups (0 or 1 renders in-process)
+        try:
+            self.render_workers = int(env.get("TVTV_RENDER_WORKERS", "0"))
+        except ValueError:
+            self.render_workers = 0
+
+        try:
+            self.render_parallel_threshold = int(env.get("TVTV_RENDER_PARALLEL_THRESHOLD", "10000"))
+        except ValueError:
+            self.render_parallel_threshold = 10000
+
+        # Serve channel logos from a local cache at /logos/ instead of pointing
+        # clients at upstream (downloaded once, refetched after the TTL and
+        # optionally scaled down to fit TVTV_LOGO_SIZE pixels)
+        self.logo_proxy = env.get("TVTV_LOGO_PROXY", "false").lower() in ("true", "1", "yes")
+
+        try:
+            self.logo_ttl = int(env.get("TVTV_LOGO_TTL", "2592000"))
+        except ValueError:
+            self.logo_ttl = 2592000
+
+        try:
+            self.logo_size = int(env.get("TVTV_LOGO_SIZE", "0"))
+        except ValueError:
+            self.logo_size = 0
+
+        # Also publish each lineup's days as separate documents named by content
+        # hash, with a manifest, so clients can download only the days that changed
+        self.shards = env.get("TVTV_SHARDS", "false").lower() in ("true", "1", "yes")
+
+        # Change notifications: concurrent /events streams (each holds a server
+        # thread) and webhook URLs (comma-separated) POSTed each new guide version
+        try:
+            self.events_max_clients = int(env.get("TVTV_EVENTS_MAX_CLIENTS", "4"))
+        except ValueError:
+            self.events_max_clients = 4
+        self.webhook_urls = [
+            url.strip() for url in env.get("TVTV_WEBHOOK_URLS", "").split(",") if url.strip()
+        ]
+        self.webhook_secret = env.get("TVTV_WEBHOOK_SECRET")
+
+        # Distributed fetching: path of an SQLite job queue shared with
+        # `--mode worker` processes, their job lease in seconds, and whether the
+        # coordinator also fetches jobs while it waits
+        self.work_queue = env.get("TVTV_WORK_QUEUE")
+        try:
+            self.work_queue_lease = int(env.get("TVTV_WORK_QUEUE_LEASE", "300"))
+        except ValueError:
+            self.work_queue_lease = 300
+        self.work_queue_local = env.get("TVTV_WORK_QUEUE_LOCAL", "true").lower() in (
+            "true",
+            "1",
+            "yes",
+        )
+
+        # Guide history: directory of an archive of every published guide
+        # (stored as changes) and the days of history kept
+        self.history_dir = env.get("TVTV_HISTORY_DIR")
+        try:
+            self.history_days = int(env.get("TVTV_HISTORY_DAYS", "30"))
+        except ValueError:
+            self.history_days = 30
+
+        # Named render variants (JSON object of profile name to timezone,
+        # stream_url, channels and days) and the memory for cached renderings
+        self.render_profiles = env.get("TVTV_RENDER_PROFILES", "")
+
+        try:
+            self.render_cache_mb = int(env.get("TVTV_RENDER_CACHE_MB", "64"))
+        except ValueError:
+            self.render_cache_mb = 64
+
+        # Shared output directory for multi-replica deployments (optional). When set,
+        # one elected replica fetches and publishes; the others follow its manifest.
+        self.shared_dir = env.get("TVTV_SHARED_DIR")
+
+        try:
+            self.follower_poll_interval = int(env.get("TVTV_FOLLOWER_POLL_INTERVAL", "10"))
+        except ValueError:
+            self.follower_poll_interval = 10
+
+        # Grid batch sizing: initial stations per request and the adaptive ceiling
+        try:
+            self.batch_size = int(env.get("TVTV_BATCH_SIZE", "20"))
+        except ValueError:
+            self.batch_size = 20
+
+        try:
+            self.max_batch_size = int(env.get("TVTV_MAX_BATCH_SIZE", "50"))
+        except ValueError:
+            self.max_batch_size = 50
+
+        # Channel lineups change rarely; cache them separately from grid data
+        try:
+            self.channel_cache_ttl = int(env.get("TVTV_CHANNEL_CACHE_TTL", "604800"))
+        except ValueError:
+            self.channel_cache_ttl = 604800
+
+        # Refresh profiling: "true" (span timing), "all", or a comma-separated list
+        # of spans, cprofile and tracemalloc. Traces are also written to the
+        # profile directory when set.
+        self.profile = env.get("TVTV_PROFILE", "false")
+        self.profile_dir = env.get("TVTV_PROFILE_DIR")
+
+        # Circuit breaker: consecutive upstream failures before requests stop, and
+        # seconds before a single probe request is tried again
+        try:
+            self.breaker_threshold = int(env.get("TVTV_BREAKER_THRESHOLD", "5"))
+        except ValueError:
+            self.breaker_threshold = 5
+
+        try:
+            self.breaker_reset_timeout = int(env.get("TVTV_BREAKER_RESET_TIMEOUT", "300"))
+        except ValueError:
+            self.breaker_reset_timeout = 300
+
+        # Upstream request budget per rolling hour/day (0 = unlimited). Refreshes
+        # fetch fewer days or keep stale data rather than exceed it.
+        try:
+            self.request_budget_hour = int(env.get("TVTV_REQUEST_BUDGET_HOUR", "0"))
+        except ValueError:
+            self.request_budget_hour = 0
+
+        try:
+            self.request_budget_day = int(env.get("TVTV_REQUEST_BUDGET_DAY", "0"))
+        except ValueError:
+            self.request_budget_day = 0
+
+        # Log output: level of the package, per-module overrides such as
+        # "tvtv_client=DEBUG,server=WARNING" and "text" (key=value) or "json" lines
+        self.log_level = env.get("TVTV_LOG_LEVEL", "INFO").upper()
+        self.log_levels = env.get("TVTV_LOG_LEVELS", "")
+        self.log_format = env.get("TVTV_LOG_FORMAT", "text").lower()
+
+        # Seconds between checks of TVTV_CONFIG_FILE for changes
+        try:
+            self.config_poll_interval = int(env.get("TVTV_CONFIG_POLL_INTERVAL", "5"))
+        except ValueError:
+            self.config_poll_interval = 5
 
         # Validate days (max 8)
         self.days = max(1, min(self.days, 8))
+
+        self.follower_poll_interval = max(1, self.follower_poll_interval)
+        self.config_poll_interval = max(1, self.config_poll_interval)
+        self.breaker_threshold = max(1, self.breaker_threshold)
+        self.breaker_reset_timeout = max(1, self.breaker_reset_timeout)
+        self.request_budget_hour = max(0, self.request_budget_hour)
+        self.request_budget_day = max(0, self.request_budget_day)
+        self.render_cache_mb = max(0, self.render_cache_mb)
+        self.logo_ttl = max(60, self.logo_ttl)
+        self.logo_size = max(0, self.logo_size)
+        self.events_max_clients = max(0, self.events_max_clients)
+        self.work_queue_lease = max(10, self.work_queue_lease)
+        self.history_days = max(1, self.history_days)
+        self.update_jitter = max(0, min(self.update_jitter, self.update_interval // 2))
+        if self.refresh_deadline <= 0:
+            self.refresh_deadline = max(1, self.update_interval)
+        self.lineup_deadline = max(0, self.lineup_deadline)
+        self.demand_rate = max(1, self.demand_rate)
+        self.min_update_interval = max(60, min(self.min_update_interval, self.update_interval))
+        if self.max_update_interval <= 0:
+            self.max_update_interval = 4 * self.update_interval
+        self.max_update_interval = max(self.update_interval, self.max_update_interval)
+        if self.log_format not in ("text", "json"):
+            self.log_format = "text"
+
+        # Validate server limits
+        self.server_threads = max(1, self.server_threads)
+        self.server_connection_limit = max(1, self.server_connection_limit)
+
+        # Validate batch sizes
+        self.batch_size = max(1, self.batch_size)
+        self.max_batch_size = max(self.batch_size, self.max_batch_size)
+
+    def diff(self, other):
+        """Return the names of settings that differ from another Config"""
+        return {name for name, value in vars(self).items() if getattr(other, name, None) != value}
@@ -2,21 +2,202 @@
 Main converter module that orchestrates the conversion process
 """
 
+import logging
+import math
 import os
 import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
+import requests
+from .batch_tuner import AdaptiveBatchSizer
+from .channel_cache import ChannelCache
+from .circuit_breaker import CLOSED, CircuitBreaker, CircuitOpenError
+from .history import GuideArchive, HistoryError
+from .merged_guide import MergedGuide
+from .profiling import Profiler, parse_captures
+from .request_budget import BudgetExceeded, RequestBudget
+from .scheduler import Deadline, DeadlineExceeded
+from .shards import day_dates, write_shards
+from .snapshot import SnapshotError, load_snapshot, snapshot_path, write_snapshot
 from .tvtv_client import TVTVClient
 from .mock_client import MockTVTVClient
 from .xmltv_generator import XMLTVGenerator
 
+logger = logging.getLogger(__name__)
+
+# Settings baked into the XMLTVGenerator: changing them replaces it and
+# re-renders the fetched data
+RENDER_SETTINGS = frozenset(
+    [
+        "timezone",
+        "stream_base_url",
+        "render_workers",
+        "render_parallel_threshold",
+        "logo_proxy",
+        "external_url",
+    ]
+)
+
 
 class TVTVConverter:
     """Main converter class that coordinates fetching and conversion"""
 
+    LINEUP_DELAY = 3  # Seconds between lineups to avoid rate limiting
+    QUEUE_POLL_INTERVAL = 1.0  # Seconds between checks of distributed fetch progress
+
     def __init__(self, config):
         self.config = config
+        # Opt-in refresh profiling, shared by the clients and the generator
+        self.profiler = Profiler(parse_captures(config.profile), config.profile_dir)
         # Don't create a single client here: each lineup has its own client
-        self.generator = XMLTVGenerator(config.timezone, config.stream_base_url)
+        self.generator = self._create_generator()
+        # Learned grid batch sizes survive across refreshes (and restarts when
+        # a cache directory is configured)
+        self.batch_sizers = {}
+        # Channel lineups are cached with their own, much longer TTL and shared
+        # by every refresh that references the same lineup
+        channel_dir = os.path.join(config.cache_dir, "channels") if config.cache_dir else None
+        self.channel_cache = ChannelCache(channel_dir, ttl=config.channel_cache_ttl)
+        # Most recently fetched data per lineup (see `fetch_lineup`)
+        self.guide_data = {}
+        # Union of all lineups, updated as each lineup is fetched
+        self.merged_guide = MergedGuide() if config.merged_output else None
+        self.merged_file = None
+        # Stops requests to tvtv.us during outages, shared by all lineups
+        self.breaker = CircuitBreaker(
+            config.breaker_threshold,
+            config.breaker_reset_timeout,
+            max_reset_timeout=max(config.breaker_reset_timeout, config.update_interval),
+        )
+        # Lineups currently served from previously fetched data, with the reason
+        self.stale = {}
+        # Upstream requests allowed per hour/day, shared by all lineups
+        self.budget = RequestBudget(
+            config.request_budget_hour,
+            config.request_budget_day,
+            os.path.join(config.cache_dir, "request_budget.json") if config.cache_dir else None,
+        )
+        # Deadline of the refresh in progress (see `_refresh_deadline`)
+        self.deadline = None
+        # Lineup x day grid fetches are handed to worker processes through this
+        # queue when one is configured (see `_fetch_distributed`)
+        self.work_queue = None
+        if config.work_queue:
+            # Imported here: single-process runs don't need sqlite3
+            from .work_queue import WorkQueue  # pylint: disable=import-outside-toplevel
+
+            self.work_queue = WorkQueue(config.work_queue, lease=config.work_queue_lease)
+        # Every published guide is archived as changes when a history
+        # directory is configured (see `history.GuideArchive`)
+        self.history = None
+        if config.history_dir:
+            self.history = GuideArchive(config.history_dir, retention_days=config.history_days)
+
+    def _create_generator(self):
+        """Create the XMLTV generator for the current rendering settings"""
+        return XMLTVGenerator(
+            self.config.timezone,
+            self.config.stream_base_url,
+            render_workers=self.config.render_workers,
+            parallel_threshold=self.config.render_parallel_threshold,
+            profiler=self.profiler,
+            logo_base_url=logo_base_url(self.config),
+        )
+
+    def apply_config(self, changes):
+        """
+        Apply changed settings to the running components.
+
+        `config` must already hold the new values; fetched data is kept.
+
+        Args:
+            changes: Names of the changed settings (see `Config.diff`)
+        """
+        config = self.config
+        if changes & RENDER_SETTINGS:
+            self.generator.close()
+            self.generator = self._create_generator()
+        self.profiler.captures = parse_captures(config.profile)
+        self.profiler.output_dir = config.profile_dir
+        self.channel_cache.ttl = config.channel_cache_ttl
+        self.breaker.failure_threshold = config.breaker_threshold
+        self.breaker.reset_timeout = config.breaker_reset_timeout
+        self.breaker.max_reset_timeout = max(config.breaker_reset_timeout, config.update_interval)
+        self.budget.per_hour = config.request_budget_hour
+        self.budget.per_day = config.request_budget_day
+        if self.history is not None:
+            self.history.retention = config.history_days * 86400
+        for sizer in self.batch_sizers.values():
+            sizer.maximum = max(sizer.minimum, config.max_batch_size)
+            sizer.batch_size = sizer._clamp(sizer.batch_size)  # pylint: disable=protected-access
+
+        if config.merged_output and self.merged_guide is None:
+            self.merged_guide = MergedGuide()
+            for lineup_id, guide in self.guide_data.items():
+                self.merged_guide.update(lineup_id, guide["lineup_data"], guide["listings_by_day"])
+        elif not config.merged_output:
+            self.merged_guide = None
+            self.merged_file = None
+
+    def remove_lineup(self, lineup_id):
+        """Forget a lineup that is no longer configured"""
+        self.guide_data.pop(lineup_id, None)
+        self.stale.pop(lineup_id, None)
+        self.batch_sizers.pop(lineup_id, None)
+        if self.merged_guide is not None:
+            self.merged_guide.remove(lineup_id)
+
+    def _batch_state_path(self):
+        """Path of the persisted batch size state, or None when not persisted"""
+        if not self.config.cache_dir:
+            return None
+        return os.path.join(self.config.cache_dir, "batch_sizes.json")
+
+    def _get_batch_sizer(self, lineup_id):
+        """Return the adaptive batch sizer for a lineup, loading persisted state once"""
+        if lineup_id not in self.batch_sizers:
+            self.batch_sizers[lineup_id] = AdaptiveBatchSizer.load(
+                self._batch_state_path(),
+                lineup_id,
+                initial=self.config.batch_size,
+                maximum=self.config.max_batch_size,
+            )
+        return self.batch_sizers[lineup_id]
+
+    def create_client(self, lineup_id):
+        """
+        Create the API client for a lineup (mock client in mock mode).
+
+        During a refresh the client stops at the refresh deadline, or earlier
+        at `lineup_deadline` seconds from now.
+        """
+        deadline = None
+        if self.deadline is not None:
+            deadline = self.deadline.child(self.config.lineup_deadline or None, "lineup")
+        if self.config.mock_mode:
+            logger.info("[MOCK MODE] Using mock data", extra={"lineup": lineup_id})
+            return MockTVTVClient(lineup_id, deadline=deadline)
+        return TVTVClient(
+            lineup_id,
+            batch_sizer=self._get_batch_sizer(lineup_id),
+            budget=self.budget if self.budget.enabled else None,
+            profiler=self.profiler,
+            breaker=self.breaker,
+            deadline=deadline,
+        )
+
+    @contextmanager
+    def _refresh_deadline(self):
+        """Limit the fetches made inside the block to `refresh_deadline` seconds"""
+        self.deadline = Deadline(self.config.refresh_deadline, "refresh")
+        try:
+            yield self.deadline
+        finally:
+            self.deadline = None
+
+    def _pause(self, seconds):
+        """Sleep, but not past the refresh deadline"""
+        time.sleep(seconds if self.deadline is None else self.deadline.cap(seconds))
 
     def convert_lineup(self, lineup_id):
         """
@@ -28,16 +209,118 @@ class TVTVConverter:
         Returns:
             String containing XMLTV formatted data for this lineup
         """
-        # pylint: disable=too-many-locals
-        # Use mock client if mock mode is enabled
-        if self.config.mock_mode:
-            print(f"[MOCK MODE] Using mock data for {lineup_id}")
-            client = MockTVTVClient(lineup_id)
-        else:
-            client = TVTVClient(lineup_id)
+        with self.profiler.span("convert_lineup", lineup=lineup_id):
+            self.fetch_lineup(lineup_id)
+            return self.render_lineup(lineup_id)
+
+    def fetch_lineup(self, lineup_id):
+        """
+        Fetch channel and grid data for a single lineup.
+
+        The normalised data is kept in `guide_data` so it can be re-rendered and
+        indexed without touching the network again. When the upstream fails, the
+        circuit breaker is open, the request budget is exhausted or the
+        deadline passes before any day was fetched, the previously fetched data
+        (if any) is kept instead and the lineup is listed in `stale`. When the
+        deadline passes part way, the days fetched so far are published with
+        the rest taken from the previous data.
 
-        # Get channel lineup
-        lineup_data = client.get_lineup_channels()
+        Args:
+            lineup_id: The lineup ID to fetch
+
+        Returns:
+            Dictionary with `lineup_data`, `listings_by_day`, `channel_key` and
+            `fetched_at` entries
+        """
+        client = self.create_client(lineup_id)
+        started = time.monotonic()
+        try:
+            with self.profiler.span("fetch", lineup=lineup_id):
+                if self.breaker.state != CLOSED and not self.config.mock_mode:
+                    # Test a recovering upstream with one small request first
+                    client.probe()
+                guide, missing = self._fetch_with_client(client, lineup_id)
+        except (
+            BudgetExceeded,
+            CircuitOpenError,
+            DeadlineExceeded,
+            requests.RequestException,
+        ) as e:
+            return self._keep_stale(lineup_id, e)
+        finally:
+            self._save_client_state(lineup_id)
+
+        return self._store_partial(lineup_id, guide, missing, started)
+
+    def _keep_stale(self, lineup_id, error):
+        """Keep serving a lineup's previous data after a failed fetch (re-raises without it)"""
+        if lineup_id not in self.guide_data:
+            raise error
+        logger.warning("%s; keeping stale data", error, extra={"lineup": lineup_id})
+        self.stale[lineup_id] = str(error)
+        return self.guide_data[lineup_id]
+
+    def _save_client_state(self, lineup_id):
+        """Persist the learned batch size and the request budget after a fetch"""
+        if lineup_id in self.batch_sizers:
+            self.batch_sizers[lineup_id].save(self._batch_state_path(), lineup_id)
+        if self.budget.enabled:
+            self.budget.save()
+
+    def _store_guide(self, lineup_id, guide, started):
+        """Make freshly fetched data the lineup's current data"""
+        logger.info(
+            "Fetched lineup",
+            extra={
+                "lineup": lineup_id,
+                "channels": len(guide["lineup_data"]),
+                "days": len(guide["listings_by_day"]),
+                "seconds": time.monotonic() - started,
+            },
+        )
+        self.guide_data[lineup_id] = guide
+        self.stale.pop(lineup_id, None)
+        if self.merged_guide is not None:
+            self.merged_guide.update(lineup_id, guide["lineup_data"], guide["listings_by_day"])
+        return guide
+
+    def _store_partial(self, lineup_id, guide, missing, started):
+        """
+        Store a guide that lacks its last `missing` days (the deadline passed).
+
+        The missing days are taken from the previous data where it covers them
+        with the same channels; the lineup is listed in `stale` meanwhile.
+        """
+        if not missing:
+            return self._store_guide(lineup_id, guide, started)
+        fetched = len(guide["listings_by_day"])
+        previous = self.guide_data.get(lineup_id)
+        if previous is not None and previous["channel_key"] == guide["channel_key"]:
+            previous_days = dict(
+                zip(
+                    day_dates(previous["fetched_at"], len(previous["listings_by_day"])),
+                    previous["listings_by_day"],
+                )
+            )
+            for date in day_dates(guide["fetched_at"], fetched + missing)[fetched:]:
+                if date not in previous_days:
+                    break
+                guide["listings_by_day"].append(previous_days[date])
+        self._store_guide(lineup_id, guide, started)
+        self.stale[lineup_id] = (
+            f"Deadline reached after {fetched} of {fetched + missing} days; "
+            "later days are from the previous data"
+        )
+        return guide
+
+    def _fetch_channels(self, client, lineup_id):
+        """
+        Fetch a lineup's channels (from the channel cache while it is fresh).
+
+        Returns:
+            Tuple of (channel list, channel digest, station ids)
+        """
+        lineup_data, channel_key = self.channel_cache.get(lineup_id, client.get_lineup_channels)
         if not lineup_data:
             raise ValueError(f"Failed to fetch lineup data for {lineup_id}")
 
@@ -49,28 +332,106 @@ class TVTVConverter:
 
         if not all_channels:
             raise ValueError("No valid stationId values found in lineup data")
+        return lineup_data, channel_key, all_channels
+
+    def _fetch_with_client(self, client, lineup_id):
+        """
+        Fetch a lineup's channels and grid data using the given client.
+
+        Returns:
+            Tuple of (guide, number of days not fetched before the deadline)
 
-        # Fetch grid data for each day
+        Raises:
+            DeadlineExceeded: If the deadline passed before the first day was fetched
+        """
+        lineup_data, channel_key, all_channels = self._fetch_channels(client, lineup_id)
+
+        # Fetch grid data for each day (fewer when the budget cannot cover them all)
         listings_by_day = []
-        for day in range(self.config.days):
-            now = datetime.now(timezone.utc)
-            start = now + timedelta(days=day)
-            end = now + timedelta(days=day + 1)
+        days = self._affordable_days(lineup_id, len(all_channels))
+        missing = 0
+        for day, (start_time, end_time) in enumerate(day_windows(days)):
+            day_started = time.monotonic()
+            try:
+                day_listings = client.get_grid_data(start_time, end_time, all_channels)
+            except DeadlineExceeded as e:
+                if not listings_by_day:
+                    raise
+                missing = days - day
+                logger.warning(
+                    "%s; publishing the days fetched so far",
+                    e,
+                    extra={"lineup": lineup_id, "days": day, "missing_days": missing},
+                )
+                break
+            logger.debug(
+                "Fetched grid day",
+                extra={
+                    "lineup": lineup_id,
+                    "day": day,
+                    "stations": len(all_channels),
+                    "latency": time.monotonic() - day_started,
+                },
+            )
+            # An empty day keeps its place: positions map to dates (see day_dates)
+            listings_by_day.append(day_listings or [])
+
+        guide = {
+            "lineup_data": lineup_data,
+            "listings_by_day": listings_by_day,
+            "channel_key": channel_key,
+            "fetched_at": datetime.now(timezone.utc),
+        }
+        return guide, missing
+
+    def _affordable_days(self, lineup_id, station_count):
+        """
+        Return how many days of grid data the request budget allows for a lineup.
 
-            # Format times for API
-            start_time = start.strftime("%Y-%m-%dT04:00:00.000Z")
-            end_time = end.strftime("%Y-%m-%dT03:59:00.000Z")
+        Raises:
+            BudgetExceeded: If not even one day can be fetched
+        """
+        remaining = self.budget.remaining() if self.budget.enabled else None
+        if remaining is None or self.config.mock_mode:
+            return self.config.days
+
+        per_day = math.ceil(station_count / self._get_batch_sizer(lineup_id).batch_size)
+        days = min(self.config.days, remaining // per_day)
+        if days < 1:
+            raise BudgetExceeded(
+                f"Request budget has {remaining} requests left; {lineup_id} needs {per_day}"
+            )
+        if days < self.config.days:
+            logger.warning(
+                "Request budget is low; fetching fewer days",
+                extra={
+                    "lineup": lineup_id,
+                    "remaining": remaining,
+                    "days": days,
+                    "configured_days": self.config.days,
+                },
+            )
+        return days
+
+    def render_lineup(self, lineup_id):
+        """
+        Render previously fetched data for a lineup to XMLTV format.
 
-            # Fetch grid data
-            day_listings = client.get_grid_data(start_time, end_time, all_channels)
-            if day_listings:
-                listings_by_day.append(day_listings)
+        Args:
+            lineup_id: The lineup ID to render
 
-        # Generate XMLTV
+        Returns:
+            String containing XMLTV formatted data for this lineup
+        """
+        guide = self.guide_data[lineup_id]
         source_url = f"{self.config.external_url}/{lineup_id}.xml"
-        xmltv_data = self.generator.generate(lineup_data, listings_by_day, source_url)
-
-        return xmltv_data
+        with self.profiler.span("render", lineup=lineup_id):
+            return self.generator.generate(
+                guide["lineup_data"],
+                guide["listings_by_day"],
+                source_url,
+                channel_key=guide["channel_key"],
+            )
 
     def convert(self):
         """
@@ -79,60 +440,337 @@ class TVTVConverter:
         Returns:
             Dictionary mapping lineup_id to XMLTV formatted data string
         """
+        if self.work_queue is not None:
+            return {
+                lineup_id: self.render_lineup(lineup_id) for lineup_id in self._fetch_distributed()
+            }
+
         results = {}
         for i, lineup_id in enumerate(self.config.lineups):
-            # Add delay between lineups to avoid rate limiting (except for first)
-            if i > 0:
-                delay = 3  # 3 seconds between lineups
-                print(f"Waiting {delay}s before fetching next lineup...")
-                time.sleep(delay)
+            # Add delay between lineups to avoid rate limiting (except for first, and
+            # while the circuit breaker is refusing requests anyway)
+            if i > 0 and self.breaker.state == CLOSED:
+                logger.info(
+                    "Waiting before fetching next lineup",
+                    extra={"lineup": lineup_id, "wait": self.LINEUP_DELAY},
+                )
+                self._pause(self.LINEUP_DELAY)
 
             results[lineup_id] = self.convert_lineup(lineup_id)
         return results
 
-    def save_to_file(self, filename=None):
+    def _fetch_distributed(self):
         """
-        Convert and save XMLTV data to file(s).
+        Fetch all lineups through the work queue.
 
-        For single lineup: saves to filename or config.output_file
-        For multiple lineups: saves to {lineup_id}.xml for each lineup in current directory
+        The coordinator fetches each lineup's channels and queues one job per
+        lineup and day; worker processes (and, with `work_queue_local`, this
+        process while it waits) fetch the grid data. Lineups whose jobs failed
+        keep their stale data like in `fetch_lineup`.
+
+        Yields:
+            Each lineup id as soon as its data is complete
+        """
+        work_queue = self.work_queue
+        batch = work_queue.start_batch()
+        try:
+            yield from self._coordinate(batch)
+        finally:
+            for lineup_id in self.config.lineups:
+                self._save_client_state(lineup_id)
+            work_queue.finish_batch(batch)
+
+    def _coordinate(self, batch):
+        """Queue and collect the jobs of a batch (see `_fetch_distributed`)"""
+        # pylint: disable=import-outside-toplevel,too-many-locals
+        from .work_queue import DONE, FAILED, QueueWorker, worker_identity
+
+        work_queue = self.work_queue
+        started = time.monotonic()
+        pending = {}  # lineup_id -> (channel list, channel digest)
+        for lineup_id in self.config.lineups:
+            try:
+                client = self.create_client(lineup_id)
+                lineup_data, channel_key, stations = self._fetch_channels(client, lineup_id)
+                days = self._affordable_days(lineup_id, len(stations))
+            except (
+                BudgetExceeded,
+                CircuitOpenError,
+                DeadlineExceeded,
+                requests.RequestException,
+            ) as e:
+                self._keep_stale(lineup_id, e)
+                yield lineup_id
+                continue
+            for day, (start_time, end_time) in enumerate(day_windows(days)):
+                work_queue.enqueue(batch, lineup_id, day, start_time, end_time, stations)
+            pending[lineup_id] = (lineup_data, channel_key)
+
+        worker = None
+        if self.config.work_queue_local:
+            worker = QueueWorker(work_queue, self.create_client, worker_identity("coordinator"))
+        while pending:
+            # Past the deadline, lineups are published with the days done so far
+            expired = self.deadline is not None and self.deadline.expired
+            progress = work_queue.progress(batch)
+            for lineup_id in list(pending):
+                counts = progress.get(lineup_id, {})
+                if not expired and counts.get(DONE, 0) + counts.get(FAILED, 0) < sum(
+                    counts.values()
+                ):
+                    continue
+                lineup_data, channel_key = pending.pop(lineup_id)
+                results = work_queue.results(batch, lineup_id)
+                finished = []
+                for _, listings, _ in results:
+                    if listings is None:
+                        break
+                    finished.append(listings)
+                if len(finished) < len(results) and not (expired and finished):
+                    errors = [error for _, listings, error in results if listings is None]
+                    self._keep_stale(
+                        lineup_id,
+                        (
+                            self.deadline.error()
+                            if expired
+                            else RuntimeError(f"Fetch jobs failed: {errors[0]}")
+                        ),
+                    )
+                    yield lineup_id
+                    continue
+                guide = {
+                    "lineup_data": lineup_data,
+                    # An empty day keeps its place: positions map to dates (see day_dates)
+                    "listings_by_day": [listings or [] for listings in finished],
+                    "channel_key": channel_key,
+                    "fetched_at": datetime.now(timezone.utc),
+                }
+                self._store_partial(lineup_id, guide, len(results) - len(finished), started)
+                yield lineup_id
+            if not pending:
+                break
+            if expired or not (worker is not None and worker.run_once()):
+                self._pause(self.QUEUE_POLL_INTERVAL)
+
+    def load_snapshots(self, filename=None):
+        """
+        Load guide data from the snapshots saved alongside the XMLTV files.
+
+        Lineups without a valid snapshot are skipped. Loaded lineups can be
+        rendered with `render_lineup` without touching the network.
 
         Args:
             filename: Output filename (only used for single lineup mode)
 
         Returns:
-            List of absolute paths to saved files
+            Dictionary mapping lineup_id to the XMLTV file path of each loaded lineup
         """
-        xmltv_data_dict = self.convert()
+        loaded = {}
+        for lineup_id in self.config.lineups:
+            xml_path = self.output_path(lineup_id, filename)
+            if not os.path.exists(xml_path):
+                continue
+            try:
+                guide = load_snapshot(snapshot_path(xml_path))
+            except SnapshotError:
+                continue
+            if guide.pop("lineup_id") != lineup_id:
+                continue
+            self.guide_data[lineup_id] = guide
+            if self.merged_guide is not None:
+                self.merged_guide.update(lineup_id, guide["lineup_data"], guide["listings_by_day"])
+            loaded[lineup_id] = xml_path
+        return loaded
+
+    def render_merged(self):
+        """
+        Render the merged guide of all fetched lineups to XMLTV format.
 
-        saved_files = []
+        Returns:
+            String containing XMLTV formatted data for all lineups
+        """
+        lineup_data, listings_by_day = self.merged_guide.build()
+        return self.generator.generate(
+            lineup_data, listings_by_day, f"{self.config.external_url}/all.xml"
+        )
 
+    def merged_output_path(self, filename=None):
+        """Return the absolute path of the merged guide (next to the lineup files)"""
+        directory = os.path.dirname(self.output_path(self.config.lineups[0], filename))
+        return os.path.join(directory, "all.xml")
+
+    def output_path(self, lineup_id, filename=None):
+        """
+        Return the absolute path a lineup's XMLTV file is saved to.
+
+        With a shared directory (multi-replica mode) every lineup is saved there as
+        {lineup_id}.xml. Otherwise a single lineup uses filename or
+        config.output_file and multiple lineups use {lineup_id}.xml in the current
+        directory.
+        """
+        if self.config.shared_dir:
+            return os.path.abspath(os.path.join(self.config.shared_dir, f"{lineup_id}.xml"))
         if len(self.config.lineups) == 1:
-            # Single lineup: save to specified filename or default
-            if filename is None:
-                filename = self.config.output_file
+            return os.path.abspath(filename or self.config.output_file)
+        return os.path.abspath(f"{lineup_id}.xml")
 
-            lineup_id = self.config.lineups[0]
-            xmltv_data = xmltv_data_dict[lineup_id]
+    def shard_dir(self, lineup_id, filename=None):
+        """Return the directory of a lineup's per-day shards (next to its XMLTV file)"""
+        directory = os.path.dirname(self.output_path(lineup_id, filename))
+        return os.path.join(directory, "shards", lineup_id)
 
-            # Use absolute path
-            abs_filename = os.path.abspath(filename)
+    def save_to_file(self, filename=None):
+        """
+        Convert and save XMLTV data to file(s).
 
-            with open(abs_filename, "w", encoding="utf-8") as f:
-                f.write(xmltv_data)
+        For single lineup: saves to filename or config.output_file
+        For multiple lineups: saves to {lineup_id}.xml for each lineup in current directory
 
-            saved_files.append(abs_filename)
-        else:
-            # Multiple lineups: save each to {lineup_id}.xml in current directory
-            for lineup_id, xmltv_data in xmltv_data_dict.items():
-                output_filename = f"{lineup_id}.xml"
+        Files are replaced atomically so readers never see a partially written guide.
+        Each call is one profiling session (see `profiler`).
 
-                # Use absolute path
-                abs_filename = os.path.abspath(output_filename)
+        Args:
+            filename: Output filename (only used for single lineup mode)
 
-                with open(abs_filename, "w", encoding="utf-8") as f:
-                    f.write(xmltv_data)
+        Returns:
+            List of absolute paths to saved files
+        """
+        with self.profiler.session("refresh"), self._refresh_deadline():
+            return self._save_to_file(filename)
+
+    def _save_to_file(self, filename):
+        """Convert all lineups and write the files (see `save_to_file`)"""
+        if self.work_queue is not None:
+            # Write each lineup as soon as its jobs are complete
+            saved = {}
+            for lineup_id in self._fetch_distributed():
+                saved[lineup_id] = self._write_lineup(
+                    lineup_id, self.render_lineup(lineup_id), filename
+                )
+            self._write_merged(filename)
+            return [saved[lineup_id] for lineup_id in self.config.lineups]
 
-                saved_files.append(abs_filename)
+        xmltv_data_dict = self.convert()
 
+        saved_files = []
+        for lineup_id, xmltv_data in xmltv_data_dict.items():
+            saved_files.append(self._write_lineup(lineup_id, xmltv_data, filename))
+        self._write_merged(filename)
         return saved_files
+
+    def save_lineups(self, render_ids=(), fetch_ids=(), filename=None):
+        """
+        Save selected lineups only (used when the configuration is reloaded).
+
+        Args:
+            render_ids: Lineups to re-render from their fetched data
+            fetch_ids: Lineups to fetch and render
+            filename: Output filename (only used for single lineup mode)
+
+        Returns:
+            Dictionary mapping lineup_id to the saved file path
+        """
+        saved = {}
+        with self.profiler.session("reload"), self._refresh_deadline():
+            for i, lineup_id in enumerate(fetch_ids):
+                if i > 0 and self.breaker.state == CLOSED:
+                    self._pause(self.LINEUP_DELAY)
+                self.fetch_lineup(lineup_id)
+            for lineup_id in list(render_ids) + list(fetch_ids):
+                saved[lineup_id] = self._write_lineup(
+                    lineup_id, self.render_lineup(lineup_id), filename
+                )
+            self._write_merged(filename)
+        return saved
+
+    def _write_lineup(self, lineup_id, xmltv_data, filename):
+        """Write a lineup's XMLTV file (and snapshot); returns its path"""
+        abs_filename = self.output_path(lineup_id, filename)
+        with self.profiler.span("write", path=abs_filename, bytes=len(xmltv_data)):
+            write_atomic(abs_filename, xmltv_data)
+        # Replicas load the fetched data from snapshots, so always write them
+        # in multi-replica mode
+        if self.config.snapshots or self.config.shared_dir:
+            with self.profiler.span("write_snapshot", lineup=lineup_id):
+                write_snapshot(snapshot_path(abs_filename), lineup_id, self.guide_data[lineup_id])
+        if self.config.shards:
+            self._write_shards(lineup_id, filename)
+        if self.history is not None:
+            self._archive(lineup_id)
+        return abs_filename
+
+    def _archive(self, lineup_id):
+        """Add a published lineup to the history archive (failures are only logged)"""
+        try:
+            with self.profiler.span("write_history", lineup=lineup_id):
+                self.history.append(
+                    lineup_id, self.guide_data[lineup_id], datetime.now(timezone.utc)
+                )
+        except (HistoryError, OSError) as e:
+            logger.warning("Could not archive guide: %s", e, extra={"lineup": lineup_id})
+
+    def _write_shards(self, lineup_id, filename):
+        """Render a lineup's days as separate documents and write them as shards"""
+        guide = self.guide_data[lineup_id]
+        listings_by_day = guide["listings_by_day"]
+        source_url = f"{self.config.external_url}/{lineup_id}.xml"
+        with self.profiler.span("render_shards", lineup=lineup_id, days=len(listings_by_day)):
+            # Each shard is a complete document dated by its own day, so its
+            # content (and name) only changes when that day's listings do
+            documents = [
+                (
+                    date,
+                    self.generator.generate(
+                        guide["lineup_data"],
+                        [day_listings],
+                        source_url,
+                        channel_key=guide["channel_key"],
+                        date=date,
+                    ),
+                )
+                for date, day_listings in zip(
+                    day_dates(guide["fetched_at"], len(listings_by_day)), listings_by_day
+                )
+            ]
+        with self.profiler.span("write_shards", lineup=lineup_id):
+            return write_shards(
+                self.shard_dir(lineup_id, filename), lineup_id, documents, guide["fetched_at"]
+            )
+
+    def _write_merged(self, filename):
+        """Write the merged guide when merged output is enabled"""
+        if self.merged_guide is None:
+            return
+        self.merged_file = self.merged_output_path(filename)
+        with self.profiler.span("render_merged"):
+            merged = self.render_merged()
+        with self.profiler.span("write", path=self.merged_file, bytes=len(merged)):
+            write_atomic(self.merged_file, merged)
+
+
+def day_windows(days):
+    """Grid request (start, end) times of the next `days` days"""
+    now = datetime.now(timezone.utc)
+    return [
+        (
+            (now + timedelta(days=day)).strftime("%Y-%m-%dT04:00:00.000Z"),
+            (now + timedelta(days=day + 1)).strftime("%Y-%m-%dT03:59:00.000Z"),
+        )
+        for day in range(days)
+    ]
+
+
+def logo_base_url(config):
+    """Base URL of the local logo proxy, or None when logos link upstream"""
+    return f"{config.external_url}/logos" if config.logo_proxy else None
+
+
+def write_atomic(path, data):
+    """Write text to path via a temporary file and atomic rename"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
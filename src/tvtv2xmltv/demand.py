@@ -0,0 +1,57 @@
+"""
+Per-lineup request rates, and the refresh intervals they call for
+"""
+
+import math
+import threading
+import time
+
+# Requests older than this (seconds) count for 1/e of a recent one
+DEMAND_WINDOW = 3600
+
+
+def refresh_interval(rate, base, minimum, maximum, reference):
+    """
+    Seconds between refreshes of a lineup requested `rate` times an hour.
+
+    A lineup requested `reference` times an hour refreshes every `base`
+    seconds; one requested twice as often, twice as often, down to `minimum`
+    seconds. A lineup nobody requests refreshes every `maximum` seconds.
+    """
+    if rate <= 0 or reference <= 0:
+        return maximum
+    return max(minimum, min(maximum, base * reference / rate))
+
+
+class DemandTracker:
+    """Exponentially decaying request counts per lineup
+
+    The decayed count approximates the requests of the last `window` seconds,
+    without keeping a timestamp per request.
+    """
+
+    def __init__(self, window=DEMAND_WINDOW, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._counts = {}  # lineup_id -> (decayed count, when it was computed)
+        self._lock = threading.Lock()
+
+    def _decayed(self, lineup_id, now):
+        count, at = self._counts.get(lineup_id, (0.0, now))
+        return count * math.exp(-(now - at) / self.window)
+
+    def record(self, lineup_id):
+        """Count a request for a lineup"""
+        with self._lock:
+            now = self.clock()
+            self._counts[lineup_id] = (self._decayed(lineup_id, now) + 1, now)
+
+    def rate(self, lineup_id):
+        """Recent requests per hour for a lineup"""
+        with self._lock:
+            return self._decayed(lineup_id, self.clock()) * 3600 / self.window
+
+    def forget(self, lineup_id):
+        """Drop a lineup that is no longer configured"""
+        with self._lock:
+            self._counts.pop(lineup_id, None)
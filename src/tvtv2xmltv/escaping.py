@@ -0,0 +1,42 @@
+"""
+XML escaping for the generator
+"""
+
+# Distinct strings remembered per memo before it is cleared
+MEMO_SIZE = 16384
+
+
+def escape_text(value):
+    """Escape &, < and > in element text (strings without them are returned as-is)"""
+    if "&" in value or "<" in value or ">" in value:
+        return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return value
+
+
+def escape_attr(value):
+    """Escape a value for a double-quoted attribute"""
+    if "&" in value or "<" in value or ">" in value or '"' in value:
+        return escape_text(value).replace('"', "&quot;")
+    return value
+
+
+def memoize(escape, max_entries=MEMO_SIZE):
+    """
+    Return `escape` with a bounded memo of its results.
+
+    Titles, call signs, channel numbers and durations repeat across channels
+    and days, so most calls are a single dict lookup. Values are converted with
+    str() before escaping, so numbers can be passed directly. The memo is
+    cleared when it reaches `max_entries`.
+    """
+    memo = {}
+
+    def cached(value):
+        escaped = memo.get(value)
+        if escaped is None:
+            if len(memo) >= max_entries:
+                memo.clear()
+            escaped = memo[value] = escape(str(value))
+        return escaped
+
+    return cached
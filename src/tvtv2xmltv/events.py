@@ -0,0 +1,281 @@
+"""
+Guide change notifications: versions, Server-Sent Events and webhooks
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import requests
+
+from .shards import day_dates
+
+logger = logging.getLogger(__name__)
+
+# Seconds between keep-alive comments on an idle event stream
+KEEPALIVE_INTERVAL = 15
+
+
+def _digest(value):
+    data = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def guide_version(guide, render_stamp=""):
+    """
+    Version of a lineup's published guide.
+
+    Args:
+        guide: The lineup's entry in `TVTVConverter.guide_data`
+        render_stamp: String identifying the rendering settings; documents
+            rendered with different settings get different versions
+
+    Returns:
+        Tuple of (version, {date: digest of that day's listings})
+    """
+    listings_by_day = guide["listings_by_day"]
+    dates = day_dates(guide["fetched_at"], len(listings_by_day))
+    days = {date: _digest(day) for date, day in zip(dates, listings_by_day)}
+    channels = guide.get("channel_key") or _digest(guide["lineup_data"])
+    return _digest([render_stamp, channels, sorted(days.items())]), days
+
+
+class GuideVersions:
+    """Track the published version of each lineup to describe what changed"""
+
+    def __init__(self):
+        self._published = {}  # lineup_id -> (version, render stamp, {date: digest})
+        self._lock = threading.Lock()
+
+    def update(self, lineup_id, guide, render_stamp=""):
+        """
+        Record a lineup's newly published guide.
+
+        Returns:
+            Event data describing the change, or None if the version is unchanged
+        """
+        version, days = guide_version(guide, render_stamp)
+        with self._lock:
+            previous = self._published.get(lineup_id)
+            if previous is not None and previous[0] == version:
+                return None
+            self._published[lineup_id] = (version, render_stamp, days)
+
+        if previous is None or previous[1] != render_stamp:
+            changed = list(days)
+        else:
+            changed = [date for date, digest in days.items() if previous[2].get(date) != digest]
+        return {
+            "lineup": lineup_id,
+            "version": version,
+            "previous_version": previous[0] if previous else None,
+            "fetched_at": guide["fetched_at"].isoformat(),
+            "days": len(days),
+            "changed_days": changed,
+        }
+
+    def version(self, lineup_id):
+        """Published version of a lineup, or None"""
+        with self._lock:
+            published = self._published.get(lineup_id)
+        return published[0] if published else None
+
+    def forget(self, lineup_id):
+        """Drop a lineup that is no longer published"""
+        with self._lock:
+            self._published.pop(lineup_id, None)
+
+
+class _Subscription:
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(queue_size)
+        self.closed = False
+
+
+class EventBroker:
+    """Fan out events to Server-Sent Events streams
+
+    Every stream gets its own bounded queue, so publishing never waits for a
+    slow client; a client that falls too far behind is disconnected and, when
+    it reconnects with `Last-Event-ID`, receives the events it missed from the
+    recent history. Each open stream holds a server thread, so at most
+    `max_clients` streams are accepted.
+    """
+
+    def __init__(self, max_clients=4, history=100, queue_size=100):
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self.last_id = 0
+        self._history = deque(maxlen=history)
+        self._subscriptions = set()
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, data):
+        """Send an event to every open stream; returns its id"""
+        with self._lock:
+            self.last_id += 1
+            event = (self.last_id, event_type, data)
+            self._history.append(event)
+            for subscription in list(self._subscriptions):
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    # Let the client reconnect and catch up from the history
+                    subscription.closed = True
+                    self._subscriptions.discard(subscription)
+            return self.last_id
+
+    def subscribe(self, last_event_id=None):
+        """
+        Open a stream, replaying the history after `last_event_id`.
+
+        Returns:
+            The subscription, or None if `max_clients` streams are open
+        """
+        subscription = _Subscription(self.queue_size)
+        with self._lock:
+            if self._closed or len(self._subscriptions) >= self.max_clients:
+                return None
+            if last_event_id is not None:
+                for event in self._history:
+                    if event[0] > last_event_id:
+                        subscription.queue.put_nowait(event)
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Close a stream"""
+        with self._lock:
+            subscription.closed = True
+            self._subscriptions.discard(subscription)
+
+    def stream(self, subscription, lineups=None, keepalive=KEEPALIVE_INTERVAL):
+        """
+        Yield a subscription's events as Server-Sent Events text.
+
+        Args:
+            subscription: Subscription from `subscribe`
+            lineups: Only send guide events of these lineups (default: all)
+            keepalive: Seconds between keep-alive comments while idle
+        """
+        try:
+            yield f"retry: {keepalive * 1000}\n\n"
+            while True:
+                try:
+                    event_id, event_type, data = subscription.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    if subscription.closed:
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                if event_id is None:
+                    return
+                if lineups and data.get("lineup") not in lineups:
+                    continue
+                yield f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def close(self):
+        """End all streams (at shutdown)"""
+        with self._lock:
+            self._closed = True
+            subscriptions = list(self._subscriptions)
+            self._subscriptions.clear()
+        for subscription in subscriptions:
+            subscription.closed = True
+            try:
+                subscription.queue.put_nowait((None, None, None))
+            except queue.Full:
+                pass
+
+    def status(self):
+        """Stream usage for reporting"""
+        with self._lock:
+            return {
+                "clients": len(self._subscriptions),
+                "max_clients": self.max_clients,
+                "last_event_id": self.last_id,
+            }
+
+
+class WebhookNotifier:
+    """POST events as JSON to webhook URLs from a background thread
+
+    Deliveries are retried with backoff and never delay a refresh. With a
+    `secret`, each request carries an `X-TVTV-Signature: sha256=<hmac>` header
+    of its body.
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, urls=(), secret=None, timeout=10, retries=3, session=None):
+        self.urls = list(urls)
+        self.secret = secret
+        self.timeout = timeout
+        self.retries = max(1, retries)
+        self.session = session or requests.Session()
+        self.delivered = 0
+        self.failed = 0
+        self._queue = queue.Queue(1000)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def notify(self, event_type, data):
+        """Queue an event for delivery to every URL"""
+        if not self.urls:
+            return
+        body = json.dumps({"event": event_type, "data": data}).encode("utf-8")
+        try:
+            self._queue.put_nowait(body)
+        except queue.Full:
+            logger.warning("Webhook queue full; dropping event", extra={"event": event_type})
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            body = self._queue.get()
+            if body is None:
+                return
+            for url in list(self.urls):
+                self._deliver(url, body)
+
+    def _deliver(self, url, body):
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            signature = hmac.new(self.secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+            headers["X-TVTV-Signature"] = f"sha256={signature}"
+        for attempt in range(self.retries):
+            try:
+                response = self.session.post(url, data=body, headers=headers, timeout=self.timeout)
+                response.raise_for_status()
+                self.delivered += 1
+                return
+            except requests.RequestException as e:
+                if attempt == self.retries - 1:
+                    self.failed += 1
+                    logger.warning("Webhook delivery failed: %s", e, extra={"url": url})
+                    return
+                time.sleep(2**attempt)
+
+    def close(self, timeout=5):
+        """Deliver queued events (waiting up to `timeout` seconds) and stop"""
+        with self._lock:
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            return
+        thread.join(timeout)
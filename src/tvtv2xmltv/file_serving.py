@@ -0,0 +1,151 @@
+"""
+Zero-copy serving of published guide files
+"""
+
+import mmap
+import os
+import threading
+from collections import namedtuple
+
+from flask import Response, request
+
+MappedGuide = namedtuple("MappedGuide", ["mapping", "size", "mtime", "etag"])
+
+
+class MappedFile:
+    """Seekable WSGI iterable over a shared memory map
+
+    Chunks are sliced straight from the page cache, so serving a guide needs no
+    read() calls and no per-request file buffers. Werkzeug seeks it directly to
+    answer Range requests.
+    """
+
+    CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, mapping, size, chunk_size=CHUNK_SIZE):
+        self.mapping = mapping
+        self.size = size
+        self.chunk_size = chunk_size
+        self.position = 0
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset):
+        self.position = max(0, min(offset, self.size))
+
+    def tell(self):
+        return self.position
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.position >= self.size:
+            raise StopIteration
+        end = min(self.position + self.chunk_size, self.size)
+        chunk = self.mapping[self.position : end]
+        self.position = end
+        return chunk
+
+    def close(self):
+        """Nothing to release: the mapping is shared and unmapped when unused"""
+
+
+class GuideFileCache:
+    """Shared read-only memory maps of published guide files
+
+    Published files are immutable: updates replace them with a new file via an
+    atomic rename. A mapping is therefore keyed by the file's inode, modification
+    time and size and remapped only when the file is replaced. Responses still
+    streaming an old mapping keep it alive until they finish.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, f, path):
+        """Return the MappedGuide for an open file, mapping it if it was replaced"""
+        stat = os.fstat(f.fileno())
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+
+            if stat.st_size:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                mapping = b""  # Empty files cannot be memory-mapped
+            guide = MappedGuide(
+                mapping,
+                stat.st_size,
+                stat.st_mtime,
+                f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}",
+            )
+            self._entries[path] = (key, guide)
+            return guide
+
+    def open(self, path):
+        """Return the current MappedGuide for path (raises OSError if missing)"""
+        with open(path, "rb") as f:
+            return self.get(f, path)
+
+
+def send_guide(file_cache, path, mimetype="application/xml; charset=utf-8", x_accel_prefix=None):
+    """
+    Build a response serving a published guide file.
+
+    The response supports conditional requests (ETag/Last-Modified) and byte
+    ranges, and is served from the file's shared memory map. With an
+    `x_accel_prefix`, the body is left to an nginx front end (X-Accel-Redirect
+    to {prefix}/{basename}), which streams it with the kernel's sendfile.
+
+    Args:
+        file_cache: GuideFileCache holding the shared mappings
+        path: Path of the file to serve
+        mimetype: Response content type
+        x_accel_prefix: Optional internal nginx location serving the same directory
+
+    Returns:
+        Flask Response
+    """
+    # pylint: disable=consider-using-with
+    f = open(path, "rb")  # Closed here or by the server's file wrapper
+    try:
+        guide = file_cache.get(f, path)
+    except OSError:
+        f.close()
+        raise
+    filename = os.path.basename(path)
+
+    if x_accel_prefix:
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = f"{x_accel_prefix.rstrip('/')}/{filename}"
+    else:
+        response = Response(
+            MappedFile(guide.mapping, guide.size), mimetype=mimetype, direct_passthrough=True
+        )
+        response.content_length = guide.size
+
+    response.headers["Content-Disposition"] = f'inline; filename="{filename}"'
+    response.last_modified = guide.mtime
+    response.set_etag(guide.etag)
+    response.cache_control.no_cache = True
+    if x_accel_prefix:
+        f.close()
+        return response.make_conditional(request.environ)
+
+    response = response.make_conditional(
+        request.environ, accept_ranges=True, complete_length=guide.size
+    )
+    # Whole-file responses go to the server's file wrapper when it has one, so
+    # servers that implement it with sendfile (e.g. gunicorn) copy in the kernel
+    # and waitress streams from the file instead of buffering the body.
+    file_wrapper = request.environ.get("wsgi.file_wrapper")
+    if file_wrapper is not None and response.status_code == 200:
+        response.response = file_wrapper(f, MappedFile.CHUNK_SIZE)
+    else:
+        f.close()
+    return response
@@ -0,0 +1,143 @@
+"""
+Incremental parsing of grid responses
+"""
+
+import codecs
+import json
+
+# Programme fields used by the generator, index, merged guide and snapshots
+PROGRAMME_FIELDS = (
+    "programId",
+    "title",
+    "subtitle",
+    "startTime",
+    "duration",
+    "runTime",
+    "type",
+    "flags",
+)
+_FIELD_SET = frozenset(PROGRAMME_FIELDS)
+# Values repeated across programmes, channels and days (kept as one shared string)
+_INTERNED_FIELDS = ("title", "subtitle", "startTime", "type")
+
+_WHITESPACE = " \t\n\r"
+
+
+class GridParser:
+    """Parse a grid response (a list of programme lists, one per station) as it streams
+
+    Text is fed in chunks; each station's programme list is decoded as soon as
+    it is complete, its programmes reduced to `PROGRAMME_FIELDS` with repeated
+    strings and flag lists shared, and the consumed text is dropped. Only the
+    slimmed programmes and the unparsed tail of the last chunk are held in
+    memory, rather than the raw body, its decoded text and a full tree of
+    decoded dictionaries.
+    """
+
+    def __init__(self, strings=None):
+        self.stations = []  # Parsed programme lists, one per station
+        self.done = False
+        self._buffer = ""
+        self._in_list = False  # Inside the outer list
+        self._decoder = json.JSONDecoder()
+        # Shared string and flag list tables; pass the same `strings` dict to
+        # parsers of one refresh to share values across responses
+        self._strings = {} if strings is None else strings
+        self._flags = {}
+
+    def feed(self, text, final=False):
+        """
+        Parse another chunk of the response text.
+
+        Args:
+            text: Next chunk of the decoded body
+            final: True when no more text follows
+
+        Raises:
+            ValueError: If the text is not a grid response, or is truncated
+        """
+        buffer = self._buffer + text if self._buffer else text
+        pos = self._parse(buffer, final)
+        self._buffer = buffer[pos:]
+        if final and not self.done:
+            raise ValueError("Truncated grid response")
+
+    def _parse(self, buffer, final):
+        """Consume complete values from buffer; returns the position reached"""
+        pos = 0
+        length = len(buffer)
+        while pos < length and not self.done:
+            char = buffer[pos]
+            if char in _WHITESPACE or (char == "," and self._in_list):
+                pos += 1
+            elif self._in_list:
+                if char == "]":
+                    self.done = True
+                    pos += 1
+                    continue
+                # Decode one station's programme list at a time
+                try:
+                    value, end = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    break  # Incomplete value: wait for the next chunk
+                if end == length and not final and not isinstance(value, (dict, list)):
+                    break  # A number or literal may continue in the next chunk
+                pos = end
+                if isinstance(value, list):
+                    self.stations.append([self.slim(p) for p in value if isinstance(p, dict)])
+                else:
+                    self.stations.append([])  # null instead of a station's listings
+            elif char == "[":
+                self._in_list = True
+                pos += 1
+            elif buffer.startswith("null", pos):
+                self.done = True  # No listings
+                pos += 4
+            elif length - pos < 4 and "null".startswith(buffer[pos:]) and not final:
+                break
+            else:
+                raise ValueError(f"Expected a grid list, got {buffer[pos:pos + 20]!r}")
+        return pos
+
+    def slim(self, program):
+        """Reduce a programme to the fields we use, sharing repeated values"""
+        if not program.keys() <= _FIELD_SET:
+            program = {key: program[key] for key in PROGRAMME_FIELDS if key in program}
+        strings = self._strings
+        for key in _INTERNED_FIELDS:
+            value = program.get(key)
+            if value.__class__ is str:
+                program[key] = strings.setdefault(value, value)
+        flags = program.get("flags")
+        if flags.__class__ is list:
+            key = tuple(flags)
+            shared = self._flags.get(key)
+            if shared is None:
+                shared = self._flags[key] = [strings.setdefault(f, f) for f in key]
+            program["flags"] = shared
+        return program
+
+
+def parse_grid(chunks, encoding="utf-8", strings=None):
+    """
+    Parse a grid response from an iterable of byte chunks.
+
+    Args:
+        chunks: Iterable of byte strings
+        encoding: Text encoding of the body
+        strings: Optional dict of shared strings (see `GridParser`)
+
+    Returns:
+        Tuple of (list of programme lists per station, number of bytes read)
+    """
+    parser = GridParser(strings)
+    decoder = codecs.getincrementaldecoder(encoding)()
+    size = 0
+    for chunk in chunks:
+        if chunk:
+            size += len(chunk)
+            parser.feed(decoder.decode(chunk))
+    parser.feed(decoder.decode(b"", final=True), final=True)
+    return parser.stations, size
@@ -0,0 +1,125 @@
+"""
+In-memory time-interval index over guide data
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+
+def parse_start_time(value):
+    """Parse a TVTV `startTime` value into a POSIX timestamp"""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class GuideIndex:
+    """Per-channel sorted interval index for "now/next" and windowed queries
+
+    Programmes are stored per channel (keyed by channel number, the XMLTV channel
+    id) in start order with parallel start/end arrays, so every lookup is a
+    binary search per channel.
+    """
+
+    def __init__(self, lineup_data, listings_by_day):
+        self.channels = [channel for channel in lineup_data if isinstance(channel, dict)]
+        self._channel_by_id = {}
+        self._starts = {}
+        self._ends = {}
+        self._programmes = {}
+
+        airings = {}
+        for day_listings in listings_by_day:
+            for channel_idx, channel in enumerate(lineup_data):
+                if channel_idx >= len(day_listings):
+                    break
+                channel_id = str(channel["channelNumber"])
+                by_start = airings.setdefault(channel_id, {})
+                for program in day_listings[channel_idx]:
+                    try:
+                        start = parse_start_time(program["startTime"])
+                        end = start + program["runTime"] * 60
+                    except (KeyError, TypeError, ValueError):
+                        continue
+                    # Day boundaries can repeat an airing; keep the first copy
+                    by_start.setdefault(start, (start, end, program))
+
+        for channel in self.channels:
+            channel_id = str(channel["channelNumber"])
+            self._channel_by_id.setdefault(channel_id, channel)
+            entries = sorted(airings.get(channel_id, {}).values(), key=lambda e: e[0])
+            self._starts[channel_id] = [entry[0] for entry in entries]
+            self._ends[channel_id] = [entry[1] for entry in entries]
+            self._programmes[channel_id] = [entry[2] for entry in entries]
+
+    def __len__(self):
+        return sum(len(programmes) for programmes in self._programmes.values())
+
+    def _channel_ids(self, channels=None):
+        if channels is None:
+            return list(self._channel_by_id)
+        return [str(channel) for channel in channels if str(channel) in self._channel_by_id]
+
+    def now(self, at, channels=None):
+        """
+        Return the programmes airing at a point in time.
+
+        Args:
+            at: POSIX timestamp
+            channels: Optional iterable of channel numbers to restrict the query
+
+        Returns:
+            List of (channel, programme, start, end) tuples
+        """
+        results = []
+        for channel_id in self._channel_ids(channels):
+            idx = bisect_right(self._starts[channel_id], at) - 1
+            if idx >= 0 and self._ends[channel_id][idx] > at:
+                results.append(self._entry(channel_id, idx))
+        return results
+
+    def next(self, at, channels=None):
+        """
+        Return the first programme starting after a point in time on each channel.
+
+        Args:
+            at: POSIX timestamp
+            channels: Optional iterable of channel numbers to restrict the query
+
+        Returns:
+            List of (channel, programme, start, end) tuples
+        """
+        results = []
+        for channel_id in self._channel_ids(channels):
+            idx = bisect_right(self._starts[channel_id], at)
+            if idx < len(self._starts[channel_id]):
+                results.append(self._entry(channel_id, idx))
+        return results
+
+    def window(self, start=None, end=None, channels=None):
+        """
+        Return guide data for programmes overlapping a time window.
+
+        Args:
+            start: POSIX timestamp of the window start (None for unbounded)
+            end: POSIX timestamp of the window end (None for unbounded)
+            channels: Optional iterable of channel numbers to restrict the query
+
+        Returns:
+            Tuple of (lineup_data, listings_by_day) suitable for XMLTVGenerator
+        """
+        lineup_data = []
+        day_listings = []
+        for channel_id in self._channel_ids(channels):
+            ends = self._ends[channel_id]
+            first = 0 if start is None else bisect_right(ends, start)
+            last = len(ends) if end is None else bisect_left(self._starts[channel_id], end)
+            lineup_data.append(self._channel_by_id[channel_id])
+            day_listings.append(self._programmes[channel_id][first:last])
+        return lineup_data, [day_listings]
+
+    def _entry(self, channel_id, idx):
+        return (
+            self._channel_by_id[channel_id],
+            self._programmes[channel_id][idx],
+            self._starts[channel_id][idx],
+            self._ends[channel_id][idx],
+        )
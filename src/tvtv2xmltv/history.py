@@ -0,0 +1,348 @@
+"""
+Guide history archive: every published guide, stored as changes
+
+Each lineup has an append-only file `{lineup_id}.hist` in the archive
+directory:
+
+    magic "TVTVHST1" | entries
+
+    entry: f64 published at (epoch seconds) | u8 kind | u32 length | zlib(JSON)
+
+The first entry is a full guide; every later entry only holds the programmes
+removed and added (or changed) since the previous one, and the channel list
+when it changed. Programmes are identified by their fetch day, station and
+start time, so a refresh that changes today's and tomorrow's listings stores
+just those programmes, and an identical refresh stores nothing. The entry
+headers form the index by time: opening an archive reads them without
+decompressing the payloads.
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+from .shards import day_dates
+
+MAGIC = b"TVTVHST1"
+FULL = 0
+DELTA = 1
+
+_ENTRY = struct.Struct("<dBI")
+
+
+class HistoryError(ValueError):
+    """Raised when an archive is missing or corrupt"""
+
+
+def _programmes(guide):
+    """Programmes of a guide keyed by (fetch day, station id, start time)"""
+    listings_by_day = guide["listings_by_day"]
+    stations = [
+        channel.get("stationId") if isinstance(channel, dict) else None
+        for channel in guide["lineup_data"]
+    ]
+    programmes = {}
+    for date, day_listings in zip(
+        day_dates(guide["fetched_at"], len(listings_by_day)), listings_by_day
+    ):
+        for station, programs in zip(stations, day_listings):
+            if station is None:
+                continue
+            for program in programs:
+                key = (date, str(station), program.get("startTime", ""))
+                programmes[key] = json.dumps(program, sort_keys=True, separators=(",", ":"))
+    return programmes
+
+
+class _State:
+    """A lineup's guide as of one archive entry"""
+
+    def __init__(self):
+        self.fetched_at = None
+        self.days = 0
+        self.channels = []
+        self.channel_key = None
+        self.programmes = {}
+
+    def apply(self, kind, payload):
+        if kind == FULL:
+            self.programmes = {}
+        if "channels" in payload:
+            self.channels = payload["channels"]
+            self.channel_key = payload.get("channel_key")
+        self.fetched_at = datetime.fromisoformat(payload["fetched_at"])
+        self.days = payload["days"]
+        for key in payload.get("removed", []):
+            self.programmes.pop(tuple(key), None)
+        for date, station, start, program in payload.get("added", []):
+            self.programmes[(date, station, start)] = program
+
+    def guide(self):
+        """The guide in the converter's `guide_data` layout"""
+        by_day = {}
+        for (date, station, start), program in self.programmes.items():
+            by_day.setdefault(date, {}).setdefault(station, []).append((start, program))
+        listings_by_day = []
+        for date in day_dates(self.fetched_at, self.days):
+            stations = by_day.get(date, {})
+            listings_by_day.append(
+                [
+                    [
+                        json.loads(program)
+                        for _, program in sorted(stations.get(str(channel.get("stationId")), []))
+                    ]
+                    for channel in self.channels
+                ]
+            )
+        return {
+            "lineup_data": self.channels,
+            "listings_by_day": listings_by_day,
+            "channel_key": self.channel_key,
+            "fetched_at": self.fetched_at,
+        }
+
+
+class GuideArchive:
+    """Archive of every guide published per lineup, kept for `retention_days`
+
+    Entries older than the retention are folded into a new first entry (the
+    guide in effect at the cutoff) when the archive is appended to, at most
+    once per `COMPACT_INTERVAL` seconds.
+    """
+
+    COMPACT_INTERVAL = 3600
+
+    def __init__(self, directory, retention_days=30):
+        self.directory = directory
+        self.retention = retention_days * 86400
+        self._latest = {}  # lineup_id -> programme map of the last entry
+        self._latest_channels = {}  # lineup_id -> channel digest of the last entry
+        self._compacted_at = {}
+        self._lock = threading.Lock()
+
+    def path(self, lineup_id):
+        """Archive file of a lineup"""
+        return os.path.join(self.directory, f"{lineup_id}.hist")
+
+    def _read_index(self, lineup_id):
+        """
+        Read the entry headers of a lineup's archive.
+
+        Returns:
+            List of (published at, kind, payload offset, payload length); an
+            incomplete last entry (e.g. after a crash) is left out
+        """
+        path = self.path(lineup_id)
+        index = []
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise HistoryError(f"Not a guide archive: {path}")
+                size = os.fstat(f.fileno()).st_size
+                offset = len(MAGIC)
+                while offset + _ENTRY.size <= size:
+                    f.seek(offset)
+                    published, kind, length = _ENTRY.unpack(f.read(_ENTRY.size))
+                    if offset + _ENTRY.size + length > size:
+                        break
+                    index.append((published, kind, offset + _ENTRY.size, length))
+                    offset += _ENTRY.size + length
+        except FileNotFoundError:
+            return []
+        return index
+
+    def _replay(self, lineup_id, index):
+        """Rebuild the state after the last of the `index` entries"""
+        state = _State()
+        found = False
+        with open(self.path(lineup_id), "rb") as f:
+            for _, kind, offset, length in index:
+                f.seek(offset)
+                try:
+                    payload = json.loads(zlib.decompress(f.read(length)))
+                except (zlib.error, ValueError) as e:
+                    raise HistoryError(f"Corrupt entry in {self.path(lineup_id)}: {e}") from e
+                state.apply(kind, payload)
+                found = True
+        return state if found else None
+
+    def append(self, lineup_id, guide, published_at):
+        """
+        Archive a published guide.
+
+        Args:
+            lineup_id: The lineup ID
+            guide: The lineup's entry in `TVTVConverter.guide_data`
+            published_at: Timezone-aware datetime of publication
+
+        Returns:
+            True if an entry was written, False if nothing changed
+        """
+        programmes = _programmes(guide)
+        with self._lock:
+            if lineup_id not in self._latest:
+                self._load_latest(lineup_id)
+            previous = self._latest.get(lineup_id)
+            channels_changed = self._latest_channels.get(lineup_id) != _channel_digest(guide)
+
+            payload = {
+                "fetched_at": guide["fetched_at"].isoformat(),
+                "days": len(guide["listings_by_day"]),
+            }
+            if previous is None:
+                kind = FULL
+                removed = []
+                added = programmes
+            else:
+                kind = DELTA
+                removed = [list(key) for key in previous if key not in programmes]
+                added = {k: v for k, v in programmes.items() if previous.get(k) != v}
+                if not (removed or added or channels_changed):
+                    return False
+            if kind == FULL or channels_changed:
+                payload["channels"] = guide["lineup_data"]
+                payload["channel_key"] = guide.get("channel_key")
+            payload["removed"] = removed
+            payload["added"] = [[*key, program] for key, program in sorted(added.items())]
+
+            self._write_entry(lineup_id, published_at.timestamp(), kind, payload)
+            self._latest[lineup_id] = programmes
+            self._latest_channels[lineup_id] = _channel_digest(guide)
+            if time.time() - self._compacted_at.get(lineup_id, 0) >= self.COMPACT_INTERVAL:
+                self._compact(lineup_id, time.time())
+            return True
+
+    def _load_latest(self, lineup_id):
+        """Load the last archived state (once per process)"""
+        index = self._read_index(lineup_id)
+        state = self._replay(lineup_id, index) if index else None
+        if state is not None:
+            self._latest[lineup_id] = state.programmes
+            self._latest_channels[lineup_id] = _channel_digest(
+                {"lineup_data": state.channels, "channel_key": state.channel_key}
+            )
+
+    def _write_entry(self, lineup_id, published, kind, payload):
+        path = self.path(lineup_id)
+        os.makedirs(self.directory, exist_ok=True)
+        index = self._read_index(lineup_id)
+        data = zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), 9)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            if index:
+                # Drop an incomplete entry left by an interrupted write
+                _, _, offset, length = index[-1]
+                f.truncate(offset + length)
+                f.seek(offset + length)
+            else:
+                f.truncate(0)
+                f.write(MAGIC)
+            f.write(_ENTRY.pack(published, kind, len(data)))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _compact(self, lineup_id, now):
+        """Fold entries older than the retention into a full first entry"""
+        self._compacted_at[lineup_id] = now
+        index = self._read_index(lineup_id)
+        cutoff = now - self.retention
+        # The last entry at or before the cutoff was in effect at the cutoff
+        base = max((i for i, entry in enumerate(index) if entry[0] <= cutoff), default=0)
+        if base == 0:
+            return
+        state = self._replay(lineup_id, index[: base + 1])
+        payload = {
+            "fetched_at": state.fetched_at.isoformat(),
+            "days": state.days,
+            "channels": state.channels,
+            "channel_key": state.channel_key,
+            "removed": [],
+            "added": [[*key, program] for key, program in sorted(state.programmes.items())],
+        }
+        data = zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), 9)
+        path = self.path(lineup_id)
+        tmp_path = f"{path}.tmp"
+        with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+            dst.write(MAGIC)
+            dst.write(_ENTRY.pack(index[base][0], FULL, len(data)))
+            dst.write(data)
+            # Later entries are changes relative to the state above: copy them as-is
+            if base + 1 < len(index):
+                src.seek(index[base + 1][2] - _ENTRY.size)
+                end = index[-1][2] + index[-1][3]
+                dst.write(src.read(end - src.tell()))
+        os.replace(tmp_path, path)
+
+    def guide_at(self, lineup_id, when):
+        """
+        Return the guide published most recently at or before a time.
+
+        Args:
+            lineup_id: The lineup ID
+            when: Timezone-aware datetime
+
+        Returns:
+            Tuple of (guide in `guide_data` layout, publication datetime), or
+            None if nothing was archived by then
+        """
+        with self._lock:
+            index = self._read_index(lineup_id)
+            entries = [entry for entry in index if entry[0] <= when.timestamp()]
+            if not entries:
+                return None
+            state = self._replay(lineup_id, entries)
+        return state.guide(), datetime.fromtimestamp(entries[-1][0], timezone.utc)
+
+    def entries(self, lineup_id):
+        """
+        List a lineup's archive entries.
+
+        Returns:
+            List of dictionaries with `published_at`, `kind` and `bytes`
+        """
+        with self._lock:
+            index = self._read_index(lineup_id)
+        return [
+            {
+                "published_at": datetime.fromtimestamp(published, timezone.utc).isoformat(),
+                "kind": "full" if kind == FULL else "delta",
+                "bytes": length,
+            }
+            for published, kind, _, length in index
+        ]
+
+    def status(self):
+        """Archive size per lineup, for reporting"""
+        lineups = {}
+        with self._lock:
+            try:
+                names = sorted(os.listdir(self.directory))
+            except OSError:
+                names = []
+            for name in names:
+                if not name.endswith(".hist"):
+                    continue
+                lineup_id = name[: -len(".hist")]
+                index = self._read_index(lineup_id)
+                lineups[lineup_id] = {
+                    "entries": len(index),
+                    "bytes": os.path.getsize(self.path(lineup_id)),
+                    "oldest": (
+                        datetime.fromtimestamp(index[0][0], timezone.utc).isoformat()
+                        if index
+                        else None
+                    ),
+                }
+        return {
+            "directory": self.directory,
+            "retention_days": self.retention // 86400,
+            "lineups": lineups,
+        }
+
+
+def _channel_digest(guide):
+    return guide.get("channel_key") or json.dumps(guide["lineup_data"], sort_keys=True)
@@ -0,0 +1,252 @@
+"""
+Logging setup: queue-backed output, per-module levels and key/value records
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+LOGGER_NAME = "tvtv2xmltv"
+
+# Records waiting for the writer thread before new ones are dropped
+QUEUE_SIZE = 10000
+
+# Records with the same logger, level and message template let through per window
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_INTERVAL = 60.0
+
+# Attributes every LogRecord has; anything else was passed with `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def record_fields(record):
+    """Structured fields of a record (the `extra=` keys) in the order given"""
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        value = f"{value:.3f}".rstrip("0").rstrip(".")
+    value = str(value)
+    if not value or any(c in value for c in ' "=\n'):
+        return json.dumps(value)
+    return value
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Format records as `time level logger message key=value ...`"""
+
+    def format(self, record):
+        line = (
+            f"{self.formatTime(record)} {record.levelname:<7} {record.name} {record.getMessage()}"
+        )
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={_format_value(v)}" for k, v in fields.items())
+        exc_text = record.exc_text or (
+            self.formatException(record.exc_info) if record.exc_info else None
+        )
+        if exc_text:
+            line += "\n" + exc_text
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(record_fields(record))
+        exc_text = record.exc_text or (
+            self.formatException(record.exc_info) if record.exc_info else None
+        )
+        if exc_text:
+            entry["exception"] = exc_text
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Let at most `burst` repeats of a message through per `interval` seconds
+
+    Messages are keyed by logger, level and message template, so a warning
+    logged once per station with different arguments counts as a repeat. The
+    first record let through after a quiet window carries `suppressed=N`.
+    DEBUG records are never limited: that level is only enabled on purpose.
+    """
+
+    def __init__(self, burst=RATE_LIMIT_BURST, interval=RATE_LIMIT_INTERVAL, clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.clock = clock
+        self._windows = {}  # key -> [window start, records let through, records suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = self.clock()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                if len(self._windows) > 1000:
+                    self._prune(now)
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+    def _prune(self, now):
+        for key in [k for k, w in self._windows.items() if now - w[0] >= self.interval]:
+            del self._windows[key]
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full
+
+    The number of dropped records is added to the next record that fits as
+    `dropped=N`.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge arguments and exception text now; the record is formatted on
+        # the writer thread, after the arguments may have changed
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.dropped:
+            record.dropped = self.dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.dropped = 0
+
+
+def parse_level(value, default=logging.INFO):
+    """Return the numeric level for a name such as "debug" (default if unknown)"""
+    level = logging.getLevelName(str(value).strip().upper())
+    return level if isinstance(level, int) else default
+
+
+def parse_levels(value):
+    """
+    Parse per-module levels such as "tvtv_client=DEBUG,server=WARNING".
+
+    Module names are relative to the package; entries with an unknown level are
+    skipped.
+
+    Returns:
+        Dictionary mapping logger name to numeric level
+    """
+    levels = {}
+    for entry in (value or "").split(","):
+        name, _, level = entry.partition("=")
+        name = name.strip()
+        if not name or parse_level(level, None) is None:
+            continue
+        if not name.startswith(LOGGER_NAME):
+            name = f"{LOGGER_NAME}.{name}"
+        levels[name] = parse_level(level)
+    return levels
+
+
+def setup_logging(level="INFO", levels="", fmt="text", stream=None):
+    """
+    Route the package's log records through a queue to a writer thread.
+
+    Code logging on the refresh or request threads only formats the message and
+    puts it on a bounded queue; a slow stdout (e.g. a stalled log collector)
+    delays the writer thread alone, and records are dropped once the queue is
+    full. Calling this again replaces the previous setup, so levels can change
+    on a configuration reload.
+
+    Args:
+        level: Level of the package logger
+        levels: Per-module levels (see `parse_levels`)
+        fmt: "text" for key/value lines or "json"
+        stream: Output stream (default stdout)
+
+    Returns:
+        The QueueListener writing records
+    """
+    global _listener  # pylint: disable=global-statement
+
+    with _setup_lock:
+        logger = logging.getLogger(LOGGER_NAME)
+        if _listener is not None:
+            _listener.stop()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        for name in list(logging.root.manager.loggerDict):
+            if name.startswith(f"{LOGGER_NAME}."):
+                logging.getLogger(name).setLevel(logging.NOTSET)
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JSONFormatter() if fmt == "json" else KeyValueFormatter())
+        log_queue = queue.Queue(QUEUE_SIZE)
+        handler = DroppingQueueHandler(log_queue)
+        handler.addFilter(RateLimitFilter())
+
+        logger.addHandler(handler)
+        logger.setLevel(parse_level(level))
+        logger.propagate = False
+        for name, module_level in parse_levels(levels).items():
+            logging.getLogger(name).setLevel(module_level)
+
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        return _listener
+
+
+def shutdown_logging():
+    """Write out queued records and stop the writer thread"""
+    global _listener  # pylint: disable=global-statement
+
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def configure_from(config, stream=None):
+    """Set up logging from a Config's log_level, log_levels and log_format"""
+    return setup_logging(config.log_level, config.log_levels, config.log_format, stream)
+
+
+atexit.register(shutdown_logging)
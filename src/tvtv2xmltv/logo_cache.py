@@ -0,0 +1,243 @@
+"""
+Station logo proxy cache module
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_HOST = "https://www.tvtv.us"
+
+IMAGE_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".svg": "image/svg+xml",
+}
+
+MAX_LOGO_BYTES = 2 * 1024 * 1024
+FAILURE_RETRY = 600  # Seconds before a logo that failed to download is tried again
+
+
+def upstream_logo_url(logo):
+    """Return the absolute upstream URL of a channel logo (None when there is none)
+
+    tvtv.us returns logos as site-relative paths, but lineups can also carry
+    absolute URLs (e.g. Schedules Direct station logos), which are kept as-is.
+    """
+    if not logo:
+        return None
+    if logo.startswith(("http://", "https://")):
+        return logo
+    if logo.startswith("//"):
+        return f"https:{logo}"
+    return f"{UPSTREAM_HOST}/{logo.lstrip('/')}"
+
+
+def logo_name(url):
+    """Stable local file name for an upstream logo URL"""
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    if extension not in IMAGE_TYPES:
+        extension = ".png"
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:20] + extension
+
+
+class LogoCache:
+    """Fetch each station logo once and serve it locally
+
+    Guides reference logos by a name derived from the upstream URL (see
+    `logo_name`). The first request for a name downloads the image; the bytes
+    are stored once per content digest under `blobs/`, so stations sharing a
+    logo share a file, and an index maps names to digests across restarts.
+    Logos are refetched after `ttl` seconds; if that fails the cached image is
+    kept. With `max_size` images are scaled down to fit (requires Pillow).
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(self, cache_dir, ttl=30 * 24 * 3600, max_size=0, timeout=10, session=None):
+        # Imported here: the generator (and its render workers) only need the
+        # URL helpers above
+        import requests  # pylint: disable=import-outside-toplevel
+
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max(0, max_size)
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self._download_errors = (requests.RequestException, ValueError)
+        self._sources = {}  # Logo name -> upstream URL, from the published lineups
+        self._entries = {}  # Logo name -> {"url", "digest", "type", "fetched_at"}
+        self._failures = {}  # Logo name -> time of the last failed download
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._load_index()
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.cache_dir, "index.json")
+
+    def _blob_path(self, digest, extension):
+        return os.path.join(self.cache_dir, "blobs", f"{digest}{extension}")
+
+    def _lock_for(self, name):
+        with self._locks_guard:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(entries, dict):
+            self._entries = {k: v for k, v in entries.items() if isinstance(v, dict)}
+
+    def _save_index(self):
+        # Callers change `_entries` under `_index_lock` too, so the copy is consistent
+        with self._index_lock:
+            entries = dict(self._entries)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self._index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self._index_path)
+
+    def register(self, lineup_data):
+        """Remember the upstream URLs of a lineup's channel logos"""
+        for channel in lineup_data:
+            url = upstream_logo_url(channel.get("logo"))
+            if url:
+                self._sources[logo_name(url)] = url
+
+    def source(self, name):
+        """Upstream URL of a logo name, or None if unknown"""
+        entry = self._entries.get(name)
+        return self._sources.get(name) or (entry["url"] if entry else None)
+
+    def get(self, name):
+        """
+        Return a cached logo, downloading it on first use or when expired.
+
+        Concurrent requests for the same logo share a single download.
+
+        Args:
+            name: Logo name from a guide's icon URL
+
+        Returns:
+            Tuple of (file path, content type, digest), or None if unavailable
+        """
+        url = self.source(name)
+        if url is None:
+            return None
+
+        with self._lock_for(name):
+            entry = self._entries.get(name)
+            if entry is not None and not os.path.exists(self._entry_path(entry)):
+                entry = None
+            if entry is not None and (
+                time.time() - entry.get("fetched_at", 0) < self.ttl
+                or time.time() - self._failures.get(name, 0) < FAILURE_RETRY
+            ):
+                return self._result(entry)
+            if entry is None and time.time() - self._failures.get(name, 0) < FAILURE_RETRY:
+                return None
+
+            try:
+                data, content_type = self._download(url)
+            except self._download_errors as e:
+                self._failures[name] = time.time()
+                logger.warning("Could not download logo: %s", e, extra={"url": url})
+                return self._result(entry) if entry is not None else None
+
+            entry = {
+                "url": url,
+                "digest": hashlib.sha256(data).hexdigest(),
+                "type": content_type,
+                "fetched_at": time.time(),
+            }
+            path = self._entry_path(entry)
+            if not os.path.exists(path):
+                self._write(path, data)
+            with self._index_lock:
+                self._entries[name] = entry
+            self._failures.pop(name, None)
+            self._save_index()
+            return self._result(entry)
+
+    def _entry_path(self, entry):
+        extension = os.path.splitext(logo_name(entry["url"]))[1]
+        return self._blob_path(entry["digest"], extension)
+
+    def _download(self, url):
+        """Download an image, returning (bytes, content type)"""
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+            if not content_type.startswith("image/"):
+                raise ValueError(f"not an image ({content_type or 'no content type'})")
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > MAX_LOGO_BYTES:
+                    raise ValueError("image too large")
+        data = b"".join(chunks)
+        if not data:
+            raise ValueError("empty response")
+        return data, content_type
+
+    @staticmethod
+    def _write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _result(self, entry):
+        path = self._entry_path(entry)
+        if self.max_size and entry["type"] != "image/svg+xml":
+            resized = self._resized(path, entry["digest"])
+            if resized is not None:
+                return resized, "image/png", f"{entry['digest']}-{self.max_size}"
+        return path, entry["type"], entry["digest"]
+
+    def _resized(self, path, digest):
+        """Return the path of a copy scaled to fit `max_size` (None without Pillow)"""
+        resized = self._blob_path(f"{digest}-{self.max_size}", ".png")
+        if os.path.exists(resized):
+            return resized
+        try:
+            from PIL import Image  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            logger.warning(
+                "TVTV_LOGO_SIZE requires the 'Pillow' package "
+                "(install with: pip install 'tvtv2xmltv[logos]'); serving original logos"
+            )
+            self.max_size = 0
+            return None
+        try:
+            with Image.open(path) as image:
+                image.thumbnail((self.max_size, self.max_size))
+                tmp_path = f"{resized}.tmp"
+                image.save(tmp_path, format="PNG")
+            os.replace(tmp_path, resized)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            logger.warning("Could not resize logo: %s", e, extra={"path": path})
+            return None
+        return resized
+
+    def status(self):
+        """Cache usage for reporting"""
+        return {"logos": len(self._entries), "known": len(self._sources)}
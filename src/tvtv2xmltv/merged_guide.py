@@ -0,0 +1,95 @@
+"""
+Merged multi-lineup guide module
+"""
+
+from collections import Counter
+
+
+class MergedGuide:
+    """Union of several lineups with channels and programmes deduplicated
+
+    Channels are deduplicated by stationId and programmes by station and start
+    time. Each lineup's contribution is kept per station, so updating or removing
+    a lineup only re-merges the stations that lineup carries.
+    """
+
+    def __init__(self):
+        self._lineups = {}  # lineup_id -> {station_id: (channel, {startTime: program})}
+        self._stations = {}  # station_id -> (channel, [programs sorted by start])
+
+    def update(self, lineup_id, lineup_data, listings_by_day):
+        """Replace a lineup's contribution with freshly fetched data"""
+        contribution = {}
+        for day_listings in listings_by_day:
+            for channel_idx, channel in enumerate(lineup_data):
+                if channel_idx >= len(day_listings):
+                    break
+                station_id = channel.get("stationId")
+                if station_id is None:
+                    continue
+                _, programs = contribution.setdefault(station_id, (channel, {}))
+                for program in day_listings[channel_idx]:
+                    if "startTime" in program:
+                        programs.setdefault(program["startTime"], program)
+
+        # Channels without listings are still part of the merged lineup
+        for channel in lineup_data:
+            if isinstance(channel, dict) and channel.get("stationId") is not None:
+                contribution.setdefault(channel["stationId"], (channel, {}))
+
+        previous = self._lineups.get(lineup_id, {})
+        self._lineups[lineup_id] = contribution
+        for station_id in set(previous) | set(contribution):
+            self._merge_station(station_id)
+
+    def remove(self, lineup_id):
+        """Drop a lineup's contribution"""
+        previous = self._lineups.pop(lineup_id, {})
+        for station_id in previous:
+            self._merge_station(station_id)
+
+    def _merge_station(self, station_id):
+        """Recompute one station's merged channel and schedule"""
+        channel = None
+        programs = {}
+        for contribution in self._lineups.values():
+            if station_id not in contribution:
+                continue
+            station_channel, station_programs = contribution[station_id]
+            if channel is None:
+                channel = station_channel
+            for start, program in station_programs.items():
+                programs.setdefault(start, program)
+
+        if channel is None:
+            self._stations.pop(station_id, None)
+        else:
+            ordered = [programs[start] for start in sorted(programs)]
+            self._stations[station_id] = (channel, ordered)
+
+    def build(self):
+        """
+        Return the merged guide in the generator's layout.
+
+        Channel numbers that more than one station uses (e.g. 2.1 in two markets)
+        get an explicit `xmltvId` of "{channelNumber}-{stationId}" so channel ids
+        stay unique.
+
+        Returns:
+            Tuple of (lineup_data, listings_by_day) with a single listings "day"
+        """
+        numbers = Counter(
+            str(channel.get("channelNumber")) for channel, _ in self._stations.values()
+        )
+        lineup_data = []
+        listings = []
+        for station_id, (channel, programs) in self._stations.items():
+            number = str(channel.get("channelNumber"))
+            if numbers[number] > 1:
+                channel = dict(channel, xmltvId=f"{number}-{station_id}")
+            lineup_data.append(channel)
+            listings.append(programs)
+        return lineup_data, [listings]
+
+    def __len__(self):
+        return len(self._stations)
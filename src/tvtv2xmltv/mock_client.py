@@ -3,24 +3,30 @@ Mock TVTV.us API client for local testing without hitting the real API
 """
 
 import json
+import logging
 import time
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 
 class MockTVTVClient:
     """Mock client that returns fixture data instead of making real API calls"""
 
-    def __init__(self, lineup_id, max_retries=3, retry_delay=2):
+    def __init__(self, lineup_id, max_retries=3, retry_delay=2, deadline=None):
         self.lineup_id = lineup_id
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.deadline = deadline
         self.fixtures_dir = Path(__file__).parent.parent.parent / "tests" / "fixtures"
 
     def _load_fixture(self, filename):
         """Load fixture data from JSON file"""
+        if self.deadline is not None:
+            self.deadline.check()
         filepath = self.fixtures_dir / filename
         if not filepath.exists():
-            print(f"Warning: Fixture {filename} not found, returning empty data")
+            logger.warning("Fixture not found, returning empty data", extra={"fixture": filename})
             return []
 
         with open(filepath, "r", encoding="utf-8") as f:
@@ -28,7 +34,7 @@ class MockTVTVClient:
 
     def get_lineup_channels(self):
         """Return mock channel lineup data"""
-        print(f"[MOCK] Fetching lineup channels for {self.lineup_id}")
+        logger.info("[MOCK] Fetching lineup channels", extra={"lineup": self.lineup_id})
         time.sleep(0.1)  # Simulate network delay
 
         filename = f"{self.lineup_id}_channels.json"
@@ -36,7 +42,10 @@ class MockTVTVClient:
 
     def get_grid_data(self, start_time, end_time, channels):  # pylint: disable=unused-argument
         """Return mock grid data"""
-        print(f"[MOCK] Fetching grid data for {self.lineup_id} ({len(channels)} channels)")
+        logger.info(
+            "[MOCK] Fetching grid data",
+            extra={"lineup": self.lineup_id, "start": start_time, "stations": len(channels)},
+        )
         time.sleep(0.1)  # Simulate network delay
 
         filename = f"{self.lineup_id}_grid.json"
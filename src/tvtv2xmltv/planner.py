@@ -0,0 +1,224 @@
+"""
+Upstream request planner (dry run)
+"""
+
+import math
+import os
+import time
+
+from .request_budget import DAY, HOUR
+from .snapshot import SnapshotError, load_snapshot, snapshot_path
+from .tvtv_client import TVTVClient
+
+
+def build_plan(converter, latency=1.0, now=None, fetch_channels=False):
+    """
+    Compute the upstream requests the next refresh will make, without making them.
+
+    Channel lineups come from the channel cache (even when expired) or else the
+    lineup's last snapshot. The station count of a lineup found in neither is
+    unknown, so its grid requests are left out of the plan, unless
+    `fetch_channels` allows fetching its channels once (and caching them).
+
+    Args:
+        converter: TVTVConverter configured like the real run
+        latency: Assumed seconds per upstream response
+        now: Current time (epoch seconds), for testing
+        fetch_channels: Fetch the channels of lineups found in neither
+
+    Returns:
+        Dictionary with the request `schedule`, per-lineup details, the
+        estimated refresh duration, daily projections and budget fit
+    """
+    # pylint: disable=protected-access,too-many-locals
+    config = converter.config
+    now = time.time() if now is None else now
+    request_time = latency + TVTVClient.REQUEST_DELAY
+
+    schedule = []
+    lineups = []
+    clock = 0.0
+    for i, lineup_id in enumerate(config.lineups):
+        if i > 0:
+            clock += converter.LINEUP_DELAY
+
+        channels = converter.channel_cache.peek(lineup_id)
+        if channels is None:
+            channels = _snapshot_channels(converter, lineup_id)
+        fetched_for_plan = False
+        if channels is None and fetch_channels:
+            client = converter.create_client(lineup_id)
+            channels, _ = converter.channel_cache.get(lineup_id, client.get_lineup_channels)
+            fetched_for_plan = True
+        # A lineup fetched just for planning is only cached for the real run on disk
+        channels_cached = converter.channel_cache.is_fresh(lineup_id) and (
+            not fetched_for_plan or bool(config.cache_dir)
+        )
+        stations = (
+            None
+            if channels is None
+            else sum(1 for c in channels if isinstance(c, dict) and "stationId" in c)
+        )
+
+        if not channels_cached:
+            schedule.append(
+                {"at": round(clock, 2), "lineup": lineup_id, "kind": "channels", "stations": 0}
+            )
+            clock += request_time
+
+        batch_size = converter._get_batch_sizer(lineup_id).batch_size
+        batches = math.ceil(stations / batch_size) if stations else 0
+        for day in range(config.days):
+            for batch in range(batches):
+                size = min(batch_size, stations - batch * batch_size)
+                schedule.append(
+                    {
+                        "at": round(clock, 2),
+                        "lineup": lineup_id,
+                        "kind": "grid",
+                        "day": day,
+                        "stations": size,
+                    }
+                )
+                clock += request_time
+                if batch < batches - 1:
+                    clock += TVTVClient.BATCH_DELAY
+
+        lineups.append(
+            {
+                "lineup": lineup_id,
+                "stations": stations,
+                "batch_size": batch_size,
+                "requests_per_day": batches,
+                "grid_requests": batches * config.days,
+                "channels_cached": channels_cached,
+                "channels_known": stations is not None,
+                "channels_fetched_for_plan": fetched_for_plan,
+                "snapshot_fresh": _snapshot_fresh(converter, lineup_id, now),
+            }
+        )
+
+    grid_per_refresh = sum(entry["grid_requests"] for entry in lineups)
+    refreshes_per_day = DAY / max(1, config.update_interval)
+    refreshes_per_hour = math.ceil(HOUR / max(1, config.update_interval))
+    channel_fetches_per_day = len(lineups) * math.ceil(DAY / max(1, config.channel_cache_ttl))
+    daily = math.ceil(grid_per_refresh * refreshes_per_day) + channel_fetches_per_day
+    peak_hour = grid_per_refresh * refreshes_per_hour + len(lineups)
+
+    return {
+        "lineups": lineups,
+        "schedule": schedule,
+        "requests": len(schedule),
+        "estimated_duration": round(clock, 1),
+        "complete": all(entry["channels_known"] for entry in lineups),
+        "assumed_latency": latency,
+        "projection": {
+            "refreshes_per_day": round(refreshes_per_day, 2),
+            "requests_per_day": daily,
+            "peak_requests_per_hour": peak_hour,
+            "channel_requests_per_day": channel_fetches_per_day,
+            "channel_cache_hit_rate": round(
+                1 - channel_fetches_per_day / max(1, len(lineups) * refreshes_per_day), 3
+            ),
+            "startup_refresh_skipped": bool(lineups)
+            and all(entry["snapshot_fresh"] for entry in lineups),
+        },
+        "budget": _budget_fit(converter, lineups, refreshes_per_day, refreshes_per_hour, now),
+    }
+
+
+def _snapshot_channels(converter, lineup_id):
+    """The channel list of a lineup's last snapshot, or None"""
+    try:
+        return load_snapshot(snapshot_path(converter.output_path(lineup_id)))["lineup_data"]
+    except SnapshotError:
+        return None
+
+
+def _snapshot_fresh(converter, lineup_id, now):
+    """True if a restart would load this lineup's snapshot instead of refetching"""
+    if not (converter.config.snapshots or converter.config.shared_dir):
+        return False
+    path = snapshot_path(converter.output_path(lineup_id))
+    if not os.path.exists(path):
+        return False
+    return now - os.path.getmtime(path) < converter.config.update_interval
+
+
+def _budget_fit(converter, lineups, refreshes_per_day, refreshes_per_hour, now):
+    """Days each refresh can fetch within the budget, and what is left right now"""
+    budget = converter.budget
+    if not budget.enabled:
+        return None
+
+    days = converter.config.days
+    per_day_all = sum(entry["requests_per_day"] for entry in lineups)
+    if per_day_all:
+        if budget.per_hour:
+            days = min(days, budget.per_hour // (per_day_all * refreshes_per_hour))
+        if budget.per_day:
+            days = min(days, int(budget.per_day // (per_day_all * refreshes_per_day)))
+
+    return {
+        "per_hour": budget.per_hour or None,
+        "per_day": budget.per_day or None,
+        "remaining": budget.remaining(now),
+        "days_per_refresh": max(0, days),
+        "degraded": days < converter.config.days,
+    }
+
+
+def format_plan(plan):
+    """Render a plan as human-readable text"""
+    lines = [f"{'lineup':<24} {'stations':>8} {'batch':>6} {'req/day':>8} {'grid':>6}  cache"]
+    for entry in plan["lineups"]:
+        cache = ["channels cached" if entry["channels_cached"] else "channels refetched"]
+        if not entry["channels_known"]:
+            cache.append("channels unknown")
+        if entry["channels_fetched_for_plan"]:
+            cache.append("lineup fetched for this plan")
+        if entry["snapshot_fresh"]:
+            cache.append("fresh snapshot")
+        stations = "?" if entry["stations"] is None else entry["stations"]
+        lines.append(
+            f"{entry['lineup']:<24} {stations:>8} {entry['batch_size']:>6} "
+            f"{entry['requests_per_day']:>8} {entry['grid_requests']:>6}  {', '.join(cache)}"
+        )
+
+    projection = plan["projection"]
+    lines += [
+        "",
+        f"Next refresh: {plan['requests']} requests, about {plan['estimated_duration']:.0f}s "
+        f"(assuming {plan['assumed_latency']}s per response)",
+        f"Per day: {projection['requests_per_day']} requests over "
+        f"{projection['refreshes_per_day']} refreshes "
+        f"(peak {projection['peak_requests_per_hour']}/hour), "
+        f"channel cache hit rate {projection['channel_cache_hit_rate']:.0%}",
+    ]
+    if not plan["complete"]:
+        lines.append(
+            "Grid requests of lineups with unknown channels are not included "
+            "(run with --fetch-channels to fetch their channels once)"
+        )
+    if projection["startup_refresh_skipped"]:
+        lines.append("A restart now would load snapshots instead of refetching")
+
+    budget = plan["budget"]
+    if budget:
+        lines.append(
+            f"Budget: {budget['per_hour'] or '-'}/hour, {budget['per_day'] or '-'}/day, "
+            f"{budget['remaining']} requests left now"
+        )
+        if budget["degraded"]:
+            lines.append(
+                f"Budget only covers {budget['days_per_refresh']} day(s) per refresh; "
+                "refreshes will fetch fewer days or keep stale data"
+            )
+
+    lines += ["", "Schedule:"]
+    for request in plan["schedule"]:
+        detail = f"day {request['day']}, {request['stations']} stations" if "day" in request else ""
+        lines.append(
+            f"  +{request['at']:>8.1f}s  {request['lineup']:<24} {request['kind']:<8} {detail}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,239 @@
+"""
+Refresh profiling: span timing, cProfile and tracemalloc capture
+"""
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# cProfile, pstats and tracemalloc are imported when a capture needs them, so
+# unprofiled runs (and one-shot conversions) don't pay for them
+
+logger = logging.getLogger(__name__)
+
+CAPTURES = ("spans", "cprofile", "tracemalloc")
+
+
+def parse_captures(value):
+    """Parse a TVTV_PROFILE value ("true" means spans only) into a set of captures"""
+    value = (value or "").strip().lower()
+    if value in ("", "false", "0", "no", "off"):
+        return set()
+    if value in ("true", "1", "yes", "on"):
+        return {"spans"}
+    if value == "all":
+        return set(CAPTURES)
+    return {item.strip() for item in value.split(",") if item.strip() in CAPTURES}
+
+
+class _NullSpan:
+    """Span used when nothing is being recorded"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        """Ignore span arguments"""
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Times a block as a Chrome trace "complete" event"""
+
+    def __init__(self, events, origin, name, args):
+        self.events = events
+        self.origin = origin
+        self.name = name
+        self.args = args
+        self.started = 0
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.events.append(
+            {
+                "name": self.name,
+                "ph": "X",
+                "ts": (self.started - self.origin) / 1000,
+                "dur": (ended - self.started) / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": self.args,
+            }
+        )
+        return False
+
+    def set(self, **args):
+        """Attach arguments (e.g. response size) to the span"""
+        self.args.update(args)
+
+
+class Profiler:
+    """Opt-in profiler for guide refreshes
+
+    Each refresh runs inside a `session`. While a session records spans, the
+    instrumented phases (HTTP requests, JSON decoding, rendering, file writes)
+    are timed with `span` and collected as Chrome trace events, which
+    chrome://tracing, Perfetto and speedscope load directly. cProfile and
+    tracemalloc can be captured for the same session. Outside a session `span`
+    returns a shared no-op context, so instrumentation costs one attribute check.
+
+    Captures come from the configuration, or can be armed for the next refresh
+    only (e.g. from the debug endpoint) without restarting.
+    """
+
+    def __init__(self, captures=(), output_dir=None):
+        self.captures = set(captures)
+        self.output_dir = output_dir
+        self.last_profile = None
+        self._armed = set()
+        self._events = None
+        self._origin = 0
+        self._lock = threading.Lock()
+
+    def arm(self, captures):
+        """Capture the given profiles (default: all) for the next session only"""
+        with self._lock:
+            self._armed = set(captures or CAPTURES) & set(CAPTURES)
+        return sorted(self._armed)
+
+    def span(self, name, **args):
+        """Return a context manager timing a block (no-op when not recording)"""
+        events = self._events
+        if events is None:
+            return _NULL_SPAN
+        return _Span(events, self._origin, name, args)
+
+    def session(self, name):
+        """Return a context manager profiling one refresh"""
+        return _Session(self, name)
+
+    def _begin(self):
+        """Start recording; returns the captures for this session or None"""
+        with self._lock:
+            if self._events is not None:
+                return None  # Nested sessions are part of the outer one
+            captures = self.captures | self._armed
+            self._armed = set()
+            if not captures:
+                return None
+            self._origin = time.perf_counter_ns()
+            self._events = []
+            return captures
+
+    def _finish(self, name, captures, started_at, profiler, tracing):
+        """Stop recording and keep (and optionally write) the profile"""
+        # pylint: disable=too-many-arguments
+        with self._lock:
+            events, self._events = self._events, None
+
+        profile = {
+            "name": name,
+            "started_at": started_at.isoformat(),
+            "captures": sorted(captures),
+            "trace": {"traceEvents": events, "displayTimeUnit": "ms"},
+            "summary": summarize(events),
+        }
+        # pylint: disable=import-outside-toplevel
+        if profiler is not None:
+            import pstats
+
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(40)
+            profile["cprofile"] = stream.getvalue()
+        if tracing:
+            import tracemalloc
+
+            snapshot = tracemalloc.take_snapshot()
+            if tracing == "started":
+                tracemalloc.stop()
+            stats = snapshot.statistics("lineno")[:25]
+            profile["tracemalloc"] = "\n".join(str(stat) for stat in stats)
+        self.last_profile = profile
+
+        if self.output_dir:
+            try:
+                os.makedirs(self.output_dir, exist_ok=True)
+                stamp = started_at.strftime("%Y%m%dT%H%M%SZ")
+                path = os.path.join(self.output_dir, f"{name}-{stamp}.trace.json")
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(profile["trace"], f)
+            except OSError as e:
+                logger.warning("Could not write profile: %s", e)
+
+
+class _Session:
+    """One profiled refresh (see `Profiler.session`)"""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self._captures = None
+        self._cprofile = None
+        self._tracing = None
+        self._started_at = None
+        self._span = None
+
+    def __enter__(self):
+        self._captures = self.profiler._begin()  # pylint: disable=protected-access
+        if self._captures is None:
+            return self
+        # pylint: disable=import-outside-toplevel
+        self._started_at = datetime.now(timezone.utc)
+        if "tracemalloc" in self._captures:
+            import tracemalloc
+
+            # Leave tracing running afterwards if someone else started it
+            self._tracing = "running" if tracemalloc.is_tracing() else "started"
+            if self._tracing == "started":
+                tracemalloc.start()
+        if "cprofile" in self._captures:
+            import cProfile
+
+            self._cprofile = cProfile.Profile()
+            try:
+                self._cprofile.enable()
+            except ValueError as e:  # Another profiler is already active
+                logger.warning("cProfile capture skipped: %s", e)
+                self._cprofile = None
+        self._span = self.profiler.span(self.name)
+        self._span.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._captures is None:
+            return False
+        self._span.__exit__(exc_type, exc, tb)
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        # pylint: disable-next=protected-access
+        self.profiler._finish(
+            self.name, self._captures, self._started_at, self._cprofile, self._tracing
+        )
+        return False
+
+
+def summarize(events):
+    """Total time and count per span name, slowest first"""
+    totals = {}
+    for event in events:
+        entry = totals.setdefault(event["name"], {"name": event["name"], "count": 0, "ms": 0.0})
+        entry["count"] += 1
+        entry["ms"] += event["dur"] / 1000
+    for entry in totals.values():
+        entry["ms"] = round(entry["ms"], 3)
+    return sorted(totals.values(), key=lambda entry: entry["ms"], reverse=True)
@@ -0,0 +1,195 @@
+"""
+Render variants: per-client guide renderings from one fetched dataset
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+import pytz
+
+from .xmltv_generator import XMLTVGenerator
+
+logger = logging.getLogger(__name__)
+
+# Query parameters selecting a render variant
+VARIANT_PARAMS = ("profile", "tz", "stream_url", "channels", "days")
+
+# Rendering options for one client; None keeps the configured default. The
+# stream URL may be a template containing {channel}; channels is a sorted tuple
+# of channel numbers and days counts from the first fetched day.
+RenderVariant = namedtuple("RenderVariant", ["timezone", "stream_url", "channels", "days"])
+
+
+def make_variant(timezone=None, stream_url=None, channels=None, days=None):
+    """
+    Build a validated RenderVariant.
+
+    Raises:
+        ValueError: If the timezone is unknown or days is not a positive integer
+    """
+    if timezone is not None:
+        try:
+            pytz.timezone(timezone)
+        except pytz.UnknownTimeZoneError as e:
+            raise ValueError(f"Unknown timezone: {timezone}") from e
+    if channels is not None:
+        if isinstance(channels, str):
+            channels = channels.split(",")
+        channels = tuple(sorted({str(c).strip() for c in channels if str(c).strip()}))
+    if days is not None:
+        days = int(days)
+        if days < 1:
+            raise ValueError("days must be at least 1")
+    return RenderVariant(timezone or None, stream_url or None, channels or None, days)
+
+
+def parse_profiles(value):
+    """
+    Parse TVTV_RENDER_PROFILES: a JSON object mapping profile names to options.
+
+    Each profile may set `timezone`, `stream_url`, `channels` (list or
+    comma-separated string) and `days`. Invalid profiles are skipped with a warning.
+
+    Returns:
+        Dictionary mapping profile name to RenderVariant
+    """
+    if not value or not value.strip():
+        return {}
+    try:
+        raw = json.loads(value)
+    except ValueError as e:
+        logger.warning("Ignoring TVTV_RENDER_PROFILES: %s", e)
+        return {}
+    if not isinstance(raw, dict):
+        logger.warning("Ignoring TVTV_RENDER_PROFILES: expected a JSON object")
+        return {}
+
+    profiles = {}
+    for name, options in raw.items():
+        try:
+            if not isinstance(options, dict):
+                raise ValueError("expected an object")
+            unknown = set(options) - {"timezone", "stream_url", "channels", "days"}
+            if unknown:
+                raise ValueError(f"unknown options {', '.join(sorted(unknown))}")
+            profiles[name] = make_variant(**options)
+        except (TypeError, ValueError) as e:
+            logger.warning("Ignoring render profile: %s", e, extra={"profile": name})
+    return profiles
+
+
+def select(lineup_data, listings_by_day, channels=None, days=None):
+    """Restrict guide data to a channel subset and/or the first `days` days"""
+    if days is not None:
+        listings_by_day = listings_by_day[:days]
+    if channels is not None:
+        wanted = set(channels)
+        keep = [i for i, c in enumerate(lineup_data) if str(c["channelNumber"]) in wanted]
+        lineup_data = [lineup_data[i] for i in keep]
+        listings_by_day = [[day[i] for i in keep if i < len(day)] for day in listings_by_day]
+    return lineup_data, listings_by_day
+
+
+class RenderCache:
+    """LRU cache of rendered guide variants
+
+    Renderings are keyed by lineup, the fetch they were rendered from, the
+    variant and the source URL, and evicted least recently used first once the
+    cached documents exceed `max_bytes`. One generator is kept per timezone and
+    stream URL so channel elements are memoised across variants.
+    """
+
+    MAX_GENERATORS = 16
+
+    def __init__(
+        self,
+        default_timezone,
+        default_stream_url=None,
+        max_bytes=64 * 1024 * 1024,
+        logo_base_url=None,
+    ):
+        self.default_timezone = default_timezone
+        self.default_stream_url = default_stream_url
+        self.logo_base_url = logo_base_url
+        self.max_bytes = max(0, max_bytes)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> encoded document
+        self._generators = {}
+        self._lock = threading.Lock()
+
+    def _generator(self, timezone, stream_url):
+        key = (timezone, stream_url)
+        with self._lock:
+            generator = self._generators.get(key)
+            if generator is None:
+                if len(self._generators) >= self.MAX_GENERATORS:
+                    self._generators.clear()
+                generator = self._generators[key] = XMLTVGenerator(
+                    timezone, stream_url, logo_base_url=self.logo_base_url
+                )
+            return generator
+
+    def render(self, lineup_id, guide, variant, source_url):
+        """
+        Return a variant of a lineup's guide as UTF-8 bytes, rendering it on a miss.
+
+        Args:
+            lineup_id: Lineup the guide belongs to
+            guide: The lineup's entry in `TVTVConverter.guide_data`
+            variant: RenderVariant to render
+            source_url: source-info-url of the document
+        """
+        key = (lineup_id, guide["fetched_at"], variant, source_url)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        generator = self._generator(
+            variant.timezone or self.default_timezone,
+            variant.stream_url or self.default_stream_url,
+        )
+        lineup_data, listings_by_day = select(
+            guide["lineup_data"], guide["listings_by_day"], variant.channels, variant.days
+        )
+        channel_key = guide.get("channel_key")
+        if channel_key is not None and variant.channels is not None:
+            channel_key = (channel_key, variant.channels)
+        data = generator.generate(
+            lineup_data, listings_by_day, source_url, channel_key=channel_key
+        ).encode("utf-8")
+
+        with self._lock:
+            if key not in self._entries and len(data) <= self.max_bytes:
+                self._entries[key] = data
+                self.size += len(data)
+                while self.size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return data
+
+    def invalidate(self, lineup_id=None):
+        """Drop cached renderings of a lineup (or of all lineups)"""
+        with self._lock:
+            for key in [k for k in self._entries if lineup_id is None or k[0] == lineup_id]:
+                self.size -= len(self._entries.pop(key))
+            if lineup_id is None:
+                self._generators.clear()
+
+    def status(self):
+        """Cache usage for reporting"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,119 @@
+"""
+Upstream request budget module
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised when an upstream request would exceed the configured budget"""
+
+
+class RequestBudget:
+    """Limit upstream requests per rolling hour and day
+
+    Every request sent to tvtv.us (including retries) is recorded with its
+    timestamp. A limit of 0 disables that window. With a state path the ledger
+    survives restarts, so restarting the server does not reset the budget.
+    """
+
+    def __init__(self, per_hour=0, per_day=0, state_path=None):
+        self.per_hour = max(0, per_hour)
+        self.per_day = max(0, per_day)
+        self.state_path = state_path
+        self._requests = deque()  # Timestamps within the last day, oldest first
+        self._lock = threading.RLock()
+        self._load()
+
+    @property
+    def enabled(self):
+        return bool(self.per_hour or self.per_day)
+
+    def _load(self):
+        """Restore the ledger from the state file"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(state, dict) and isinstance(state.get("requests"), list):
+            cutoff = time.time() - DAY
+            self._requests.extend(
+                sorted(t for t in state["requests"] if isinstance(t, (int, float)) and t > cutoff)
+            )
+
+    def save(self):
+        """Persist the ledger (no-op without a state path)"""
+        if not self.state_path:
+            return
+        with self._lock:
+            self._expire(time.time())
+            state = {"requests": list(self._requests)}
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _expire(self, now):
+        while self._requests and self._requests[0] <= now - DAY:
+            self._requests.popleft()
+
+    def used(self, window, now=None):
+        """Number of requests recorded in the last `window` seconds"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            return sum(1 for t in self._requests if t > now - window)
+
+    def remaining(self, now=None):
+        """
+        Requests still allowed right now.
+
+        Returns:
+            The smaller of the hourly and daily allowance, or None when unlimited
+        """
+        limits = []
+        if self.per_hour:
+            limits.append(self.per_hour - self.used(HOUR, now))
+        if self.per_day:
+            limits.append(self.per_day - self.used(DAY, now))
+        return max(0, min(limits)) if limits else None
+
+    def consume(self, now=None):
+        """
+        Record one upstream request.
+
+        Raises:
+            BudgetExceeded: If the request would exceed the hourly or daily budget
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            remaining = self.remaining(now)
+            if remaining is not None and remaining < 1:
+                raise BudgetExceeded(
+                    f"Upstream request budget exhausted ({self.per_hour or '-'}/hour, "
+                    f"{self.per_day or '-'}/day)"
+                )
+            self._requests.append(now)
+
+    def status(self, now=None):
+        """Budget usage for reporting"""
+        return {
+            "per_hour": self.per_hour or None,
+            "per_day": self.per_day or None,
+            "used_hour": self.used(HOUR, now),
+            "used_day": self.used(DAY, now),
+            "remaining": self.remaining(now),
+        }
@@ -0,0 +1,158 @@
+"""
+Refresh scheduling: a fixed-rate schedule with jitter, and deadlines
+"""
+
+import random
+import time
+
+
+class DeadlineExceeded(RuntimeError):
+    """Raised when work would continue past its deadline"""
+
+
+class Deadline:
+    """Point in time after which outstanding work is abandoned
+
+    Args:
+        seconds: Time allowed from now (None for no limit of its own)
+        name: What the deadline limits, for error messages
+        parent: Enclosing deadline; the earlier of the two applies
+        clock: Monotonic clock (default: time.monotonic)
+    """
+
+    def __init__(self, seconds=None, name="refresh", parent=None, clock=None):
+        self.clock = parent.clock if parent is not None else clock or time.monotonic
+        self.name = name
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else self.clock() + seconds
+        if parent is not None and parent.expires_at is not None:
+            if self.expires_at is None or parent.expires_at < self.expires_at:
+                self.expires_at = parent.expires_at
+                self.name = parent.name
+                self.seconds = parent.seconds
+
+    def child(self, seconds, name):
+        """A deadline of `seconds` from now that also ends with this one"""
+        return Deadline(seconds, name, parent=self)
+
+    def remaining(self):
+        """Seconds left (None when unlimited)"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self):
+        return self.expires_at is not None and self.clock() >= self.expires_at
+
+    def check(self, margin=0):
+        """
+        Raise DeadlineExceeded unless more than `margin` seconds are left.
+
+        A wait longer than the time left (e.g. a retry backoff) is pointless,
+        so callers pass it as the margin to give up right away.
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= margin:
+            raise self.error()
+
+    def error(self):
+        """The DeadlineExceeded error describing this deadline"""
+        return DeadlineExceeded(f"{self.name.capitalize()} deadline of {self.seconds}s reached")
+
+    def cap(self, seconds):
+        """Limit a timeout or pause to the time left"""
+        remaining = self.remaining()
+        return seconds if remaining is None else min(seconds, remaining)
+
+
+class RefreshSchedule:
+    """Fixed-rate refresh slots with jitter, and how late refreshes start
+
+    Slot `k` is planned at `start + k * interval` plus a random delay of up to
+    `jitter` seconds, so the cadence does not drift by the time refreshes
+    take. A refresh that overruns the next slot is followed by one refresh
+    right away; slots missed entirely are skipped rather than run back to back.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, interval, jitter=0, clock=time.time, rng=random.random):
+        self.interval = interval
+        self.jitter = jitter
+        self.clock = clock
+        self.rng = rng
+        self._anchor = clock()
+        self._slot = 0
+        self._offset = 0.0
+        self.runs = 0
+        self.skipped = 0
+        self.overruns = 0
+        self.last_lag = None
+        self.max_lag = 0.0
+        self.last_duration = None
+
+    def start(self, delay=0):
+        """Plan the first slot `delay` seconds from now (without jitter)"""
+        self._anchor = self.clock() + delay
+        self._slot = 0
+        self._offset = 0.0
+
+    def reconfigure(self, interval, jitter):
+        """Change the cadence; the next slot is `interval` after the last one"""
+        if self._slot > 0:
+            previous = self._anchor + (self._slot - 1) * self.interval
+            self._anchor = previous + interval - self._slot * interval
+        self.interval = interval
+        self.jitter = jitter
+
+    def next_run(self):
+        """Planned time (clock seconds) of the next slot"""
+        return self._anchor + self._slot * self.interval + self._offset
+
+    def wait(self):
+        """Seconds until the next slot"""
+        return max(0.0, self.next_run() - self.clock())
+
+    def due(self):
+        return self.clock() >= self.next_run()
+
+    def begin(self):
+        """
+        Record the start of the refresh of the next slot.
+
+        Returns:
+            Seconds the refresh starts after its planned time
+        """
+        lag = self.clock() - self.next_run()
+        missed = int(lag // self.interval) if lag >= self.interval > 0 else 0
+        if missed:
+            self.skipped += missed
+            self._slot += missed
+            lag = self.clock() - self.next_run()
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        return lag
+
+    def end(self, duration):
+        """Record the end of a slot's refresh and plan the next slot"""
+        self.runs += 1
+        self.last_duration = duration
+        self._slot += 1
+        self._offset = self.rng() * self.jitter
+        if self.clock() > self._anchor + self._slot * self.interval:
+            self.overruns += 1
+
+    def status(self):
+        """Cadence and lag for reporting"""
+        return {
+            "interval": self.interval,
+            "jitter": self.jitter,
+            "next_run": self.next_run(),
+            "runs": self.runs,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "last_duration": self.last_duration,
+            "overruns": self.overruns,
+            "skipped_slots": self.skipped,
+        }
@@ -2,13 +2,71 @@
 HTTP server module for serving XMLTV files
 """
 
+import logging
+import math
 import os
+import signal
 import threading
 import time
-from datetime import datetime, timezone
-from flask import Flask, send_file, jsonify
-from .converter import TVTVConverter
-from .config import Config
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Response, jsonify, redirect, request, send_file
+from .converter import RENDER_SETTINGS, TVTVConverter, logo_base_url
+from .circuit_breaker import CLOSED
+from .cluster import ClusterCoordinator
+from .config import RESTART_SETTINGS, Config
+from .demand import DemandTracker, refresh_interval
+from .events import EventBroker, GuideVersions, WebhookNotifier
+from .file_serving import GuideFileCache, send_guide
+from .guide_index import GuideIndex
+from .history import HistoryError
+from .log import configure_from
+from .logo_cache import LogoCache
+from .profiling import parse_captures
+from .render_cache import VARIANT_PARAMS, RenderCache, make_variant, parse_profiles
+from .scheduler import RefreshSchedule
+from .shards import SHARD_NAME, read_manifest
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_time(value):
+    """Parse an ISO-8601 or epoch-seconds query value into a POSIX timestamp"""
+    try:
+        timestamp = float(value)
+    except ValueError:
+        pass
+    else:
+        if not math.isfinite(timestamp):
+            raise ValueError(f"Not a finite time: {value}")
+        try:
+            datetime.fromtimestamp(timestamp, timezone.utc)
+        except (OverflowError, OSError) as e:
+            raise ValueError(f"Time out of range: {value}") from e
+        return timestamp
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _parse_channels(value):
+    """Parse a comma-separated channel list query value (None when absent)"""
+    if not value:
+        return None
+    return [channel.strip() for channel in value.split(",") if channel.strip()]
+
+
+def _isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def _file_stamp(path):
+    """Modification stamp of a file (None when missing)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
 
 
 class XMLTVServer:
@@ -16,6 +74,8 @@ class XMLTVServer:
 
     # pylint: disable=too-many-instance-attributes
 
+    LATE_WARNING = 5  # Seconds a refresh may start after its slot before a warning
+
     def __init__(self, config=None):
         if config is None:
             config = Config()
@@ -26,11 +86,64 @@ class XMLTVServer:
         self.update_lock = threading.Lock()
         self.update_thread = None
         self.running = False
+        self.stop_event = threading.Event()
+        self.reload_event = threading.Event()  # Set by SIGHUP to reload the config now
+        self.config_thread = None
+        self.http_server = None  # Production WSGI server, when in use
+        # The thread serving with waitress stops its own loop once this is set
+        self._serving_stopped = threading.Event()
+        self._serving_lock = threading.Lock()
+        self._serving_thread = None
+        # Leader election over shared storage (multi-replica mode only)
+        self.cluster = ClusterCoordinator(config.shared_dir) if config.shared_dir else None
+        self._manifest_published_at = None
+        # Fixed-rate refresh slots (see `_scheduled_update`)
+        self.schedule = RefreshSchedule(self._tick_interval(), config.update_jitter)
+        # Request rates per lineup, and lineups waiting for an on-demand refresh
+        self.demand = DemandTracker()
+        self.on_demand_refreshes = 0
+        self._on_demand = set()
+        self._on_demand_thread = None
+        self._on_demand_lock = threading.Lock()
+        # Monotonic time of each lineup's last refresh attempt, so that a
+        # failing lineup is not refetched on every request or tick
+        self._attempted = {}
         self.lineup_files = {}  # Maps lineup_id to filename
+        self.indexes = {}  # Maps lineup_id to GuideIndex of the published data
+        self.file_cache = GuideFileCache()  # Shared memory maps of published files
+        # Per-client renderings (?profile=, ?tz=, ...) of the published data
+        self.render_profiles = parse_profiles(config.render_profiles)
+        self.render_cache = RenderCache(
+            config.timezone,
+            config.stream_base_url,
+            config.render_cache_mb * 1024 * 1024,
+            logo_base_url=logo_base_url(config),
+        )
+        self.logo_cache = self._create_logo_cache()
+        # Announcements of each new guide version (/events and webhooks)
+        self.versions = GuideVersions()
+        self.events = EventBroker(max_clients=config.events_max_clients)
+        self.webhooks = WebhookNotifier(config.webhook_urls, config.webhook_secret)
 
         # Register routes
         self._register_routes()
 
+    def _create_logo_cache(self):
+        """Create the logo proxy cache (None when the proxy is disabled)"""
+        if not self.config.logo_proxy:
+            return None
+        logo_dir = os.path.join(self.config.cache_dir or ".", "logos")
+        logo_cache = LogoCache(
+            os.path.abspath(logo_dir), ttl=self.config.logo_ttl, max_size=self.config.logo_size
+        )
+        for guide in self.converter.guide_data.values():
+            logo_cache.register(guide["lineup_data"])
+        return logo_cache
+
+    def _send_guide(self, filename):
+        """Serve a published guide file from its shared memory map"""
+        return send_guide(self.file_cache, filename, x_accel_prefix=self.config.x_accel_prefix)
+
     def _register_routes(self):
         """Register Flask routes"""
 
@@ -41,18 +154,21 @@ class XMLTVServer:
                 # Single lineup mode: serve the default file
                 lineup_id = self.config.lineups[0]
                 filename = self.lineup_files.get(lineup_id, self.config.output_file)
+                self._record_demand(lineup_id)
+
+                if any(key in request.args for key in VARIANT_PARAMS):
+                    return self._serve_variant(lineup_id)
 
                 if not os.path.exists(filename):
                     return "XMLTV file not yet generated. Please wait...", 503
 
-                return send_file(
-                    filename,
-                    mimetype="application/xml; charset=utf-8",
-                    as_attachment=False,
-                )
+                return self._send_guide(filename)
             # Multiple lineup mode: return a list of available endpoints
+            lineup_ids = list(self.config.lineups)
+            if self.config.merged_output:
+                lineup_ids.append("all")
             lineup_list = "\n".join(
-                [f'<li><a href="/{lid}.xml">{lid}.xml</a></li>' for lid in self.config.lineups]
+                [f'<li><a href="/{lid}.xml">{lid}.xml</a></li>' for lid in lineup_ids]
             )
             return (
                 f"""
@@ -67,21 +183,158 @@ class XMLTVServer:
                 200,
             )
 
+        @self.app.route("/all.xml")
+        def serve_merged():
+            """Serve the merged guide of all lineups"""
+            if not self.config.merged_output:
+                return "Merged output not enabled (set TVTV_MERGED_OUTPUT=true)", 404
+            for lineup_id in self.config.lineups:
+                self._record_demand(lineup_id)
+
+            filename = self.converter.merged_file
+            if not filename or not os.path.exists(filename):
+                return "Merged XMLTV file not yet generated. Please wait...", 503
+
+            return self._send_guide(filename)
+
         @self.app.route("/<lineup_id>.xml")
         def serve_lineup(lineup_id):
             """Serve a specific lineup's XMLTV file"""
             if lineup_id not in self.config.lineups:
                 return f"Lineup '{lineup_id}' not configured", 404
 
+            if "at" in request.args:
+                return self._serve_archived(lineup_id)
+            self._record_demand(lineup_id)
+            if any(key in request.args for key in ("start", "hours")):
+                return self._serve_window(lineup_id)
+            if any(key in request.args for key in VARIANT_PARAMS):
+                return self._serve_variant(lineup_id)
+
             filename = self.lineup_files.get(lineup_id, f"{lineup_id}.xml")
 
             if not os.path.exists(filename):
                 return f"XMLTV file for lineup '{lineup_id}' not yet generated. Please wait...", 503
 
+            return self._send_guide(filename)
+
+        @self.app.route("/<lineup_id>/now")
+        def now_playing(lineup_id):
+            """Programmes airing now (or at `?at=`) for a lineup"""
+            return self._serve_airings(lineup_id, "now")
+
+        @self.app.route("/<lineup_id>/next")
+        def next_up(lineup_id):
+            """Next programme on each channel after now (or `?at=`) for a lineup"""
+            return self._serve_airings(lineup_id, "next")
+
+        @self.app.route("/<lineup_id>/history")
+        def lineup_history(lineup_id):
+            """Archived versions of a lineup's guide"""
+            if lineup_id not in self.config.lineups:
+                return f"Lineup '{lineup_id}' not configured", 404
+            if self.converter.history is None:
+                return "History not enabled (set TVTV_HISTORY_DIR)", 404
+            try:
+                entries = self.converter.history.entries(lineup_id)
+            except HistoryError as e:
+                return str(e), 500
+            return jsonify({"lineup": lineup_id, "entries": entries})
+
+        @self.app.route("/manifest.json")
+        def manifest_index():
+            """Current shard manifest version of every lineup"""
+            if not self.config.shards:
+                return "Shards not enabled (set TVTV_SHARDS=true)", 404
+            lineups = {}
+            for lineup_id in self.config.lineups:
+                manifest = read_manifest(self.converter.shard_dir(lineup_id))
+                if manifest is not None:
+                    lineups[lineup_id] = {
+                        "version": manifest.get("version"),
+                        "fetched_at": manifest.get("fetched_at"),
+                        "manifest": f"{self.config.external_url}/{lineup_id}/manifest.json",
+                    }
+            response = jsonify({"lineups": lineups})
+            response.cache_control.no_cache = True
+            return response
+
+        @self.app.route("/<lineup_id>/manifest.json")
+        def lineup_manifest(lineup_id):
+            """Per-day shards of a lineup's guide, named by content hash"""
+            if lineup_id not in self.config.lineups:
+                return f"Lineup '{lineup_id}' not configured", 404
+            if not self.config.shards:
+                return "Shards not enabled (set TVTV_SHARDS=true)", 404
+            self._record_demand(lineup_id)
+            manifest = read_manifest(self.converter.shard_dir(lineup_id))
+            if manifest is None:
+                return f"Shards for lineup '{lineup_id}' not yet generated. Please wait...", 503
+
+            base_url = f"{self.config.external_url}/{lineup_id}/shards"
+            for day in manifest.get("days", []):
+                day["url"] = f"{base_url}/{day['file']}"
+            response = jsonify(manifest)
+            response.set_etag(str(manifest.get("version")))
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+
+        @self.app.route("/<lineup_id>/shards/<name>")
+        def lineup_shard(lineup_id, name):
+            """Serve one shard; its content never changes, so it may be cached forever"""
+            if lineup_id not in self.config.lineups or not SHARD_NAME.match(name):
+                return "Shard not found", 404
+            path = os.path.join(self.converter.shard_dir(lineup_id), name)
+            if not os.path.exists(path):
+                return "Shard not found", 404
+            response = send_file(
+                path,
+                mimetype="application/xml",
+                etag=name[:-4],
+                max_age=365 * 24 * 3600,
+                conditional=True,
+            )
+            response.cache_control.immutable = True
+            return response
+
+        @self.app.route("/events")
+        def events():
+            """Stream an event for every new guide version (Server-Sent Events)"""
+            try:
+                last_event_id = request.headers.get("Last-Event-ID") or request.args.get(
+                    "last_event_id"
+                )
+                last_event_id = int(last_event_id) if last_event_id else None
+            except ValueError:
+                return "Last-Event-ID must be an integer", 400
+            lineups = _parse_channels(request.args.get("lineups"))
+
+            subscription = self.events.subscribe(last_event_id)
+            if subscription is None:
+                return "Too many event streams", 503, {"Retry-After": "60"}
+            return Response(
+                self.events.stream(subscription, lineups),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        @self.app.route("/logos/<name>")
+        def logo(name):
+            """Serve a station logo from the local logo cache"""
+            if self.logo_cache is None:
+                return "Logo proxy not enabled (set TVTV_LOGO_PROXY=true)", 404
+
+            cached = self.logo_cache.get(name)
+            if cached is None:
+                source = self.logo_cache.source(name)
+                if source is None:
+                    return f"Logo '{name}' not found", 404
+                # Not downloadable right now: let the client try upstream itself
+                return redirect(source, code=302)
+
+            path, mimetype, digest = cached
             return send_file(
-                filename,
-                mimetype="application/xml; charset=utf-8",
-                as_attachment=False,
+                path, mimetype=mimetype, etag=digest, max_age=self.config.logo_ttl, conditional=True
             )
 
         @self.app.route("/xmltv.xml")
@@ -97,14 +350,56 @@ class XMLTVServer:
                 for lid in self.config.lineups
             )
 
-            return jsonify(
-                {
-                    "status": "healthy",
-                    "last_update": self.last_update.isoformat() if self.last_update else None,
-                    "lineups": self.config.lineups,
-                    "files_exist": files_exist,
-                }
-            )
+            breaker = self.converter.breaker
+            degraded = breaker.state != CLOSED or bool(self.converter.stale)
+            status = {
+                "status": "degraded" if degraded else "healthy",
+                "last_update": self.last_update.isoformat() if self.last_update else None,
+                "lineups": self.config.lineups,
+                "files_exist": files_exist,
+                "role": self._role(),
+                "guides": self._guide_ages(),
+                "upstream": breaker.status(),
+            }
+            if self.converter.budget.enabled:
+                status["request_budget"] = self.converter.budget.status()
+            status["render_cache"] = self.render_cache.status()
+            status["events"] = self.events.status()
+            if self._role() != "follower":
+                status["schedule"] = self._schedule_status()
+            status["demand"] = self._demand_status()
+            if self.converter.history is not None:
+                status["history"] = self.converter.history.status()
+            if self.converter.work_queue is not None:
+                status["work_queue"] = self.converter.work_queue.status()
+            if self.logo_cache is not None:
+                status["logo_cache"] = self.logo_cache.status()
+            return jsonify(status)
+
+        @self.app.route("/debug/profile", methods=["GET", "POST"])
+        def debug_profile():
+            """Show the last refresh profile, or arm profiling of the next refresh"""
+            profiler = self.converter.profiler
+            if request.method == "POST":
+                captures = parse_captures(request.args.get("capture", "all"))
+                return jsonify({"armed": profiler.arm(captures)})
+
+            profile = profiler.last_profile
+            if profile is None:
+                return "No refresh has been profiled (set TVTV_PROFILE or POST here)", 404
+
+            output = request.args.get("format", "trace")
+            if output == "trace":
+                return jsonify(profile["trace"])
+            if output == "summary":
+                return jsonify(
+                    {key: profile[key] for key in ("name", "started_at", "captures", "summary")}
+                )
+            if output in ("cprofile", "tracemalloc"):
+                if output not in profile:
+                    return f"{output} was not captured for the last refresh", 404
+                return Response(profile[output], mimetype="text/plain; charset=utf-8")
+            return "format must be trace, summary, cprofile or tracemalloc", 400
 
         @self.app.route("/update")
         def update():
@@ -118,61 +413,772 @@ class XMLTVServer:
                 }
             )
 
+    def _guide_ages(self):
+        """When each lineup's served data was fetched, and whether it is stale"""
+        now = datetime.now(timezone.utc)
+        ages = {}
+        for lineup_id in self.config.lineups:
+            guide = self.converter.guide_data.get(lineup_id)
+            if guide is None:
+                continue
+            ages[lineup_id] = {
+                "version": self.versions.version(lineup_id),
+                "fetched_at": guide["fetched_at"].isoformat(),
+                "age_seconds": int((now - guide["fetched_at"]).total_seconds()),
+                "stale": lineup_id in self.converter.stale,
+            }
+        return ages
+
+    def _next_wait(self):
+        """Seconds until the next refresh: sooner when a probe of the upstream is due"""
+        wait = self.schedule.wait()
+        breaker = self.converter.breaker
+        if breaker.state == CLOSED:
+            return wait
+        return max(1, min(wait, breaker.retry_in()))
+
+    def _schedule_status(self):
+        status = self.schedule.status()
+        status["next_run"] = _isoformat(status["next_run"])
+        status["refresh_deadline"] = self.config.refresh_deadline
+        status["lineup_deadline"] = self.config.lineup_deadline or None
+        return status
+
+    def _scheduled_update(self):
+        """Refresh now; the refresh is the next slot's if that is due"""
+        if not self.schedule.due():
+            # An early retry of a recovering upstream (see `_next_wait`)
+            self._refresh()
+            return
+        skipped = self.schedule.skipped
+        lag = self.schedule.begin()
+        if self.schedule.skipped > skipped or lag > self.LATE_WARNING:
+            logger.warning(
+                "Refresh started late",
+                extra={"lag": lag, "skipped_slots": self.schedule.skipped - skipped},
+            )
+        started = time.monotonic()
+        self._refresh()
+        self.schedule.end(time.monotonic() - started)
+
+    def _tick_interval(self):
+        """Seconds between refresh slots: with demand-driven refreshes, the shortest interval"""
+        if self.config.demand_refresh:
+            return self.config.min_update_interval
+        return self.config.update_interval
+
+    def _refresh(self):
+        """Refresh every lineup, or with demand-driven refreshes the lineups that are due"""
+        if not self.config.demand_refresh:
+            self._update_xmltv()
+            return
+        if self.cluster is not None and not self.cluster.is_leader:
+            self._sync_from_manifest()
+            return
+        # Refresh a lineup at the slot closest to its interval
+        tolerance = self.schedule.interval / 2
+        self._refresh_lineups(
+            [lineup_id for lineup_id in self.config.lineups if self._due(lineup_id, tolerance)]
+        )
+
+    def _due(self, lineup_id, tolerance):
+        """Whether a lineup's interval has passed since it was fetched or last attempted"""
+        age = self._age(lineup_id)
+        # Lineups without data are retried at every slot
+        interval = self._lineup_interval(lineup_id) if age != math.inf else self.schedule.interval
+        return min(age, self._since_attempt(lineup_id)) >= interval - tolerance
+
+    def _age(self, lineup_id):
+        """Seconds since a lineup's data was fetched (infinite without data)"""
+        guide = self.converter.guide_data.get(lineup_id)
+        if guide is None:
+            return math.inf
+        return (datetime.now(timezone.utc) - guide["fetched_at"]).total_seconds()
+
+    def _since_attempt(self, lineup_id):
+        """Seconds since a lineup's last refresh attempt (infinite if none)"""
+        attempted = self._attempted.get(lineup_id)
+        return math.inf if attempted is None else time.monotonic() - attempted
+
+    def _lineup_interval(self, lineup_id):
+        """Seconds between refreshes of a lineup for its recent request rate"""
+        config = self.config
+        return refresh_interval(
+            self.demand.rate(lineup_id),
+            config.update_interval,
+            config.min_update_interval,
+            config.max_update_interval,
+            config.demand_rate,
+        )
+
+    def _refresh_lineups(self, lineup_ids, max_age=None):
+        """
+        Fetch and publish some lineups.
+
+        Args:
+            lineup_ids: Lineups to refresh
+            max_age: Skip lineups fetched less than this many seconds ago (e.g.
+                by a refresh that ran while this one waited), or attempted less
+                than `min_update_interval` seconds ago
+        """
+        with self.update_lock:
+            lineup_ids = [
+                lineup_id
+                for lineup_id in lineup_ids
+                if lineup_id in self.config.lineups
+                and (
+                    max_age is None
+                    or (
+                        self._age(lineup_id) >= max_age
+                        and self._since_attempt(lineup_id) >= self.config.min_update_interval
+                    )
+                )
+            ]
+            if not lineup_ids:
+                return
+            for lineup_id in lineup_ids:
+                self._attempted[lineup_id] = time.monotonic()
+            try:
+                started = time.monotonic()
+                self.lineup_files.update(self.converter.save_lineups(fetch_ids=lineup_ids))
+                self._build_indexes(lineup_ids)
+                self.last_update = datetime.now(timezone.utc)
+                if self.cluster is not None:
+                    self.cluster.publish(
+                        self.lineup_files,
+                        self.last_update,
+                        merged_file=self.converter.merged_file,
+                    )
+                self._announce(lineup_ids, self.last_update)
+                logger.info(
+                    "Lineups refreshed",
+                    extra={
+                        "lineups": ",".join(lineup_ids),
+                        "seconds": time.monotonic() - started,
+                    },
+                )
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Error refreshing lineups: %s", e)
+
+    def _record_demand(self, lineup_id):
+        """Count a request for a lineup, refreshing its data in the background if stale"""
+        self.demand.record(lineup_id)
+        if not self.config.demand_refresh or self._role() == "follower":
+            return
+        if self.converter.breaker.state != CLOSED:
+            return  # The refresh would keep the stale data anyway
+        age = self._age(lineup_id)
+        if age == math.inf or age < self.config.update_interval:
+            return  # A scheduled refresh fetches lineups without data
+        if self._since_attempt(lineup_id) < self.config.min_update_interval:
+            return  # The last attempt failed recently; don't retry on every request
+        with self._on_demand_lock:
+            if lineup_id in self._on_demand:
+                return  # Coalesced with the refresh already requested
+            self._on_demand.add(lineup_id)
+            self.on_demand_refreshes += 1
+            if self._on_demand_thread is None:
+                self._on_demand_thread = threading.Thread(target=self._on_demand_loop, daemon=True)
+                self._on_demand_thread.start()
+
+    def _on_demand_loop(self):
+        """Refresh the lineups requested while stale until none are left"""
+        while True:
+            with self._on_demand_lock:
+                lineup_ids = sorted(self._on_demand)
+                if not lineup_ids:
+                    self._on_demand_thread = None
+                    return
+            # Requests arriving meanwhile are coalesced into this refresh
+            self._refresh_lineups(lineup_ids, max_age=self.config.update_interval)
+            with self._on_demand_lock:
+                self._on_demand.difference_update(lineup_ids)
+
+    def _demand_status(self):
+        return {
+            "enabled": self.config.demand_refresh,
+            "on_demand_refreshes": self.on_demand_refreshes,
+            "lineups": {
+                lineup_id: {
+                    "requests_per_hour": round(self.demand.rate(lineup_id), 2),
+                    "refresh_interval": int(self._lineup_interval(lineup_id)),
+                }
+                for lineup_id in self.config.lineups
+            },
+        }
+
+    def _get_index(self, lineup_id):
+        """Return the lineup's index, or an error response tuple if unavailable"""
+        if lineup_id not in self.config.lineups:
+            return None, (f"Lineup '{lineup_id}' not configured", 404)
+        index = self.indexes.get(lineup_id)
+        if index is None:
+            return None, (f"Guide data for lineup '{lineup_id}' not yet available", 503)
+        return index, None
+
+    def _serve_airings(self, lineup_id, which):
+        """Answer a now/next query from the lineup's interval index"""
+        index, error = self._get_index(lineup_id)
+        if error:
+            return error
+        self._record_demand(lineup_id)
+        try:
+            at = _parse_time(request.args["at"]) if "at" in request.args else time.time()
+        except ValueError:
+            return "Invalid 'at' parameter", 400
+
+        channels = _parse_channels(request.args.get("channels"))
+        entries = index.now(at, channels) if which == "now" else index.next(at, channels)
+        return jsonify(
+            {
+                "lineup": lineup_id,
+                "at": _isoformat(at),
+                "programmes": [
+                    {
+                        "channel": str(channel["channelNumber"]),
+                        "call_sign": channel.get("stationCallSign"),
+                        "title": program.get("title"),
+                        "subtitle": program.get("subtitle", ""),
+                        "start": _isoformat(start),
+                        "stop": _isoformat(end),
+                    }
+                    for channel, program, start, end in entries
+                ],
+            }
+        )
+
+    def _serve_window(self, lineup_id):
+        """Render an XMLTV document for a time window and/or channel subset"""
+        index, error = self._get_index(lineup_id)
+        if error:
+            return error
+        try:
+            start = _parse_time(request.args["start"]) if "start" in request.args else None
+            hours = float(request.args["hours"]) if "hours" in request.args else None
+            if hours is not None and not math.isfinite(hours):
+                raise ValueError(f"Not a finite number of hours: {hours}")
+            if hours is not None and start is None:
+                start = time.time()
+            end = start + timedelta(hours=hours).total_seconds() if hours is not None else None
+        except (ValueError, OverflowError):
+            return "Invalid 'start' or 'hours' parameter", 400
+
+        lineup_data, listings_by_day = index.window(
+            start, end, _parse_channels(request.args.get("channels"))
+        )
+        source_url = f"{self.config.external_url}/{lineup_id}.xml"
+        xmltv_data = self.converter.generator.generate(lineup_data, listings_by_day, source_url)
+        return Response(xmltv_data, mimetype="application/xml; charset=utf-8")
+
+    def _serve_archived(self, lineup_id):
+        """Render the guide that was published at the `?at=` time"""
+        if self.converter.history is None:
+            return "History not enabled (set TVTV_HISTORY_DIR)", 404
+        try:
+            at = datetime.fromtimestamp(_parse_time(request.args["at"]), timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            return "Invalid 'at' parameter", 400
+        try:
+            archived = self.converter.history.guide_at(lineup_id, at)
+        except HistoryError as e:
+            return str(e), 500
+        if archived is None:
+            return f"No guide archived for lineup '{lineup_id}' at {at.isoformat()}", 404
+
+        guide, published_at = archived
+        source_url = f"{self.config.external_url}/{lineup_id}.xml"
+        xmltv_data = self.converter.generator.generate(
+            guide["lineup_data"], guide["listings_by_day"], source_url
+        )
+        response = Response(xmltv_data, mimetype="application/xml; charset=utf-8")
+        response.headers["X-Guide-Published-At"] = published_at.isoformat()
+        response.last_modified = published_at
+        return response
+
+    def _request_variant(self):
+        """
+        Return the RenderVariant requested by the query parameters.
+
+        `?profile=` selects a configured profile; `tz`, `stream_url`, `channels`
+        and `days` override its options.
+
+        Raises:
+            KeyError: If the profile is not configured
+            ValueError: If a parameter is invalid
+        """
+        args = request.args
+        base = make_variant()
+        if "profile" in args:
+            base = self.render_profiles[args["profile"]]
+        return make_variant(
+            args.get("tz", base.timezone),
+            args.get("stream_url", base.stream_url),
+            args.get("channels", base.channels),
+            args.get("days", base.days),
+        )
+
+    def _serve_variant(self, lineup_id):
+        """Serve a per-client rendering of a lineup from the render cache"""
+        try:
+            variant = self._request_variant()
+        except KeyError:
+            return f"Render profile '{request.args['profile']}' not configured", 404
+        except ValueError as e:
+            return f"Invalid render options: {e}", 400
+
+        guide = self.converter.guide_data.get(lineup_id)
+        if guide is None:
+            return f"Guide data for lineup '{lineup_id}' not yet available", 503
+
+        source_url = f"{self.config.external_url}/{lineup_id}.xml"
+        data = self.render_cache.render(lineup_id, guide, variant, source_url)
+        return Response(data, mimetype="application/xml; charset=utf-8")
+
+    def _build_indexes(self, lineup_ids=None):
+        """Build interval indexes for the freshly published guide data"""
+        for lineup_id in self.config.lineups if lineup_ids is None else lineup_ids:
+            self.render_cache.invalidate(lineup_id)
+            guide = self.converter.guide_data.get(lineup_id)
+            if guide is None:
+                continue
+            self.indexes[lineup_id] = GuideIndex(guide["lineup_data"], guide["listings_by_day"])
+            if self.logo_cache is not None:
+                self.logo_cache.register(guide["lineup_data"])
+
+    def _render_stamp(self):
+        """Identifies the settings documents are rendered with (part of their version)"""
+        return repr(sorted((name, getattr(self.config, name)) for name in RENDER_SETTINGS))
+
+    def _announce(self, lineup_ids, published_at, quiet=False):
+        """
+        Announce lineups whose published guide has a new version.
+
+        Args:
+            lineup_ids: Lineups that were just published
+            published_at: When they were published
+            quiet: Only record the versions (e.g. when loading saved data at startup)
+        """
+        stamp = self._render_stamp()
+        for lineup_id in lineup_ids:
+            guide = self.converter.guide_data.get(lineup_id)
+            if guide is None:
+                continue
+            event = self.versions.update(lineup_id, guide, stamp)
+            if event is None or quiet:
+                continue
+            event["published_at"] = published_at.isoformat()
+            event["url"] = f"{self.config.external_url}/{lineup_id}.xml"
+            if self.config.shards:
+                event["manifest"] = f"{self.config.external_url}/{lineup_id}/manifest.json"
+            self.events.publish("guide", event)
+            self.webhooks.notify("guide", event)
+
+    def _role(self):
+        if self.cluster is None:
+            return "standalone"
+        return "leader" if self.cluster.is_leader else "follower"
+
     def _update_xmltv(self):
         """Update the XMLTV files for all lineups"""
+        if self.cluster is not None and not self.cluster.is_leader:
+            # Followers never fetch; they pick up what the leader published
+            self._sync_from_manifest()
+            return
+
         with self.update_lock:
             try:
-                if len(self.config.lineups) == 1:
-                    print(f"Updating XMLTV file: {self.config.output_file}")
-                else:
-                    print(f"Updating XMLTV files for lineups: {', '.join(self.config.lineups)}")
+                started = time.monotonic()
+                logger.info(
+                    "Updating XMLTV files", extra={"lineups": ",".join(self.config.lineups)}
+                )
 
                 saved_files = self.converter.save_to_file()
 
                 # Update the lineup_files mapping
                 for i, lineup_id in enumerate(self.config.lineups):
                     self.lineup_files[lineup_id] = saved_files[i]
+                self._build_indexes()
 
                 self.last_update = datetime.now(timezone.utc)
+                if self.cluster is not None:
+                    self.cluster.publish(
+                        self.lineup_files,
+                        self.last_update,
+                        merged_file=self.converter.merged_file,
+                    )
+                self._announce(self.config.lineups, self.last_update)
+
+                logger.info(
+                    "XMLTV files updated",
+                    extra={
+                        "files": ",".join(saved_files),
+                        "seconds": time.monotonic() - started,
+                    },
+                )
+            except Exception as e:  # pylint: disable=broad-except
+                logger.error("Error updating XMLTV file(s): %s", e)
+
+    def _load_snapshots(self):
+        """
+        Load the snapshots saved by a previous run.
+
+        Returns:
+            Seconds until the loaded data is due for a refresh (0 to refresh now)
+        """
+        with self.update_lock:
+            loaded = self.converter.load_snapshots()
+            if not loaded:
+                return 0
+
+            self.lineup_files.update(loaded)
+            self._build_indexes()
+            merged_file = self.converter.merged_output_path()
+            if self.converter.merged_guide is not None and os.path.exists(merged_file):
+                self.converter.merged_file = merged_file
+            self.last_update = min(self.converter.guide_data[lid]["fetched_at"] for lid in loaded)
+            self._announce(loaded, self.last_update, quiet=True)
+            logger.info(
+                "Loaded saved guide data",
+                extra={"lineups": ",".join(loaded), "fetched_at": self.last_update.isoformat()},
+            )
+
+        if len(loaded) < len(self.config.lineups):
+            return 0
+        age = (datetime.now(timezone.utc) - self.last_update).total_seconds()
+        return max(0, self.config.update_interval - age)
+
+    def _sync_from_manifest(self):
+        """Hot-swap to the guide data most recently published by the leader"""
+        manifest = self.cluster.read_manifest()
+        if not manifest or manifest.get("published_at") == self._manifest_published_at:
+            return
+
+        with self.update_lock:
+            try:
+                updated = []
+                for lineup_id, entry in manifest.get("lineups", {}).items():
+                    if lineup_id not in self.config.lineups:
+                        continue
+                    if entry.get("data"):
+                        updated.append(lineup_id)
+                        self.render_cache.invalidate(lineup_id)
+                        guide = self.cluster.load_guide(entry["data"])
+                        if self.logo_cache is not None:
+                            self.logo_cache.register(guide["lineup_data"])
+                        self.converter.guide_data[lineup_id] = guide
+                        self.indexes[lineup_id] = GuideIndex(
+                            guide["lineup_data"], guide["listings_by_day"]
+                        )
+                    self.lineup_files[lineup_id] = self.cluster.path(entry["file"])
+                if manifest.get("merged"):
+                    self.converter.merged_file = self.cluster.path(manifest["merged"])
+
+                self.last_update = datetime.fromisoformat(manifest["published_at"])
+                self._manifest_published_at = manifest["published_at"]
+                self._announce(updated, self.last_update)
+                logger.info(
+                    "Loaded published guide data",
+                    extra={
+                        "leader": manifest.get("leader"),
+                        "published_at": manifest["published_at"],
+                    },
+                )
+            except (OSError, KeyError, TypeError, ValueError) as e:
+                # SnapshotError is a ValueError
+                logger.error("Error loading published guide data: %s", e)
+
+    def reload_config(self, new_config=None):
+        """
+        Re-read the configuration and apply what changed without restarting.
 
-                if len(saved_files) == 1:
-                    print(
-                        f"XMLTV file updated successfully at {self.last_update}: "
-                        f"{saved_files[0]}"
+        Only the work a change needs is done: removed lineups are dropped, added
+        lineups are fetched, and rendering changes re-render the fetched data.
+        Settings in `RESTART_SETTINGS` keep their running values.
+
+        Args:
+            new_config: Config to apply (default: read from the environment and
+                TVTV_CONFIG_FILE)
+
+        Returns:
+            Set of names of the applied settings
+        """
+        if new_config is None:
+            try:
+                new_config = Config()
+            except (OSError, ValueError) as e:
+                logger.error("Error reloading configuration, keeping current settings: %s", e)
+                return set()
+
+        changes = self.config.diff(new_config)
+        for name in sorted(changes & RESTART_SETTINGS):
+            logger.warning(
+                "Configuration change requires a restart; ignoring it", extra={"setting": name}
+            )
+            setattr(new_config, name, getattr(self.config, name))
+        changes -= RESTART_SETTINGS
+        if not changes:
+            return changes
+
+        with self.update_lock:
+            old_lineups = list(self.config.lineups)
+            old_paths = {lid: self.converter.output_path(lid) for lid in old_lineups}
+            # Update in place: the converter and its clients share this object
+            vars(self.config).update(vars(new_config))
+            self.converter.apply_config(changes)
+            if changes & (RENDER_SETTINGS | {"render_profiles", "render_cache_mb"}):
+                self.render_profiles = parse_profiles(self.config.render_profiles)
+                self.render_cache.default_timezone = self.config.timezone
+                self.render_cache.default_stream_url = self.config.stream_base_url
+                self.render_cache.max_bytes = self.config.render_cache_mb * 1024 * 1024
+                self.render_cache.logo_base_url = logo_base_url(self.config)
+                self.render_cache.invalidate()
+            if changes & {"logo_proxy", "logo_ttl", "logo_size"}:
+                self.logo_cache = self._create_logo_cache()
+            if changes & {"log_level", "log_levels", "log_format"}:
+                configure_from(self.config)
+            self.events.max_clients = self.config.events_max_clients
+            self.schedule.reconfigure(self._tick_interval(), self.config.update_jitter)
+            self.webhooks.urls = list(self.config.webhook_urls)
+            self.webhooks.secret = self.config.webhook_secret
+
+            removed = [lid for lid in old_lineups if lid not in self.config.lineups]
+            for lineup_id in removed:
+                self.render_cache.invalidate(lineup_id)
+                self.versions.forget(lineup_id)
+                self.demand.forget(lineup_id)
+                self._attempted.pop(lineup_id, None)
+                self.converter.remove_lineup(lineup_id)
+                self.indexes.pop(lineup_id, None)
+                self.lineup_files.pop(lineup_id, None)
+            logger.info("Configuration reloaded", extra={"settings": ",".join(sorted(changes))})
+
+            if self.cluster is not None and not self.cluster.is_leader:
+                return changes  # Followers pick up the leader's output
+
+            guide_data = self.converter.guide_data
+            fetch = [lid for lid in self.config.lineups if lid not in old_lineups]
+            render = [
+                lid
+                for lid in self.config.lineups
+                if lid in guide_data
+                and lid not in fetch
+                and (
+                    changes & (RENDER_SETTINGS | {"shards"})
+                    or self.converter.output_path(lid) != old_paths.get(lid)
+                )
+            ]
+            if self.last_update is None:
+                fetch = []  # The first refresh fetches every lineup anyway
+            if not (render or fetch or removed or "merged_output" in changes):
+                return changes
+
+            try:
+                self.lineup_files.update(self.converter.save_lineups(render, fetch))
+                self._build_indexes()
+                published_at = datetime.now(timezone.utc)
+                if self.cluster is not None:
+                    # A new timestamp makes followers pick up the changed files
+                    self.cluster.publish(
+                        self.lineup_files,
+                        published_at,
+                        merged_file=self.converter.merged_file,
                     )
-                else:
-                    print(f"XMLTV files updated successfully at {self.last_update}")
-                    for f in saved_files:
-                        print(f"  - {f}")
+                self._announce(render + fetch, published_at)
             except Exception as e:  # pylint: disable=broad-except
-                print(f"Error updating XMLTV file(s): {e}")
+                logger.error("Error applying configuration: %s", e)
+        return changes
+
+    def _config_watch_loop(self):
+        """Reload the configuration when the config file changes or on SIGHUP"""
+        stamp = _file_stamp(self.config.config_file) if self.config.config_file else None
+        while self.running:
+            self.reload_event.wait(self.config.config_poll_interval)
+            if not self.running:
+                break
+            requested = self.reload_event.is_set()
+            self.reload_event.clear()
+            current = _file_stamp(self.config.config_file) if self.config.config_file else None
+            if requested or current != stamp:
+                stamp = current
+                self.reload_config()
+
+    def _cluster_step(self):
+        """
+        Run one scheduling step in multi-replica mode.
+
+        Returns:
+            Seconds to wait before the next step
+        """
+        if not self.cluster.is_leader and self.cluster.try_acquire():
+            logger.info(
+                "Acquired leader lock; fetching guide data",
+                extra={"shared_dir": self.cluster.shared_dir},
+            )
+            # Adopt data published by a previous leader instead of refetching it
+            self._sync_from_manifest()
+            # Continue the previous leader's cadence
+            age = self.schedule.interval
+            if self.last_update is not None:
+                age = (datetime.now(timezone.utc) - self.last_update).total_seconds()
+            self.schedule.start(max(0, self.schedule.interval - age))
+
+        if not self.cluster.is_leader:
+            self._sync_from_manifest()
+            return self.config.follower_poll_interval
+
+        if self.schedule.due():
+            self._scheduled_update()
+        return self.schedule.wait()
 
     def _update_loop(self):
         """Background loop that periodically updates the XMLTV file"""
-        # Initial update
-        self._update_xmltv()
+        if self.cluster is not None:
+            while self.running:
+                if self.stop_event.wait(self._cluster_step()):
+                    break
+            return
+
+        # Serve the last saved guide immediately after a restart and only
+        # refetch once it is older than the update interval
+        self.schedule.start(self._load_snapshots())
 
         while self.running:
-            time.sleep(self.config.update_interval)
+            # Waiting on the stop event lets shutdown interrupt the interval
+            if self.stop_event.wait(self._next_wait()):
+                break
             if self.running:
-                self._update_xmltv()
+                self._scheduled_update()
 
     def start_update_thread(self):
         """Start the background update thread"""
         self.running = True
+        self.stop_event.clear()
         self.update_thread = threading.Thread(target=self._update_loop, daemon=True)
         self.update_thread.start()
+        self.reload_event.clear()
+        self.config_thread = threading.Thread(target=self._config_watch_loop, daemon=True)
+        self.config_thread.start()
 
     def stop_update_thread(self):
-        """Stop the background update thread"""
+        """Stop the background update thread
+
+        An in-progress update is given up to `shutdown_timeout` seconds to finish.
+        """
         self.running = False
+        self.stop_event.set()
+        self.reload_event.set()
+        if self.config_thread:
+            self.config_thread.join(timeout=self.config.shutdown_timeout)
         if self.update_thread:
-            self.update_thread.join(timeout=5)
+            self.update_thread.join(timeout=self.config.shutdown_timeout)
+        if self.cluster is not None:
+            self.cluster.release()
+        self.events.close()
+        self.webhooks.close()
+        self.converter.generator.close()
+
+    def serve(self):
+        """Serve HTTP requests with the configured server mode until shutdown"""
+        if self.config.server_mode == "waitress":
+            self._serve_waitress()
+        else:
+            self.app.run(host=self.config.host, port=self.config.port, debug=False)
+
+    def _serve_waitress(self):
+        """Serve with the waitress production WSGI server (optional dependency)"""
+        try:
+            # pylint: disable=import-outside-toplevel
+            from waitress import create_server, wasyncore
+        except ImportError as e:
+            raise RuntimeError(
+                "TVTV_SERVER=waitress requires the 'waitress' package "
+                "(install with: pip install 'tvtv2xmltv[production]')"
+            ) from e
+
+        socket_map = {}
+        self._serving_stopped.clear()
+        self._serving_thread = threading.current_thread()
+        self.http_server = create_server(
+            self.app,
+            map=socket_map,
+            host=self.config.host,
+            port=self.config.port,
+            threads=self.config.server_threads,
+            connection_limit=self.config.server_connection_limit,
+        )
+        self._install_signal_handlers()
+        logger.info(
+            "Serving with waitress",
+            extra={
+                "host": self.config.host,
+                "port": self.config.port,
+                "threads": self.config.server_threads,
+                "connection_limit": self.config.server_connection_limit,
+            },
+        )
+        # Runs until a shutdown signal or `shutdown()` (which wakes the loop
+        # through the server's trigger) stops it
+        adj = self.http_server.adj
+        try:
+            while socket_map and not self._serving_stopped.is_set():
+                wasyncore.loop(
+                    timeout=adj.asyncore_loop_timeout,
+                    use_poll=adj.asyncore_use_poll,
+                    map=socket_map,
+                    count=1,
+                )
+        except (SystemExit, KeyboardInterrupt):
+            pass
+        finally:
+            # End event streams so their threads are free, let in-flight
+            # requests finish, then close the sockets from this thread
+            self.events.close()
+            self.http_server.task_dispatcher.shutdown(timeout=self.config.shutdown_timeout)
+            with self._serving_lock:
+                self._serving_stopped.set()
+                wasyncore.close_all(socket_map)
+
+    def _install_signal_handlers(self):
+        """Translate SIGTERM into a clean exit of the serving loop"""
+        if threading.current_thread() is not threading.main_thread():
+            return
+
+        def _handle_sigterm(signum, frame):  # pylint: disable=unused-argument
+            logger.info("Received SIGTERM, shutting down")
+            raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, _handle_sigterm)
+
+    def _install_reload_handler(self):
+        """Reload the configuration on SIGHUP (where available)"""
+        if threading.current_thread() is not threading.main_thread():
+            return
+        if not hasattr(signal, "SIGHUP"):
+            return
+
+        def _handle_sighup(signum, frame):  # pylint: disable=unused-argument
+            logger.info("Received SIGHUP, reloading configuration")
+            self.reload_event.set()
+
+        signal.signal(signal.SIGHUP, _handle_sighup)
+
+    def shutdown(self):
+        """Stop accepting connections (production mode) and stop background updates"""
+        if self.http_server is not None:
+            with self._serving_lock:
+                if not self._serving_stopped.is_set():
+                    self._serving_stopped.set()
+                    self.http_server.pull_trigger()
+            serving_thread = self._serving_thread
+            if serving_thread is not None and serving_thread is not threading.current_thread():
+                serving_thread.join(self.config.shutdown_timeout + 5)
+        self.stop_update_thread()
 
     def run(self):
-        """Run the Flask server"""
+        """Run the HTTP server with background updates"""
+        self._install_reload_handler()
         self.start_update_thread()
         try:
-            self.app.run(host=self.config.host, port=self.config.port, debug=False)
+            self.serve()
         finally:
             self.stop_update_thread()
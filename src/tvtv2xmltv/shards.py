@@ -0,0 +1,91 @@
+"""
+Per-day guide shards named by content hash, with a manifest per lineup
+"""
+
+import hashlib
+import json
+import os
+import re
+from datetime import timedelta
+
+MANIFEST_NAME = "manifest.json"
+
+SHARD_NAME = re.compile(r"^[0-9a-f]{16}\.xml$")
+
+
+def day_dates(fetched_at, count):
+    """Dates (YYYY-MM-DD, UTC) of the fetched days of a guide"""
+    return [(fetched_at + timedelta(days=day)).strftime("%Y-%m-%d") for day in range(count)]
+
+
+def shard_name(data):
+    """File name of a shard: the start of the SHA-256 of its bytes"""
+    return hashlib.sha256(data).hexdigest()[:16] + ".xml"
+
+
+def read_manifest(directory):
+    """Return the manifest in a shard directory, or None if there is none"""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if isinstance(manifest, dict) else None
+
+
+def write_shards(directory, lineup_id, documents, fetched_at):
+    """
+    Write a lineup's per-day documents as shards and replace its manifest.
+
+    Shards whose content is unchanged keep their file, so a refresh only adds
+    files for the days that changed. Shards referenced by neither the new nor
+    the previous manifest are removed; keeping the previous ones lets clients
+    that just read the old manifest finish downloading.
+
+    Args:
+        directory: The lineup's shard directory
+        lineup_id: Lineup the documents belong to
+        documents: List of (date, XMLTV document string), one per day
+        fetched_at: When the guide data was fetched
+
+    Returns:
+        The new manifest
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = read_manifest(directory) or {}
+
+    days = []
+    for date, document in documents:
+        data = document.encode("utf-8")
+        name = shard_name(data)
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        days.append({"date": date, "file": name, "bytes": len(data)})
+
+    # The version changes whenever any shard does
+    version = hashlib.sha256("".join(day["file"] for day in days).encode("ascii"))
+    manifest = {
+        "lineup": lineup_id,
+        "version": version.hexdigest()[:16],
+        "fetched_at": fetched_at.isoformat(),
+        "days": days,
+    }
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+    keep = {day["file"] for day in days}
+    keep.update(day.get("file") for day in previous.get("days", []) if isinstance(day, dict))
+    for name in os.listdir(directory):
+        if SHARD_NAME.match(name) and name not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+    return manifest
@@ -0,0 +1,227 @@
+"""
+Binary snapshot format for fetched guide data
+
+Layout (little-endian):
+
+    magic "TVTVSNP1" | u32 version | u32 meta length | meta JSON
+    u32 string count | u32 offsets[count + 1] | UTF-8 string blob
+    u32 record count | records
+
+The meta JSON holds the lineup id, fetch time, channel digest, channel list and
+the number of programmes per channel per day. Each programme is a fixed-size
+record (start time as epoch seconds, run time, duration and string-table indexes
+for title, subtitle, type, flags and programme id), so titles repeated across
+days are stored once and the file can be read straight from a memory map.
+"""
+
+import json
+import mmap
+import os
+import struct
+from datetime import datetime, timezone
+
+MAGIC = b"TVTVSNP1"
+VERSION = 1
+
+_U32 = struct.Struct("<I")
+_RECORD = struct.Struct("<qIIIIIII")
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is missing, corrupt or of an unknown version"""
+
+
+def snapshot_path(xml_path):
+    """Return the snapshot path stored alongside an XMLTV file"""
+    return f"{os.path.splitext(xml_path)[0]}.snap"
+
+
+def _u32(value):
+    """A run time or duration as stored in a record (0 when missing or out of range)"""
+    try:
+        value = int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+    return value if 0 <= value <= 0xFFFFFFFF else 0
+
+
+def _text(value):
+    """A string field as stored in the string table ("" when missing or null)"""
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else str(value)
+
+
+def write_snapshot(path, lineup_id, guide):
+    """
+    Write a lineup's fetched data as a binary snapshot (atomically).
+
+    Args:
+        path: Destination path
+        lineup_id: The lineup ID
+        guide: Fetched data in the converter's `guide_data` layout
+    """
+    # pylint: disable=too-many-locals
+    strings = {}
+
+    def intern(value):
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    records = []
+    counts = []
+    for day_listings in guide["listings_by_day"]:
+        day_counts = []
+        for programs in day_listings:
+            written = 0
+            for program in programs:
+                try:
+                    start = datetime.fromisoformat(program["startTime"].replace("Z", "+00:00"))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                records.append(
+                    _RECORD.pack(
+                        int(start.timestamp()),
+                        _u32(program.get("runTime")),
+                        _u32(program.get("duration")),
+                        intern(_text(program.get("title"))),
+                        intern(_text(program.get("subtitle"))),
+                        intern(_text(program.get("type"))),
+                        intern(
+                            ",".join(_text(flag) for flag in program.get("flags") or [] if flag)
+                        ),
+                        intern(_text(program.get("programId"))),
+                    )
+                )
+                written += 1
+            day_counts.append(written)
+        counts.append(day_counts)
+
+    meta = json.dumps(
+        {
+            "lineup_id": lineup_id,
+            "fetched_at": guide["fetched_at"].isoformat(),
+            "channel_key": guide.get("channel_key"),
+            "channels": guide["lineup_data"],
+            "counts": counts,
+        }
+    ).encode("utf-8")
+
+    encoded = [value.encode("utf-8") for value in strings]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_U32.pack(VERSION))
+        f.write(_U32.pack(len(meta)))
+        f.write(meta)
+        f.write(_U32.pack(len(encoded)))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(b"".join(encoded))
+        f.write(_U32.pack(len(records)))
+        f.write(b"".join(records))
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    """
+    Load a snapshot into the converter's `guide_data` layout.
+
+    Args:
+        path: Snapshot path
+
+    Returns:
+        Dictionary with `lineup_id`, `lineup_data`, `listings_by_day`,
+        `channel_key` and `fetched_at` entries
+
+    Raises:
+        SnapshotError: If the file is missing or not a valid snapshot
+    """
+    # pylint: disable=too-many-locals
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            try:
+                return _parse(view)
+            finally:
+                view.release()
+    except (OSError, struct.error, IndexError, KeyError, TypeError, ValueError) as e:
+        if isinstance(e, SnapshotError):
+            raise
+        raise SnapshotError(f"Invalid snapshot {path}: {e}") from e
+
+
+def _parse(view):
+    """Parse a snapshot from a buffer"""
+    # pylint: disable=too-many-locals
+    if bytes(view[:8]) != MAGIC:
+        raise SnapshotError("Not a tvtv2xmltv snapshot")
+    (version,) = _U32.unpack_from(view, 8)
+    if version != VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+
+    (meta_len,) = _U32.unpack_from(view, 12)
+    pos = 16
+    meta = json.loads(bytes(view[pos : pos + meta_len]).decode("utf-8"))
+    pos += meta_len
+
+    (string_count,) = _U32.unpack_from(view, pos)
+    pos += 4
+    offsets = struct.unpack_from(f"<{string_count + 1}I", view, pos)
+    pos += 4 * (string_count + 1)
+    blob = bytes(view[pos : pos + offsets[-1]])
+    strings = [blob[offsets[i] : offsets[i + 1]].decode("utf-8") for i in range(string_count)]
+    flags = [value.split(",") if value else [] for value in strings]
+    pos += offsets[-1]
+
+    (record_count,) = _U32.unpack_from(view, pos)
+    pos += 4
+    if len(view) < pos + record_count * _RECORD.size:
+        raise SnapshotError("Truncated record table")
+    if sum(sum(day_counts) for day_counts in meta["counts"]) != record_count:
+        raise SnapshotError("Record count does not match the programme counts")
+    records = _RECORD.iter_unpack(view[pos : pos + record_count * _RECORD.size])
+
+    start_times = {}
+    listings_by_day = []
+    for day_counts in meta["counts"]:
+        day_listings = []
+        for count in day_counts:
+            programs = []
+            for _ in range(count):
+                start, run_time, duration, title, subtitle, kind, flag, program_id = next(records)
+                start_time = start_times.get(start)
+                if start_time is None:
+                    start_time = start_times[start] = datetime.fromtimestamp(
+                        start, timezone.utc
+                    ).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+                programs.append(
+                    {
+                        "programId": strings[program_id],
+                        "title": strings[title],
+                        "subtitle": strings[subtitle],
+                        "startTime": start_time,
+                        "duration": duration,
+                        "runTime": run_time,
+                        "type": strings[kind],
+                        "flags": flags[flag],
+                    }
+                )
+            day_listings.append(programs)
+        listings_by_day.append(day_listings)
+
+    return {
+        "lineup_id": meta["lineup_id"],
+        "lineup_data": meta["channels"],
+        "listings_by_day": listings_by_day,
+        "channel_key": meta.get("channel_key"),
+        "fetched_at": datetime.fromisoformat(meta["fetched_at"]),
+    }
@@ -2,47 +2,185 @@
 TVTV.us API client module
 """
 
+import logging
 import time
 
 import requests
 
+from .batch_tuner import AdaptiveBatchSizer
+from .circuit_breaker import OPEN, CircuitOpenError
+from .grid_stream import parse_grid
+from .profiling import Profiler
+from .scheduler import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
 
 class TVTVClient:
     """Client for interacting with the TVTV.us API"""
 
     BASE_URL = "https://www.tvtv.us/api/v1"
+    # Pauses that keep us under the upstream rate limits (also used by the planner).
+    # iptv-org uses 500ms after each request and it works; we use 750ms to be extra safe
+    REQUEST_DELAY = 0.75
+    BATCH_DELAY = 1.5
+    REQUEST_TIMEOUT = 30
 
-    def __init__(self, lineup_id, max_retries=3, retry_delay=2):
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(
+        self,
+        lineup_id,
+        max_retries=3,
+        retry_delay=2,
+        batch_sizer=None,
+        budget=None,
+        profiler=None,
+        breaker=None,
+        deadline=None,
+    ):
         self.lineup_id = lineup_id
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.batch_sizer = batch_sizer or AdaptiveBatchSizer()
+        # Optional RequestBudget charged for every request sent, including retries
+        self.budget = budget
+        # Optional CircuitBreaker shared by all clients of the same upstream
+        self.breaker = breaker
+        # Optional Deadline: no request is started, and no timeout or pause
+        # extends, past it
+        self.deadline = deadline
+        # Span timing for refresh profiling (no-op unless a session is recording)
+        self.profiler = profiler or Profiler()
+        # Observations from the most recent request, used to tune batch sizes
+        self.throttle_count = 0
+        self.last_latency = None
+        self.last_response_bytes = 0
+        # Strings shared by every programme this client ingests (titles, start times)
+        self.strings = {}
+
+    def _make_request(self, url, stream=False):
+        """
+        Make HTTP request with retry logic and rate limit handling.
+
+        With `stream`, the body is parsed as a grid response while it downloads
+        (see `grid_stream`) instead of being buffered and decoded as a whole.
+        """
+        try:
+            return self._send(url, stream)
+        finally:
+            # A probe cut short before it reached the upstream (budget,
+            # deadline) must not leave the breaker half-open for good
+            if self.breaker is not None:
+                self.breaker.release(self)
 
-    # pylint: disable=inconsistent-return-statements
-    def _make_request(self, url):
-        """Make HTTP request with retry logic and rate limit handling"""
+    # pylint: disable=inconsistent-return-statements,too-many-branches
+    def _send(self, url, stream):
         for attempt in range(self.max_retries):
+            if self.deadline is not None:
+                self.deadline.check()
+            if self.breaker is not None and not self.breaker.allow(self):
+                raise CircuitOpenError(f"Upstream circuit open; not requesting {url}")
+            if self.budget is not None:
+                self.budget.consume()  # Raises BudgetExceeded instead of sending
             try:
-                response = requests.get(url, timeout=30)
+                started = time.monotonic()
+                with self.profiler.span("http", url=url, attempt=attempt) as span:
+                    response = requests.get(url, timeout=self._timeout(), stream=stream)
+                    span.set(status=response.status_code)
 
                 # Handle rate limiting with exponential backoff
                 if response.status_code == 429:
+                    response.close()
+                    self.throttle_count += 1
                     if attempt < self.max_retries - 1:
+                        self._record_failure("HTTP 429")
+                        if self._circuit_open():
+                            response.raise_for_status()
                         # Exponential backoff: 5, 10, 20 seconds
                         wait_time = 5 * (2**attempt)
-                        print(f"Rate limited (429). Waiting {wait_time}s before retry...")
-                        time.sleep(wait_time)
+                        logger.warning(
+                            "Rate limited (429); waiting before retry",
+                            extra={"lineup": self.lineup_id, "attempt": attempt, "wait": wait_time},
+                        )
+                        self._backoff(wait_time)
                         continue
 
                 response.raise_for_status()
+                if stream:
+                    with self.profiler.span("ingest") as span:
+                        data, self.last_response_bytes = self._ingest(response)
+                        span.set(bytes=self.last_response_bytes)
+                else:
+                    self.last_response_bytes = len(response.content)
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                self.last_latency = time.monotonic() - started
 
                 # Delay after successful request to avoid rate limiting
-                # iptv-org uses 500ms and it works; we use 750ms to be extra safe
-                time.sleep(0.75)
-                return response.json()
-            except requests.RequestException:
-                if attempt == self.max_retries - 1:
+                with self.profiler.span("sleep"):
+                    self._pause(self.REQUEST_DELAY)
+                if stream:
+                    return data
+                with self.profiler.span("decode", bytes=self.last_response_bytes):
+                    return response.json()
+            except requests.RequestException as e:
+                if self.deadline is not None and self.deadline.expired:
+                    # Cut short by the deadline, not an upstream failure
+                    raise DeadlineExceeded(f"{e} (deadline reached)") from e
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                if status is not None and status < 500 and status != 429:
+                    # The upstream answered; the request itself was bad
+                    if self.breaker is not None:
+                        self.breaker.record_success()
+                elif not (status == 429 and attempt < self.max_retries - 1):
+                    self._record_failure(e)
+                # Don't keep retrying once the breaker has given up on the upstream
+                if attempt == self.max_retries - 1 or self._circuit_open():
                     raise
-                time.sleep(self.retry_delay * (attempt + 1))
+                self._backoff(self.retry_delay * (attempt + 1))
+
+    def _timeout(self):
+        if self.deadline is None:
+            return self.REQUEST_TIMEOUT
+        return self.deadline.cap(self.REQUEST_TIMEOUT)
+
+    def _pause(self, seconds):
+        """Sleep, but not past the deadline"""
+        time.sleep(seconds if self.deadline is None else self.deadline.cap(seconds))
+
+    def _backoff(self, seconds):
+        """Wait before a retry; gives up right away if the deadline would pass first"""
+        if self.deadline is not None:
+            self.deadline.check(margin=seconds)
+        time.sleep(seconds)
+
+    def _chunks(self, response):
+        """A response's body chunks, stopping at the deadline"""
+        for chunk in response.iter_content(64 * 1024):
+            if self.deadline is not None:
+                self.deadline.check()
+            yield chunk
+
+    def _ingest(self, response):
+        """Parse a streamed grid response, releasing the connection afterwards"""
+        try:
+            return parse_grid(self._chunks(response), response.encoding or "utf-8", self.strings)
+        except ValueError as e:
+            # Treated like a failed request: retried, and counted by the breaker
+            raise requests.exceptions.InvalidJSONError(f"Invalid grid response: {e}") from e
+        finally:
+            response.close()
+
+    def _record_failure(self, error):
+        if self.breaker is not None:
+            self.breaker.record_failure(error)
+
+    def _circuit_open(self):
+        return self.breaker is not None and self.breaker.state == OPEN
+
+    def probe(self):
+        """Send a single lightweight request (used to test a recovering upstream)"""
+        return self.get_lineup_channels()
 
     def get_lineup_channels(self):
         """Fetch channel lineup data"""
@@ -55,23 +193,62 @@ class TVTVClient:
         Channels should be a list of station IDs.
         Returns listing data.
         """
-        # Split channels into batches of 20 to avoid Cloudflare blocks
+        # Split channels into batches to avoid Cloudflare blocks. The batch size
+        # adapts to observed latency and throttling (starting at 20 stations).
         all_listings = []
-        for i in range(0, len(channels), 20):
-            batch = channels[i : i + 20]
+        i = 0
+        batch_number = 0
+        while i < len(channels):
+            batch = channels[i : i + self.batch_sizer.batch_size]
             channel_str = ",".join(str(ch) for ch in batch)
             url = (
                 f"{self.BASE_URL}/lineup/{self.lineup_id}/grid/"
                 f"{start_time}/{end_time}/{channel_str}"
             )
 
-            batch_data = self._make_request(url)
+            throttles_before = self.throttle_count
+            try:
+                batch_data = self._make_request(url, stream=True)
+            except requests.Timeout:
+                # Retry the same stations with a smaller batch, unless already minimal
+                if len(batch) <= self.batch_sizer.minimum:
+                    raise
+                self.batch_sizer.record_timeout()
+                logger.warning(
+                    "Grid request timed out; retrying with a smaller batch",
+                    extra={
+                        "lineup": self.lineup_id,
+                        "start": start_time,
+                        "batch": batch_number,
+                        "stations": self.batch_sizer.batch_size,
+                    },
+                )
+                continue
+
+            if self.throttle_count > throttles_before:
+                self.batch_sizer.record_throttle()
+            else:
+                self.batch_sizer.record_success(self.last_latency, self.last_response_bytes)
+
+            logger.debug(
+                "Fetched grid batch",
+                extra={
+                    "lineup": self.lineup_id,
+                    "start": start_time,
+                    "batch": batch_number,
+                    "stations": len(batch),
+                    "latency": self.last_latency,
+                    "bytes": self.last_response_bytes,
+                },
+            )
             if batch_data:
                 all_listings.extend(batch_data)
+            i += len(batch)
+            batch_number += 1
 
             # Delay between batches to avoid rate limiting
-            # We already have 750ms delay per request in _make_request
-            if i + 20 < len(channels):
-                time.sleep(1.5)
+            # We already have REQUEST_DELAY per request in _make_request
+            if i < len(channels):
+                self._pause(self.BATCH_DELAY)
 
         return all_listings
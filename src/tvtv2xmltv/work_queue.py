@@ -0,0 +1,340 @@
+"""
+Durable lineup x day fetch jobs shared by a coordinator and worker processes
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import namedtuple
+from contextlib import closing
+
+import requests
+
+from .circuit_breaker import CircuitOpenError
+from .request_budget import BudgetExceeded
+from .scheduler import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+FAILED = "failed"
+
+# One grid request window of a lineup: stations is the list of station ids
+Job = namedtuple(
+    "Job", ["id", "batch", "lineup", "day", "start_time", "end_time", "stations", "attempts"]
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch TEXT NOT NULL,
+    lineup TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    start_time TEXT NOT NULL,
+    end_time TEXT NOT NULL,
+    stations TEXT NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result BLOB,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch, lineup);
+"""
+
+
+def worker_identity(role="worker"):
+    """Identity recorded on claimed jobs"""
+    return f"{socket.gethostname()}:{os.getpid()}:{role}"
+
+
+class WorkQueue:
+    """Fetch jobs in an SQLite database
+
+    The coordinator adds one job per lineup and day to a batch; workers claim
+    jobs with a lease, renew it while fetching and store the grid data as the
+    result. A job whose lease expires (its worker died) is handed to the next
+    worker; a job that fails `max_attempts` times is marked failed. The database
+    can live on local disk for workers on one host, or on a shared filesystem
+    with working POSIX locks for workers on several nodes.
+    """
+
+    def __init__(self, path, lease=300, max_attempts=3):
+        self.path = os.path.abspath(path)
+        self.lease = lease
+        self.max_attempts = max(1, max_attempts)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        # A connection per operation: the queue is used from several threads
+        # and processes, and operations are few and small
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def start_batch(self):
+        """Start a refresh, dropping the jobs of earlier ones; returns the batch id"""
+        batch = uuid.uuid4().hex
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM jobs WHERE batch != ?", (batch,))
+        return batch
+
+    def finish_batch(self, batch):
+        """Drop a batch's jobs and results once its guides are assembled"""
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM jobs WHERE batch = ?", (batch,))
+
+    # pylint: disable=too-many-arguments
+    def enqueue(self, batch, lineup_id, day, start_time, end_time, stations):
+        """Add a job; returns its id"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (batch, lineup, day, start_time, end_time, stations, state,"
+                " created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    batch,
+                    lineup_id,
+                    day,
+                    start_time,
+                    end_time,
+                    json.dumps(stations),
+                    PENDING,
+                    time.time(),
+                ),
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker):
+        """
+        Claim the oldest pending job, or one whose lease has expired.
+
+        Returns:
+            The claimed Job, or None if there is nothing to do
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose workers keep disappearing are given up like failures
+                conn.execute(
+                    "UPDATE jobs SET state = ?, error = ?, worker = NULL"
+                    " WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                    (FAILED, "lease expired", CLAIMED, now, self.max_attempts),
+                )
+                row = conn.execute(
+                    "SELECT id, batch, lineup, day, start_time, end_time, stations, attempts"
+                    " FROM jobs WHERE state = ? OR (state = ? AND lease_until < ?)"
+                    " ORDER BY id LIMIT 1",
+                    (PENDING, CLAIMED, now),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET state = ?, worker = ?, lease_until = ?,"
+                    " attempts = attempts + 1 WHERE id = ?",
+                    (CLAIMED, worker, now + self.lease, row[0]),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return Job(*row[:6], json.loads(row[6]), row[7] + 1)
+
+    def renew(self, job_id, worker):
+        """Extend the lease of a claimed job; False if it was lost to another worker"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = ?",
+                (time.time() + self.lease, job_id, worker, CLAIMED),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker, listings):
+        """Store a job's grid data; False if the job was lost to another worker"""
+        result = zlib.compress(json.dumps(listings, separators=(",", ":")).encode("utf-8"))
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = NULL, lease_until = NULL"
+                " WHERE id = ? AND worker = ? AND state = ?",
+                (DONE, result, job_id, worker, CLAIMED),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker, error, retry=True):
+        """
+        Record a failed attempt: the job is retried until `max_attempts`.
+
+        Returns:
+            The job's new state (None if the job was lost to another worker)
+        """
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT attempts FROM jobs WHERE id = ? AND worker = ? AND state = ?",
+                    (job_id, worker, CLAIMED),
+                ).fetchone()
+                state = None
+                if row is not None:
+                    state = PENDING if retry and row[0] < self.max_attempts else FAILED
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, error = ?, worker = NULL, lease_until = NULL"
+                        " WHERE id = ?",
+                        (state, str(error), job_id),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return state
+
+    def progress(self, batch):
+        """Job counts of a batch: {lineup_id: {state: count}}"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT lineup, state, COUNT(*) FROM jobs WHERE batch = ? GROUP BY lineup, state",
+                (batch,),
+            ).fetchall()
+        progress = {}
+        for lineup_id, state, count in rows:
+            progress.setdefault(lineup_id, {})[state] = count
+        return progress
+
+    def results(self, batch, lineup_id):
+        """
+        Results of a lineup's jobs in day order.
+
+        Returns:
+            List of (day, listings or None, error or None) tuples
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT day, result, error FROM jobs WHERE batch = ? AND lineup = ? ORDER BY day",
+                (batch, lineup_id),
+            ).fetchall()
+        return [
+            (day, json.loads(zlib.decompress(result)) if result is not None else None, error)
+            for day, result, error in rows
+        ]
+
+    def status(self):
+        """Job counts by state, and the workers holding leases, for reporting"""
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+            workers = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT DISTINCT worker FROM jobs WHERE state = ? ORDER BY worker", (CLAIMED,)
+                )
+            ]
+        return {"jobs": counts, "workers": workers}
+
+
+class QueueWorker:
+    """Claim jobs from a WorkQueue and fetch their grid data
+
+    Args:
+        work_queue: The WorkQueue to take jobs from
+        create_client: Callable returning an API client for a lineup id
+        identity: Name recorded on claimed jobs (default: host, pid and role)
+    """
+
+    # Errors that fail an attempt; others (bugs) propagate
+    ERRORS = (
+        requests.RequestException,
+        CircuitOpenError,
+        BudgetExceeded,
+        DeadlineExceeded,
+        ValueError,
+    )
+
+    def __init__(self, work_queue, create_client, identity=None):
+        self.queue = work_queue
+        self.create_client = create_client
+        self.identity = identity or worker_identity()
+        self.jobs_done = 0
+        self._clients = {}
+        self._stop = threading.Event()
+
+    def run_once(self):
+        """
+        Claim and process one job.
+
+        Returns:
+            True if a job was processed, False if the queue had nothing to do
+        """
+        job = self.queue.claim(self.identity)
+        if job is None:
+            return False
+
+        finished = threading.Event()  # Stops the lease renewal
+        heartbeat = threading.Thread(target=self._renew_lease, args=(job, finished), daemon=True)
+        heartbeat.start()
+        started = time.monotonic()
+        try:
+            client = self._clients.get(job.lineup)
+            if client is None:
+                client = self._clients[job.lineup] = self.create_client(job.lineup)
+            listings = client.get_grid_data(job.start_time, job.end_time, job.stations)
+        except self.ERRORS as e:
+            state = self.queue.fail(
+                job.id, self.identity, e, retry=not isinstance(e, BudgetExceeded)
+            )
+            logger.warning(
+                "Fetch job failed: %s",
+                e,
+                extra={
+                    "lineup": job.lineup,
+                    "day": job.day,
+                    "attempt": job.attempts,
+                    "state": state,
+                },
+            )
+            return True
+        finally:
+            finished.set()
+            heartbeat.join()
+
+        if self.queue.complete(job.id, self.identity, listings or []):
+            self.jobs_done += 1
+        logger.info(
+            "Fetch job done",
+            extra={
+                "lineup": job.lineup,
+                "day": job.day,
+                "stations": len(job.stations),
+                "seconds": time.monotonic() - started,
+            },
+        )
+        return True
+
+    def _renew_lease(self, job, done):
+        while not done.wait(self.queue.lease / 3):
+            if not self.queue.renew(job.id, self.identity):
+                return
+
+    def run(self, idle_wait=2.0):
+        """Process jobs until `stop` is called, polling every `idle_wait` seconds when idle"""
+        self._stop.clear()
+        logger.info("Worker started", extra={"worker": self.identity, "queue": self.queue.path})
+        while not self._stop.is_set():
+            if not self.run_once():
+                self._stop.wait(idle_wait)
+
+    def stop(self):
+        """Stop `run` after the current job"""
+        self._stop.set()
@@ -3,19 +3,70 @@ XMLTV format generator module
 """
 
 from datetime import datetime, timedelta
-from xml.sax.saxutils import escape  # nosec B406 - We're generating XML, not parsing it
 import pytz
 
+from .escaping import escape_attr, escape_text, memoize
+from .logo_cache import logo_name, upstream_logo_url
+from .profiling import Profiler
+
+# Generators reused by render worker processes, keyed by rendering options
+_WORKER_GENERATORS = {}
+
+
+def _render_shard(task):
+    """Render the programme elements of one channel x day shard (worker process)"""
+    timezone, stream_base_url, channels, channel_listings = task
+    key = (timezone, stream_base_url)
+    generator = _WORKER_GENERATORS.get(key)
+    if generator is None:
+        generator = _WORKER_GENERATORS[key] = XMLTVGenerator(timezone, stream_base_url)
+    return "\r\n".join(
+        generator._generate_programme(program, channel)  # pylint: disable=protected-access
+        for channel, programs in zip(channels, channel_listings)
+        for program in programs
+    )
+
 
 class XMLTVGenerator:
     """Generate XMLTV format from TVTV data"""
 
-    def __init__(self, timezone="America/New_York", stream_base_url=None):
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(
+        self,
+        timezone="America/New_York",
+        stream_base_url=None,
+        render_workers=0,
+        parallel_threshold=10000,
+        profiler=None,
+        logo_base_url=None,
+    ):
+        # pylint: disable=too-many-arguments
         self.timezone = timezone
         self.tz = pytz.timezone(timezone)
         self.stream_base_url = stream_base_url
+        # Serve icons from the local logo proxy (e.g. http://host:8080/logos)
+        self.logo_base_url = logo_base_url
+        # Rendered <channel> blocks keyed by the caller-supplied channel digest
+        self._channel_blocks = {}
+        # Opt-in process pool for large guides (render_workers > 1)
+        self.render_workers = render_workers
+        self.parallel_threshold = parallel_threshold
+        self._pool = None
+        # Span timing for refresh profiling (no-op unless a session is recording)
+        self.profiler = profiler or Profiler()
+        # Escaped forms of repeated strings (titles, call signs, channel ids, durations)
+        self._text = memoize(escape_text)
+        self._attr = memoize(escape_attr)
 
-    def generate(self, lineup_data, listings_by_day, source_url="http://localhost:8080"):
+    def generate(
+        self,
+        lineup_data,
+        listings_by_day,
+        source_url="http://localhost:8080",
+        channel_key=None,
+        date=None,
+    ):
         """
         Generate complete XMLTV document.
 
@@ -23,52 +74,140 @@ class XMLTVGenerator:
             lineup_data: List of channel dictionaries
             listings_by_day: List of daily listings (each day is a list of channel listings)
             source_url: URL of the data source
+            channel_key: Optional digest identifying `lineup_data`; when given, the
+                rendered channel elements are reused until the digest changes
+            date: Day (YYYY-MM-DD) for the <tv date> attribute (default: today)
 
         Returns:
             String containing complete XMLTV document
         """
         lines = []
-        now = datetime.now(self.tz)
-        start_time = now.strftime("%Y-%m-%dT00:00:00.000Z")
+        if date is None:
+            date = datetime.now(self.tz).strftime("%Y-%m-%d")
+        start_time = f"{date}T00:00:00.000Z"
 
         # XML header
         lines.append('<?xml version="1.0" encoding="UTF-8"?>')
         lines.append(
-            f'<tv date="{start_time}" source-info-url="{escape(source_url)}" '
+            f'<tv date="{start_time}" source-info-url="{escape_attr(source_url)}" '
             f'source-info-name="tvtv2xmltv">'
         )
 
         # Add channels
-        for channel in lineup_data:
-            lines.append(self._generate_channel(channel))
+        with self.profiler.span("channels", channels=len(lineup_data)):
+            lines.extend(self._channel_block(lineup_data, channel_key))
 
         # Add programs
-        for day_listings in listings_by_day:
-            for channel_idx, channel in enumerate(lineup_data):
-                if channel_idx < len(day_listings):
-                    for program in day_listings[channel_idx]:
-                        lines.append(self._generate_programme(program, channel))
+        parallel = self._use_pool(listings_by_day)
+        with self.profiler.span("programmes", parallel=parallel) as span:
+            count = len(lines)
+            if parallel:
+                lines.extend(self._render_parallel(lineup_data, listings_by_day))
+            else:
+                for day_listings in listings_by_day:
+                    for channel_idx, channel in enumerate(lineup_data):
+                        if channel_idx < len(day_listings):
+                            for program in day_listings[channel_idx]:
+                                lines.append(self._generate_programme(program, channel))
+            span.set(fragments=len(lines) - count)
 
         lines.append("</tv>")
-        return "\r\n".join(lines)
+        with self.profiler.span("join"):
+            return "\r\n".join(lines)
+
+    def _use_pool(self, listings_by_day):
+        """Return True if the guide is large enough to render in the process pool"""
+        if self.render_workers <= 1:
+            return False
+        total = sum(len(programs) for day in listings_by_day for programs in day)
+        return total >= self.parallel_threshold
+
+    def _render_parallel(self, lineup_data, listings_by_day):
+        """
+        Render programme elements across the process pool.
+
+        Channels are split into contiguous shards per day; shard results are
+        yielded in canonical (day, channel) order so the output is identical to
+        serial rendering.
+        """
+        if self._pool is None:
+            # Imported here: most guides never reach the parallel threshold
+            # pylint: disable=import-outside-toplevel
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # Spawned (not forked) workers: the server process runs other threads
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.render_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+        shard_size = max(1, -(-len(lineup_data) // (self.render_workers * 2)))
+        tasks = []
+        for day_listings in listings_by_day:
+            channel_count = min(len(lineup_data), len(day_listings))
+            for start in range(0, channel_count, shard_size):
+                end = min(start + shard_size, channel_count)
+                tasks.append(
+                    (
+                        self.timezone,
+                        self.stream_base_url,
+                        lineup_data[start:end],
+                        day_listings[start:end],
+                    )
+                )
+
+        for fragment in self._pool.map(_render_shard, tasks):
+            if fragment:
+                yield fragment
+
+    def close(self):
+        """Shut down the render process pool, if one was started"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _channel_block(self, lineup_data, channel_key):
+        """Return rendered channel elements, memoised by channel digest"""
+        if channel_key is None:
+            return [self._generate_channel(channel) for channel in lineup_data]
+
+        block = self._channel_blocks.get(channel_key)
+        if block is None:
+            if len(self._channel_blocks) >= 64:
+                self._channel_blocks.clear()
+            block = [self._generate_channel(channel) for channel in lineup_data]
+            self._channel_blocks[channel_key] = block
+        return block
 
     def _generate_channel(self, channel):
         """Generate channel element"""
-        channel_num = escape(str(channel["channelNumber"]))
-        call_sign = escape(channel["stationCallSign"])
-        logo = escape(f"https://www.tvtv.us{channel['logo']}")
+        channel_num = self._text(channel["channelNumber"])
+        # Merged guides assign an explicit id where channel numbers collide
+        channel_id = self._attr(channel.get("xmltvId", channel["channelNumber"]))
+        call_sign = self._text(channel["stationCallSign"])
+        icon_part = ""
+        logo = upstream_logo_url(channel.get("logo"))
+        if logo:
+            if self.logo_base_url:
+                logo = f"{self.logo_base_url}/{logo_name(logo)}"
+            icon_part = f'<icon src="{escape_attr(logo)}" />'
 
         url_part = ""
         if self.stream_base_url:
-            # For HD Home Run, streams are at {base}/auto/v{channel}
-            stream_url = escape(f"{self.stream_base_url}/auto/v{channel_num}")
-            url_part = f"<url>{stream_url}</url>"
+            if "{channel}" in self.stream_base_url:
+                stream_url = self.stream_base_url.replace(
+                    "{channel}", str(channel["channelNumber"])
+                )
+            else:
+                # For HD Home Run, streams are at {base}/auto/v{channel}
+                stream_url = f"{self.stream_base_url}/auto/v{channel['channelNumber']}"
+            url_part = f"<url>{escape_text(stream_url)}</url>"
 
         return (
-            f'<channel id="{channel_num}">'
+            f'<channel id="{channel_id}">'
             f"<display-name>{channel_num}</display-name>"
             f"<display-name>{call_sign}</display-name>"
-            f'<icon src="{logo}" />'
+            f"{icon_part}"
             f"{url_part}"
             f"</channel>"
         )
@@ -88,15 +227,15 @@ class XMLTVGenerator:
         start_str = start_dt_local.strftime("%Y%m%d%H%M%S %z")
         end_str = end_dt_local.strftime("%Y%m%d%H%M%S %z")
 
-        channel_num = escape(str(channel["channelNumber"]))
-        duration = escape(str(program["duration"]))
-        title = escape(program["title"])
-        subtitle = escape(program.get("subtitle", ""))
+        channel_id = self._attr(channel.get("xmltvId", channel["channelNumber"]))
+        duration = self._attr(program["duration"])
+        title = self._text(program["title"])
+        subtitle = self._text(program.get("subtitle") or "")
 
         lines = []
         lines.append(
             f'<programme start="{start_str}" stop="{end_str}" '
-            f'duration="{duration}" channel="{channel_num}">'
+            f'duration="{duration}" channel="{channel_id}">'
         )
         lines.append(f'<title lang="en">{title}</title>')
 
@@ -0,0 +1,56 @@
+"""
+Tests for the adaptive batch sizer
+"""
+
+from tvtv2xmltv.batch_tuner import AdaptiveBatchSizer
+
+
+def test_grows_on_fast_success():
+    """Fast, small responses grow the batch size up to the maximum"""
+    sizer = AdaptiveBatchSizer(initial=20, maximum=30, step=5)
+    sizer.record_success(0.5, 1000)
+    assert sizer.batch_size == 25
+    sizer.record_success(0.5, 1000)
+    sizer.record_success(0.5, 1000)
+    assert sizer.batch_size == 30
+
+
+def test_shrinks_on_throttle_timeout_and_large_responses():
+    """Throttling, timeouts, slow and oversized responses halve the batch size"""
+    sizer = AdaptiveBatchSizer(initial=40, minimum=5, max_response_bytes=100)
+    sizer.record_throttle()
+    assert sizer.batch_size == 20
+    sizer.record_timeout()
+    assert sizer.batch_size == 10
+    sizer.record_success(0.1, 1000)
+    assert sizer.batch_size == 5
+    sizer.record_success(60.0, 10)
+    assert sizer.batch_size == 5
+
+
+def test_moderate_latency_keeps_size():
+    """Latency between the fast and slow thresholds leaves the size unchanged"""
+    sizer = AdaptiveBatchSizer(initial=20, fast_latency=1.0, slow_latency=10.0)
+    sizer.record_success(5.0, 1000)
+    assert sizer.batch_size == 20
+
+
+def test_persistence_per_lineup(tmp_path):
+    """Learned batch sizes are persisted per lineup"""
+    path = str(tmp_path / "state" / "batch_sizes.json")
+
+    sizer = AdaptiveBatchSizer.load(path, "USA-ONE", initial=20)
+    sizer.record_success(0.1)
+    sizer.save(path, "USA-ONE")
+
+    assert AdaptiveBatchSizer.load(path, "USA-ONE", initial=20).batch_size == 25
+    assert AdaptiveBatchSizer.load(path, "USA-TWO", initial=20).batch_size == 20
+    # Persisted values are clamped to the current limits
+    assert AdaptiveBatchSizer.load(path, "USA-ONE", initial=20, maximum=22).batch_size == 22
+
+
+def test_load_ignores_corrupt_state(tmp_path):
+    """A corrupt state file falls back to the initial batch size"""
+    path = tmp_path / "batch_sizes.json"
+    path.write_text("not json", encoding="utf-8")
+    assert AdaptiveBatchSizer.load(str(path), "USA-ONE", initial=15).batch_size == 15
@@ -0,0 +1,97 @@
+"""
+Tests for the channel lineup metadata cache
+"""
+
+import json
+
+import pytest
+from tvtv2xmltv.channel_cache import ChannelCache
+
+CHANNELS = [{"channelNumber": "2.1", "stationId": 12345, "stationCallSign": "WABC"}]
+
+
+class CountingFetch:
+    """Fetch callable that records how often it was called"""
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_fresh_entry_is_reused():
+    """Channels are fetched once while the entry is within its TTL"""
+    cache = ChannelCache(ttl=3600)
+    fetch = CountingFetch(CHANNELS)
+
+    channels, digest = cache.get("USA-ONE", fetch)
+    again, again_digest = cache.get("USA-ONE", fetch)
+
+    assert channels == CHANNELS
+    assert again == CHANNELS
+    assert digest == again_digest
+    assert fetch.calls == 1
+
+
+def test_persisted_across_instances(tmp_path):
+    """Cached lineups are shared through the cache directory"""
+    ChannelCache(str(tmp_path), ttl=3600).get("USA-ONE", CountingFetch(CHANNELS))
+
+    fetch = CountingFetch([])
+    channels, _ = ChannelCache(str(tmp_path), ttl=3600).get("USA-ONE", fetch)
+    assert channels == CHANNELS
+    assert fetch.calls == 0
+
+
+def test_expired_entry_detects_changes():
+    """An expired entry is refetched and the digest reflects changes"""
+    cache = ChannelCache(ttl=0)
+    _, digest = cache.get("USA-ONE", CountingFetch(CHANNELS))
+
+    changed = CHANNELS + [{"channelNumber": "4.1", "stationId": 1, "stationCallSign": "WNBC"}]
+    channels, new_digest = cache.get("USA-ONE", CountingFetch(changed))
+    assert channels == changed
+    assert new_digest != digest
+
+    _, same_digest = cache.get("USA-ONE", CountingFetch(changed))
+    assert same_digest == new_digest
+
+
+def test_failed_refetch_serves_stale_entry():
+    """A failing refetch falls back to the expired cached lineup"""
+    cache = ChannelCache(ttl=3600)
+    _, digest = cache.get("USA-ONE", CountingFetch(CHANNELS))
+    cache.invalidate("USA-ONE")
+    assert not cache.is_fresh("USA-ONE")
+
+    channels, stale_digest = cache.get("USA-ONE", CountingFetch(RuntimeError("down")))
+    assert channels == CHANNELS
+    assert stale_digest == digest
+
+    with pytest.raises(RuntimeError):
+        cache.get("USA-TWO", CountingFetch(RuntimeError("down")))
+
+
+@pytest.mark.parametrize(
+    "entry",
+    [
+        {"fetched_at": 9e99, "channels": CHANNELS},
+        {"fetched_at": 9e99, "digest": None, "channels": CHANNELS},
+        {"digest": "abc", "channels": CHANNELS},
+        ["not", "an", "entry"],
+    ],
+)
+def test_invalid_persisted_entries_are_refetched(tmp_path, entry):
+    """Entries from older versions or partial writes count as missing"""
+    (tmp_path / "USA-ONE.json").write_text(json.dumps(entry), encoding="utf-8")
+    cache = ChannelCache(str(tmp_path), ttl=3600)
+    fetch = CountingFetch(CHANNELS)
+
+    assert cache.peek("USA-ONE") is None
+    channels, digest = cache.get("USA-ONE", fetch)
+    assert channels == CHANNELS and digest and fetch.calls == 1
@@ -0,0 +1,58 @@
+"""
+Tests for the upstream circuit breaker
+"""
+
+from tvtv2xmltv.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class FakeClock:
+    """Controllable replacement for time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_consecutive_failures(monkeypatch):
+    """The circuit opens at the threshold; successes reset the count"""
+    monkeypatch.setattr("tvtv2xmltv.circuit_breaker.time.monotonic", FakeClock())
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+
+    breaker.record_failure("HTTP 503")
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    status = breaker.status()
+    assert status["retry_in"] == 60
+    assert status["last_error"] == "HTTP 503"
+
+
+def test_single_probe_after_timeout(monkeypatch):
+    """One probe is allowed after the timeout; a failed probe doubles the wait"""
+    clock = FakeClock()
+    monkeypatch.setattr("tvtv2xmltv.circuit_breaker.time.monotonic", clock)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, max_reset_timeout=100)
+    breaker.record_failure()
+
+    clock.now += 60
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # Only one probe at a time
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.retry_in() == 100  # Doubled, capped at max_reset_timeout
+
+    clock.now += 100
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.status()["opened_at"] is None
@@ -0,0 +1,80 @@
+"""
+Tests for leader election and shared guide storage
+"""
+
+import pytest
+from tvtv2xmltv.cluster import ClusterCoordinator
+from tvtv2xmltv.config import Config
+from tvtv2xmltv.server import XMLTVServer
+
+
+@pytest.fixture
+def cluster_config(tmp_path):
+    """Mock-mode configuration sharing a directory between replicas"""
+    config = Config()
+    config.lineups = ["luUSA-OTA85142"]
+    config.lineup_id = "luUSA-OTA85142"
+    config.mock_mode = True
+    config.days = 1
+    config.shared_dir = str(tmp_path / "shared")
+    config.update_interval = 3600
+    return config
+
+
+def test_single_leader(tmp_path):
+    """Only one coordinator holds the leader lock at a time"""
+    first = ClusterCoordinator(str(tmp_path))
+    second = ClusterCoordinator(str(tmp_path))
+
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert first.is_leader and not second.is_leader
+
+    first.release()
+    assert second.try_acquire()
+    second.release()
+
+
+def test_follower_serves_leader_data(cluster_config):
+    """Followers hot-swap to the leader's published guide without fetching"""
+    leader = XMLTVServer(cluster_config)
+    follower = XMLTVServer(cluster_config)
+
+    wait = leader._cluster_step()
+    # The next refresh is one interval (plus jitter) after this one started
+    assert 0 < wait <= cluster_config.update_interval + cluster_config.update_jitter
+    assert leader._role() == "leader"
+    manifest = leader.cluster.read_manifest()
+    assert "luUSA-OTA85142" in manifest["lineups"]
+
+    def fail_fetch():
+        raise AssertionError("followers must not fetch")
+
+    follower.converter.save_to_file = fail_fetch
+    assert follower._cluster_step() == cluster_config.follower_poll_interval
+    follower._update_xmltv()
+
+    assert follower._role() == "follower"
+    assert follower.last_update == leader.last_update
+    client = follower.app.test_client()
+    assert client.get("/health").get_json()["role"] == "follower"
+    assert client.get("/").get_data(as_text=True).startswith("<?xml")
+    assert client.get("/luUSA-OTA85142/now?at=2025-12-28T20:30:00Z").status_code == 200
+
+    leader.stop_update_thread()
+
+
+def test_new_leader_adopts_fresh_data(cluster_config):
+    """A replica taking over leadership does not refetch fresh data"""
+    leader = XMLTVServer(cluster_config)
+    leader._cluster_step()
+    leader.stop_update_thread()
+
+    successor = XMLTVServer(cluster_config)
+    successor.converter.save_to_file = lambda: pytest.fail("fresh data must not be refetched")
+    wait = successor._cluster_step()
+
+    assert successor._role() == "leader"
+    assert 0 < wait <= cluster_config.update_interval
+    assert successor.last_update == leader.last_update
+    successor.stop_update_thread()
@@ -3,6 +3,8 @@ Tests for the configuration module
 """
 
 import os
+
+import pytest
 from tvtv2xmltv.config import Config
 
 
@@ -86,3 +88,58 @@ def test_config_days_validation():
     assert config.days == 1
 
     os.environ.pop("TVTV_DAYS", None)
+
+
+def test_config_server_mode():
+    """Test serving mode selection and limits"""
+    os.environ["TVTV_SERVER"] = "Waitress"
+    os.environ["TVTV_SERVER_THREADS"] = "0"
+    config = Config()
+    assert config.server_mode == "waitress"
+    assert config.server_threads == 1
+
+    os.environ["TVTV_SERVER"] = "bogus"
+    config = Config()
+    assert config.server_mode == "flask"
+
+    os.environ.pop("TVTV_SERVER", None)
+    os.environ.pop("TVTV_SERVER_THREADS", None)
+
+
+def test_config_file_overrides_environment(tmp_path):
+    """Settings from TVTV_CONFIG_FILE override the environment"""
+    path = tmp_path / "tvtv.env"
+    path.write_text(
+        "# Guide settings\n"
+        "TVTV_LINEUPS=USA-ONE,USA-TWO\n"
+        'export TVTV_STREAM_BASE_URL="http://tuner:5004"\n'
+        "\n"
+        "TVTV_DAYS='3'\n",
+        encoding="utf-8",
+    )
+    environ = {"TVTV_CONFIG_FILE": str(path), "TVTV_DAYS": "5", "TVTV_PORT": "9090"}
+
+    config = Config(environ)
+    assert config.config_file == str(path)
+    assert config.lineups == ["USA-ONE", "USA-TWO"]
+    assert config.stream_base_url == "http://tuner:5004"
+    assert config.days == 3
+    assert config.port == 9090
+
+
+def test_config_file_errors(tmp_path):
+    """Unreadable or malformed config files raise"""
+    path = tmp_path / "tvtv.env"
+    path.write_text("TVTV_DAYS=3\nnot a setting\n", encoding="utf-8")
+    with pytest.raises(ValueError, match=":2:"):
+        Config({"TVTV_CONFIG_FILE": str(path)})
+    with pytest.raises(OSError):
+        Config({"TVTV_CONFIG_FILE": str(tmp_path / "missing.env")})
+
+
+def test_config_diff():
+    """Diff names the settings that differ"""
+    config = Config({})
+    other = Config({"TVTV_LINEUPS": "USA-ONE", "TVTV_TIMEZONE": "UTC"})
+    assert config.diff(config) == set()
+    assert config.diff(other) == {"lineups", "lineup_id", "timezone"}
@@ -8,6 +8,7 @@ import pytest
 import responses
 from tvtv2xmltv.config import Config
 from tvtv2xmltv.converter import TVTVConverter
+from tvtv2xmltv.scheduler import Deadline
 
 
 @pytest.fixture
@@ -76,3 +77,166 @@ def test_converter_full_flow(test_config):
     assert '<channel id="2.1">' in result
     assert "WABC" in result
     assert "</tv>" in result
+
+
+@responses.activate
+def test_converter_reuses_cached_channels(test_config):
+    """Channel lineups are fetched once and reused across refreshes"""
+    responses.add(
+        responses.GET,
+        "https://www.tvtv.us/api/v1/lineup/USA-TEST12345/channels",
+        json=[{"channelNumber": "2.1", "stationId": 1, "stationCallSign": "WABC", "logo": "/l"}],
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        re.compile(r"https://www.tvtv.us/api/v1/lineup/USA-TEST12345/grid/.*"),
+        json=[[]],
+        status=200,
+    )
+
+    converter = TVTVConverter(test_config)
+    converter.convert()
+    converter.convert()
+
+    channel_calls = [c for c in responses.calls if c.request.url.endswith("/channels")]
+    assert len(channel_calls) == 1
+
+
+@responses.activate
+def test_converter_request_budget(test_config, monkeypatch):
+    """The budget limits the days fetched, then keeps stale data"""
+    monkeypatch.setattr("tvtv2xmltv.tvtv_client.time.sleep", lambda _: None)
+    responses.add(
+        responses.GET,
+        "https://www.tvtv.us/api/v1/lineup/USA-TEST12345/channels",
+        json=[{"channelNumber": "2.1", "stationId": 1, "stationCallSign": "WABC", "logo": "/l"}],
+        status=200,
+    )
+    responses.add(
+        responses.GET,
+        re.compile(r"https://www.tvtv.us/api/v1/lineup/USA-TEST12345/grid/.*"),
+        json=[[]],
+        status=200,
+    )
+    test_config.days = 4
+    test_config.request_budget_hour = 3
+
+    converter = TVTVConverter(test_config)
+    guide = converter.fetch_lineup("USA-TEST12345")
+    # One request for the channels leaves room for two of the four days
+    assert len(guide["listings_by_day"]) == 2
+    assert converter.budget.remaining() == 0
+
+    # With the budget exhausted, the previously fetched data is kept
+    assert converter.fetch_lineup("USA-TEST12345") is guide
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_converter_keeps_stale_data_during_outage(test_config, monkeypatch):
+    """Once the circuit opens, refreshes keep the last guide without requests"""
+    monkeypatch.setattr("tvtv2xmltv.tvtv_client.time.sleep", lambda _: None)
+    responses.add(
+        responses.GET,
+        "https://www.tvtv.us/api/v1/lineup/USA-TEST12345/channels",
+        json=[{"channelNumber": "2.1", "stationId": 1, "stationCallSign": "WABC", "logo": "/l"}],
+        status=200,
+    )
+    grid = responses.add(
+        responses.GET,
+        re.compile(r"https://www.tvtv.us/api/v1/lineup/USA-TEST12345/grid/.*"),
+        json=[[]],
+        status=200,
+    )
+    test_config.breaker_threshold = 2
+    converter = TVTVConverter(test_config)
+    guide = converter.fetch_lineup("USA-TEST12345")
+
+    # Upstream outage
+    grid.status = 503
+    assert converter.fetch_lineup("USA-TEST12345") is guide
+    assert converter.breaker.state == "open"
+    assert "USA-TEST12345" in converter.stale
+
+    calls = len(responses.calls)
+    assert converter.fetch_lineup("USA-TEST12345") is guide
+    assert len(responses.calls) == calls
+
+
+def test_deadline_publishes_days_fetched_so_far(test_config, monkeypatch):
+    """Test that days missed at the deadline are taken from the previous data"""
+    test_config.lineups = ["luUSA-OTA85142"]
+    test_config.mock_mode = True
+    test_config.days = 4
+    converter = TVTVConverter(test_config)
+    previous = converter.fetch_lineup("luUSA-OTA85142")
+    assert len(previous["listings_by_day"]) == 4
+
+    # The deadline passes while the third day is being fetched
+    clock = [0.0]
+    monkeypatch.setattr(
+        "tvtv2xmltv.converter.Deadline",
+        lambda seconds, name: Deadline(seconds, name, clock=lambda: clock[0]),
+    )
+    # Each mock request takes a second
+    monkeypatch.setattr(
+        "tvtv2xmltv.mock_client.time.sleep", lambda seconds: clock.__setitem__(0, clock[0] + 1)
+    )
+    test_config.refresh_deadline = 2.5
+    with converter._refresh_deadline():  # pylint: disable=protected-access
+        guide = converter.fetch_lineup("luUSA-OTA85142")
+    assert guide is not previous
+    assert len(guide["listings_by_day"]) == 4
+    assert guide["listings_by_day"][2] is previous["listings_by_day"][2]
+    assert "after 2 of 4 days" in converter.stale["luUSA-OTA85142"]
+
+    # Past the deadline before any day, the previous data is kept as a whole
+    test_config.refresh_deadline = 1
+    with converter._refresh_deadline():  # pylint: disable=protected-access
+        assert converter.fetch_lineup("luUSA-OTA85142") is guide
+    assert "Refresh deadline of 1s" in converter.stale["luUSA-OTA85142"]
+
+
+def test_corrupt_history_does_not_stop_publishing(test_config, tmp_path, monkeypatch):
+    """Test that an unreadable archive is logged and the other lineups are still archived"""
+    monkeypatch.chdir(tmp_path)  # Multiple lineups are written to the current directory
+    test_config.lineups = ["luUSA-OTA85142", "luUSA-AZ02490-X"]
+    test_config.mock_mode = True
+    test_config.snapshots = False
+    test_config.history_dir = str(tmp_path / "history")
+    converter = TVTVConverter(test_config)
+    converter.LINEUP_DELAY = 0
+    (tmp_path / "history").mkdir()
+    (tmp_path / "history" / "luUSA-OTA85142.hist").write_bytes(b"not an archive")
+
+    saved = converter.save_lineups(fetch_ids=test_config.lineups)
+    assert sorted(saved) == sorted(test_config.lineups)
+    assert (tmp_path / "luUSA-AZ02490-X.xml").exists()
+    assert len(converter.history.entries("luUSA-AZ02490-X")) == 1
+
+
+def test_empty_days_keep_their_place(test_config, monkeypatch):
+    """Test that a day without listings does not shift later days to earlier dates"""
+    test_config.lineups = ["luUSA-OTA85142"]
+    test_config.mock_mode = True
+    test_config.days = 3
+    converter = TVTVConverter(test_config)
+    original = converter.create_client
+    days = []
+
+    def client_with_empty_day(lineup_id):
+        client = original(lineup_id)
+        get_grid_data = client.get_grid_data
+
+        def grid(start_time, end_time, channels):
+            days.append(start_time)
+            return [] if len(days) == 2 else get_grid_data(start_time, end_time, channels)
+
+        client.get_grid_data = grid
+        return client
+
+    monkeypatch.setattr(converter, "create_client", client_with_empty_day)
+    listings_by_day = converter.fetch_lineup("luUSA-OTA85142")["listings_by_day"]
+    assert len(listings_by_day) == 3
+    assert listings_by_day[1] == [] and listings_by_day[2]
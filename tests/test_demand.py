@@ -0,0 +1,34 @@
+"""
+Tests for demand tracking
+"""
+
+import pytest
+
+from tvtv2xmltv.demand import DemandTracker, refresh_interval
+
+
+def test_refresh_interval_follows_request_rate():
+    """Test that busier lineups refresh more often, within the limits"""
+    assert refresh_interval(6, 3600, 900, 14400, 6) == 3600
+    assert refresh_interval(12, 3600, 900, 14400, 6) == 1800
+    assert refresh_interval(600, 3600, 900, 14400, 6) == 900
+    assert refresh_interval(1, 3600, 900, 14400, 6) == 14400
+    assert refresh_interval(0, 3600, 900, 14400, 6) == 14400
+
+
+def test_demand_tracker_decays_request_counts():
+    """Test that the rate approximates recent requests per hour"""
+    now = [0.0]
+    tracker = DemandTracker(window=3600, clock=lambda: now[0])
+    for _ in range(10):
+        tracker.record("A")
+    assert tracker.rate("A") == pytest.approx(10)
+    assert tracker.rate("B") == 0
+
+    now[0] += 3600
+    assert tracker.rate("A") == pytest.approx(10 / 2.718281828, rel=1e-3)
+    tracker.record("A")
+    assert tracker.rate("A") == pytest.approx(10 / 2.718281828 + 1, rel=1e-3)
+
+    tracker.forget("A")
+    assert tracker.rate("A") == 0
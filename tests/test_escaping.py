@@ -0,0 +1,44 @@
+"""
+Tests for XML escaping
+"""
+
+from xml.sax.saxutils import escape  # nosec B406 - reference implementation
+
+from tvtv2xmltv.escaping import escape_attr, escape_text, memoize
+
+
+def test_escape_text_matches_saxutils():
+    """Element text is escaped exactly like saxutils.escape"""
+    for value in ["Plain Title", "Law & Order", "<Untitled>", "a > b && c", "", 'Say "hi"']:
+        assert escape_text(value) == escape(value)
+
+
+def test_plain_strings_returned_unchanged():
+    """Strings without special characters are returned as the same object"""
+    value = "Evening News"
+    assert escape_text(value) is value
+    assert escape_attr(value) is value
+
+
+def test_escape_attr_escapes_quotes():
+    """Attribute values also escape double quotes"""
+    assert escape_attr('5" & <up>') == "5&quot; &amp; &lt;up&gt;"
+
+
+def test_memoize_bounded():
+    """Memoised escaping converts values with str() and stays bounded"""
+    calls = []
+
+    def counting(value):
+        calls.append(value)
+        return escape_text(value)
+
+    cached = memoize(counting, max_entries=2)
+    assert cached("Law & Order") == "Law &amp; Order"
+    assert cached("Law & Order") == "Law &amp; Order"
+    assert cached(1800) == "1800"
+    assert calls == ["Law & Order", "1800"]
+
+    cached("Third")
+    cached("Law & Order")
+    assert calls == ["Law & Order", "1800", "Third", "Law & Order"]
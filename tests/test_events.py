@@ -0,0 +1,97 @@
+"""
+Tests for guide change notifications
+"""
+
+import hashlib
+import hmac
+import json
+from datetime import datetime, timezone
+
+import responses
+
+from tvtv2xmltv.events import EventBroker, GuideVersions, WebhookNotifier, guide_version
+
+
+def _guide(days, fetched_at=datetime(2025, 12, 28, 12, tzinfo=timezone.utc)):
+    return {
+        "lineup_data": [{"channelNumber": "2.1"}],
+        "listings_by_day": [[[{"title": title}]] for title in days],
+        "channel_key": "abc",
+        "fetched_at": fetched_at,
+    }
+
+
+def test_guide_version_depends_on_listings_and_rendering():
+    """Test that the version changes with the data and the render settings"""
+    version, days = guide_version(_guide(["News", "Movie"]))
+    assert list(days) == ["2025-12-28", "2025-12-29"]
+    assert guide_version(_guide(["News", "Movie"]))[0] == version
+    assert guide_version(_guide(["News", "Film"]))[0] != version
+    assert guide_version(_guide(["News", "Movie"]), "tz=UTC")[0] != version
+
+
+def test_guide_versions_report_changed_days():
+    """Test that only changed days are listed, and unchanged guides are not announced"""
+    versions = GuideVersions()
+    first = versions.update("A", _guide(["News", "Movie"]))
+    assert first["previous_version"] is None
+    assert first["changed_days"] == ["2025-12-28", "2025-12-29"]
+    assert versions.update("A", _guide(["News", "Movie"])) is None
+
+    second = versions.update("A", _guide(["News", "Film"]))
+    assert second["previous_version"] == first["version"]
+    assert second["changed_days"] == ["2025-12-29"]
+    assert versions.version("A") == second["version"]
+
+    # Rendering changes affect every day
+    assert versions.update("A", _guide(["News", "Film"]), "tz=UTC")["days"] == 2
+    versions.forget("A")
+    assert versions.version("A") is None
+
+
+def test_event_broker_streams_and_replays():
+    """Test that streams receive events and reconnects replay missed ones"""
+    broker = EventBroker(max_clients=1)
+    subscription = broker.subscribe()
+    assert broker.subscribe() is None  # Only one stream allowed
+
+    broker.publish("guide", {"lineup": "A", "version": "1"})
+    broker.publish("guide", {"lineup": "B", "version": "2"})
+    stream = broker.stream(subscription, lineups=["B"], keepalive=0.01)
+    assert next(stream).startswith("retry:")
+    assert next(stream) == 'id: 2\nevent: guide\ndata: {"lineup": "B", "version": "2"}\n\n'
+    assert next(stream) == ": keep-alive\n\n"
+    stream.close()
+    assert broker.status()["clients"] == 0
+
+    replay = broker.subscribe(last_event_id=1)
+    assert replay.queue.get_nowait()[0] == 2
+
+
+def test_event_broker_disconnects_slow_clients():
+    """Test that a stream whose queue is full is closed rather than blocking"""
+    broker = EventBroker(queue_size=1)
+    subscription = broker.subscribe()
+    broker.publish("guide", {"lineup": "A"})
+    broker.publish("guide", {"lineup": "A"})
+    assert subscription.closed
+    assert broker.status()["clients"] == 0
+
+    broker.close()
+    assert broker.subscribe() is None
+
+
+@responses.activate
+def test_webhook_notifier_signs_and_retries():
+    """Test that webhooks are delivered in the background with a signature"""
+    responses.add(responses.POST, "http://hook/a", status=500)
+    responses.add(responses.POST, "http://hook/a", status=200)
+    notifier = WebhookNotifier(["http://hook/a"], secret="s3cret", retries=2)
+    notifier.notify("guide", {"lineup": "A"})
+    notifier.close()
+
+    assert notifier.delivered == 1
+    request = responses.calls[-1].request
+    assert json.loads(request.body) == {"event": "guide", "data": {"lineup": "A"}}
+    expected = hmac.new(b"s3cret", request.body, hashlib.sha256).hexdigest()
+    assert request.headers["X-TVTV-Signature"] == f"sha256={expected}"
@@ -0,0 +1,135 @@
+"""
+Tests for serving published guide files
+"""
+
+import os
+
+import pytest
+from flask import Flask
+from werkzeug.wsgi import FileWrapper
+from tvtv2xmltv.file_serving import GuideFileCache, MappedFile, send_guide
+
+
+@pytest.fixture
+def guide_file(tmp_path):
+    """A published guide file"""
+    path = tmp_path / "guide.xml"
+    path.write_bytes(b"<tv>" + b"x" * 1000 + b"</tv>")
+    return str(path)
+
+
+@pytest.fixture
+def client(guide_file):
+    """A test client serving `guide_file` at /guide.xml"""
+    app = Flask(__name__)
+    cache = GuideFileCache()
+
+    @app.route("/guide.xml")
+    def guide():
+        return send_guide(cache, guide_file)
+
+    @app.route("/accel.xml")
+    def accel():
+        return send_guide(cache, guide_file, x_accel_prefix="/protected/")
+
+    return app.test_client()
+
+
+def test_mapped_file_iterates_and_seeks():
+    """The iterable yields chunks from the current position"""
+    data = b"0123456789"
+    body = MappedFile(data, len(data), chunk_size=4)
+    assert list(body) == [b"0123", b"4567", b"89"]
+
+    body.seek(6)
+    assert body.tell() == 6
+    assert b"".join(body) == b"6789"
+
+
+def test_full_download(client, guide_file):
+    """A plain GET returns the whole file with validators"""
+    response = client.get("/guide.xml")
+    assert response.status_code == 200
+    with open(guide_file, "rb") as f:
+        assert response.data == f.read()
+    assert response.headers["Content-Type"].startswith("application/xml")
+    assert response.headers["Content-Disposition"].startswith("inline")
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+
+
+def test_range_request(client):
+    """Range requests return 206 with only the requested bytes"""
+    response = client.get("/guide.xml", headers={"Range": "bytes=0-3"})
+    assert response.status_code == 206
+    assert response.data == b"<tv>"
+    assert response.headers["Content-Range"] == "bytes 0-3/1009"
+
+    response = client.get("/guide.xml", headers={"Range": "bytes=-5"})
+    assert response.status_code == 206
+    assert response.data == b"</tv>"
+
+
+def test_conditional_request(client):
+    """A matching ETag gets 304 Not Modified"""
+    etag = client.get("/guide.xml").headers["ETag"]
+    response = client.get("/guide.xml", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_replaced_file_is_remapped(client, guide_file, tmp_path):
+    """Publishing a new file (atomic rename) serves the new content and ETag"""
+    first = client.get("/guide.xml")
+
+    replacement = tmp_path / "guide.xml.tmp"
+    replacement.write_bytes(b"<tv>new</tv>")
+    os.replace(replacement, guide_file)
+
+    second = client.get("/guide.xml")
+    assert second.data == b"<tv>new</tv>"
+    assert second.headers["ETag"] != first.headers["ETag"]
+    # The previous ETag no longer matches
+    response = client.get("/guide.xml", headers={"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 200
+
+
+def test_empty_file(tmp_path):
+    """Empty files are served without a memory map"""
+    path = tmp_path / "empty.xml"
+    path.write_bytes(b"")
+    guide = GuideFileCache().open(str(path))
+    assert guide.size == 0
+    assert not list(MappedFile(guide.mapping, guide.size))
+
+
+def test_x_accel_redirect(client):
+    """With a prefix the body is delegated to nginx"""
+    response = client.get("/accel.xml")
+    assert response.status_code == 200
+    assert response.headers["X-Accel-Redirect"] == "/protected/guide.xml"
+    assert response.data == b""
+
+
+def test_server_file_wrapper(client, guide_file):
+    """Whole-file responses use the server's wsgi.file_wrapper when available"""
+    wrapped = []
+
+    def file_wrapper(f, block_size):
+        wrapped.append(f)
+        return FileWrapper(f, block_size)
+
+    response = client.get("/guide.xml", environ_overrides={"wsgi.file_wrapper": file_wrapper})
+    with open(guide_file, "rb") as f:
+        assert response.data == f.read()
+    assert len(wrapped) == 1
+
+    # Range responses are still sliced from the memory map
+    response = client.get(
+        "/guide.xml",
+        headers={"Range": "bytes=0-3"},
+        environ_overrides={"wsgi.file_wrapper": file_wrapper},
+    )
+    assert response.data == b"<tv>"
+    assert len(wrapped) == 1
@@ -0,0 +1,86 @@
+"""
+Tests for incremental grid response parsing
+"""
+
+import json
+
+import pytest
+from tvtv2xmltv.grid_stream import GridParser, parse_grid
+
+GRID = [
+    [
+        {
+            "programId": "EP1",
+            "title": "News \u00e9",
+            "subtitle": "",
+            "startTime": "2025-01-01T04:00:00.000Z",
+            "duration": 1800,
+            "runTime": 30,
+            "type": "N",
+            "flags": ["HD", "New"],
+            "unused": {"nested": [1, 2, 3]},
+        },
+        {
+            "programId": "EP2",
+            "title": "Movie [1999]",
+            "startTime": "2025-01-01T04:30:00.000Z",
+            "duration": 7200,
+            "runTime": 120,
+            "type": "M",
+            "flags": ["HD", "New"],
+        },
+    ],
+    [],
+    None,
+    [{"programId": "EP3", "title": "News \u00e9", "startTime": "2025-01-01T04:00:00.000Z"}],
+]
+
+
+def expected():
+    """The grid as decoded by json.loads, without unused fields"""
+    stations = json.loads(json.dumps(GRID))
+    for programs in stations:
+        for program in programs or []:
+            program.pop("unused", None)
+    return [programs or [] for programs in stations]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 100000])
+def test_parse_any_chunking(chunk_size):
+    """Chunk boundaries anywhere (including inside UTF-8 sequences) parse the same"""
+    body = json.dumps(GRID, ensure_ascii=False).encode("utf-8")
+    chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+    stations, size = parse_grid(chunks)
+    assert stations == expected()
+    assert size == len(body)
+
+
+def test_shared_values():
+    """Repeated strings and flag lists are shared between programmes"""
+    stations, _ = parse_grid([json.dumps(GRID).encode("utf-8")])
+    first, second = stations[0]
+    assert first["flags"] is second["flags"]
+    assert first["title"] is stations[3][0]["title"]
+
+
+def test_null_and_empty_bodies():
+    """`null` and `[]` mean no listings"""
+    assert parse_grid([b"nu", b"ll"])[0] == []
+    assert parse_grid([b" [ ] "])[0] == []
+
+
+@pytest.mark.parametrize("body", [b'[[{"title": "x"}]', b'{"error": "blocked"}', b"<html>"])
+def test_invalid_bodies(body):
+    """Truncated or non-grid bodies raise ValueError"""
+    with pytest.raises(ValueError):
+        parse_grid([body])
+
+
+def test_parser_keeps_only_unparsed_tail():
+    """Consumed text is dropped as soon as a station list is complete"""
+    parser = GridParser()
+    parser.feed('[[{"title": "a"}], [{"tit')
+    assert parser.stations == [[{"title": "a"}]]
+    parser.feed('le": "b"}]]', final=True)
+    assert parser.stations == [[{"title": "a"}], [{"title": "b"}]]
+    assert parser.done
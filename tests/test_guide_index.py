@@ -0,0 +1,69 @@
+"""
+Tests for the guide interval index
+"""
+
+import pytest
+from tvtv2xmltv.guide_index import GuideIndex, parse_start_time
+
+LINEUP = [
+    {"channelNumber": "2.1", "stationId": 1, "stationCallSign": "WABC"},
+    {"channelNumber": "4.1", "stationId": 2, "stationCallSign": "WNBC"},
+]
+
+
+def _program(title, start, minutes=30):
+    return {"title": title, "startTime": start, "runTime": minutes, "duration": minutes * 60}
+
+
+@pytest.fixture
+def index():
+    """Index over two channels and two days of listings"""
+    day_one = [
+        [
+            _program("Early", "2023-05-23T20:00:00.000Z"),
+            _program("Late", "2023-05-23T20:30:00.000Z"),
+        ],
+        [_program("Movie", "2023-05-23T19:00:00.000Z", 120)],
+    ]
+    day_two = [
+        # Repeated airing across the day boundary is indexed once
+        [
+            _program("Late", "2023-05-23T20:30:00.000Z"),
+            _program("Next Day", "2023-05-24T20:00:00.000Z"),
+        ],
+        [],
+    ]
+    return GuideIndex(LINEUP, [day_one, day_two])
+
+
+def test_now(index):
+    """Programmes airing at a given time are returned per channel"""
+    at = parse_start_time("2023-05-23T20:15:00.000Z")
+    results = index.now(at)
+    assert [(c["channelNumber"], p["title"]) for c, p, _, _ in results] == [
+        ("2.1", "Early"),
+        ("4.1", "Movie"),
+    ]
+    assert index.now(at, channels=["4.1"])[0][1]["title"] == "Movie"
+    assert index.now(parse_start_time("2023-05-23T18:00:00.000Z")) == []
+
+
+def test_next(index):
+    """The next programme per channel starts strictly after the given time"""
+    at = parse_start_time("2023-05-23T20:15:00.000Z")
+    results = index.next(at)
+    assert [p["title"] for _, p, _, _ in results] == ["Late"]
+
+
+def test_window(index):
+    """Window queries return overlapping programmes in generator layout"""
+    start = parse_start_time("2023-05-23T20:20:00.000Z")
+    lineup_data, listings_by_day = index.window(start, start + 3600)
+
+    assert [c["channelNumber"] for c in lineup_data] == ["2.1", "4.1"]
+    assert [p["title"] for p in listings_by_day[0][0]] == ["Early", "Late"]
+    assert [p["title"] for p in listings_by_day[0][1]] == ["Movie"]
+
+    _, unbounded = index.window(channels=["2.1"])
+    assert [p["title"] for p in unbounded[0][0]] == ["Early", "Late", "Next Day"]
+    assert len(index) == 4
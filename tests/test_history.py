@@ -0,0 +1,130 @@
+"""
+Tests for the guide history archive
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from tvtv2xmltv.history import GuideArchive, HistoryError
+
+FETCHED_AT = datetime(2025, 12, 28, 12, tzinfo=timezone.utc)
+# Publication times are recent so that no entry is past the retention
+PUBLISHED = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=2)
+
+
+def _program(start, title):
+    return {"startTime": f"2025-12-{start}Z", "title": title, "duration": 60}
+
+
+def _guide(titles, fetched_at=FETCHED_AT, channels=("A", "B")):
+    """Guide with one programme per channel per day titled `titles[day]`"""
+    return {
+        "lineup_data": [
+            {"stationId": station, "channelNumber": str(i)} for i, station in enumerate(channels)
+        ],
+        "listings_by_day": [
+            [[_program(f"{28 + day}T12:00:00", f"{title} {station}")] for station in channels]
+            for day, title in enumerate(titles)
+        ],
+        "channel_key": ",".join(channels),
+        "fetched_at": fetched_at,
+    }
+
+
+def _at(hours):
+    return PUBLISHED + timedelta(hours=hours)
+
+
+def test_archive_stores_changes_and_retrieves_any_version(tmp_path):
+    """Test that each version can be rebuilt and unchanged refreshes are skipped"""
+    archive = GuideArchive(str(tmp_path))
+    first = _guide(["News", "Movie"])
+    second = _guide(["News", "Film"])
+    assert archive.append("L", first, _at(0))
+    assert not archive.append("L", _guide(["News", "Movie"]), _at(1))
+    assert archive.append("L", second, _at(2))
+
+    entries = archive.entries("L")
+    assert [entry["kind"] for entry in entries] == ["full", "delta"]
+
+    assert archive.guide_at("L", _at(-1)) is None
+    guide, published_at = archive.guide_at("L", _at(1))
+    assert published_at == _at(0)
+    assert guide == first
+    assert archive.guide_at("L", _at(5))[0] == second
+
+
+def test_archive_grows_with_changes_not_refreshes(tmp_path):
+    """Test that a delta only holds the changed programmes"""
+    archive = GuideArchive(str(tmp_path))
+    channels = tuple(f"S{i}" for i in range(50))
+    archive.append("L", _guide(["News", "Movie"], channels=channels), _at(0))
+    size = os.path.getsize(archive.path("L"))
+    for hour in range(1, 20):
+        archive.append("L", _guide(["News", "Movie"], channels=channels), _at(hour))
+    assert os.path.getsize(archive.path("L")) == size
+
+    changed = _guide(["News", "Movie"], channels=channels)
+    changed["listings_by_day"][1][0][0]["title"] = "Film"
+    archive.append("L", changed, _at(20))
+    assert archive.entries("L")[1]["bytes"] < archive.entries("L")[0]["bytes"] / 5
+    assert archive.guide_at("L", _at(21))[0] == changed
+
+
+def test_archive_follows_shifting_days_and_channel_changes(tmp_path):
+    """Test that a refresh a day later and a changed channel list are rebuilt exactly"""
+    archive = GuideArchive(str(tmp_path))
+    archive.append("L", _guide(["News", "Movie"]), _at(0))
+    next_day = _guide(["Movie", "Sports"], fetched_at=_at(24), channels=("A", "C"))
+    for day_listings in next_day["listings_by_day"]:
+        for programs in day_listings:
+            programs[0]["startTime"] = programs[0]["startTime"].replace("12-28", "12-30")
+    archive.append("L", next_day, _at(24))
+
+    # A new archive object reads the file from scratch
+    reopened = GuideArchive(str(tmp_path))
+    assert reopened.guide_at("L", _at(24))[0] == next_day
+    assert not reopened.append("L", next_day, _at(25))
+
+
+def test_archive_compacts_entries_past_retention(tmp_path, monkeypatch):
+    """Test that old entries are folded into the version in effect at the cutoff"""
+    now = PUBLISHED.timestamp() + 40 * 86400
+    monkeypatch.setattr("tvtv2xmltv.history.time.time", lambda: now)
+    archive = GuideArchive(str(tmp_path), retention_days=30)
+    archive.COMPACT_INTERVAL = 0
+    for day, title in enumerate(["A", "B", "C"]):
+        archive.append("L", _guide([title]), _at(day * 24 * 5))
+    archive.append("L", _guide(["D"]), _at(39 * 24))
+
+    entries = archive.entries("L")
+    assert [entry["kind"] for entry in entries] == ["full", "delta"]
+    assert entries[0]["published_at"] == _at(10 * 24).isoformat()
+    assert archive.guide_at("L", _at(11 * 24))[0] == _guide(["C"])
+    assert archive.guide_at("L", _at(40 * 24))[0] == _guide(["D"])
+    assert archive.status()["lineups"]["L"]["entries"] == 2
+
+
+def test_archive_ignores_incomplete_last_entry(tmp_path):
+    """Test that an entry cut short by a crash is dropped and overwritten"""
+    archive = GuideArchive(str(tmp_path))
+    archive.append("L", _guide(["News"]), _at(0))
+    size = os.path.getsize(archive.path("L"))
+    archive.append("L", _guide(["Movie"]), _at(1))
+    with open(archive.path("L"), "r+b") as f:
+        f.truncate(os.path.getsize(archive.path("L")) - 3)
+
+    archive = GuideArchive(str(tmp_path))
+    assert len(archive.entries("L")) == 1
+    assert archive.append("L", _guide(["Film"]), _at(2))
+    assert os.path.getsize(archive.path("L")) > size
+    assert archive.guide_at("L", _at(3))[0] == _guide(["Film"])
+
+
+def test_archive_rejects_other_files(tmp_path):
+    """Test that a file without the archive header is reported"""
+    (tmp_path / "L.hist").write_bytes(b"not an archive")
+    with pytest.raises(HistoryError):
+        GuideArchive(str(tmp_path)).entries("L")
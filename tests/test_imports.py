@@ -0,0 +1,87 @@
+"""
+Tests for start-up imports of the command line modes
+"""
+
+import os
+import subprocess  # nosec B404 - runs this interpreter only
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Modules only the server, profiling or parallel rendering need
+DEFERRED = ["flask", "werkzeug", "jinja2", "cProfile", "pstats", "tracemalloc", "multiprocessing"]
+
+
+def _run(*args):
+    result = subprocess.run(  # nosec B603 - fixed arguments
+        [sys.executable, *args], cwd=SRC, capture_output=True, text=True, check=True
+    )
+    return result
+
+
+# Budgets for starting a conversion: modules loaded by `main` and the converter,
+# and their cumulative import time. Both are measured at about 230 modules and
+# 0.15s; the time budget leaves room for slow or loaded machines.
+CONVERT_MODULE_BUDGET = 300
+CONVERT_IMPORT_SECONDS = 2.0
+
+
+def _new_modules(modules):
+    """Modules loaded by importing `modules` in a fresh interpreter"""
+    code = (
+        "import sys; before = set(sys.modules); "
+        + "; ".join(f"import {module}" for module in modules)
+        + "; print(len(set(sys.modules) - before))"
+    )
+    return int(_run("-c", code).stdout)
+
+
+def _import_seconds(modules):
+    """Best cumulative import time of modules over a few fresh interpreters"""
+    code = "; ".join(f"import {module}" for module in modules)
+    totals = []
+    for _ in range(3):
+        total = 0
+        for line in _run("-X", "importtime", "-c", code).stderr.splitlines():
+            if line.count("|") == 2:
+                _, cumulative, name = line.split("|")
+                if name.strip() in modules:
+                    total += int(cumulative)
+        totals.append(total / 1e6)
+    return min(totals)
+
+
+def test_convert_mode_skips_web_stack():
+    """The convert path loads neither the web stack nor profiling modules"""
+    code = (
+        "import sys, main, tvtv2xmltv.converter; "
+        f"print(','.join(m for m in {DEFERRED!r} if m in sys.modules))"
+    )
+    assert _run("-c", code).stdout.strip() == ""
+
+
+def test_server_defers_optional_modules():
+    """The server loads profiling, rendering workers, waitress and the work queue on first use"""
+    optional = [
+        "cProfile",
+        "pstats",
+        "tracemalloc",
+        "multiprocessing",
+        "waitress",
+        "sqlite3",
+        "tvtv2xmltv.planner",
+        "tvtv2xmltv.work_queue",
+    ]
+    code = (
+        "import sys, main, tvtv2xmltv.server; "
+        f"print(','.join(m for m in {optional!r} if m in sys.modules))"
+    )
+    assert _run("-c", code).stdout.strip() == ""
+
+
+def test_convert_import_budget():
+    """Starting a conversion stays within its module and import-time budgets"""
+    convert = _new_modules(["main", "tvtv2xmltv.converter"])
+    assert convert <= CONVERT_MODULE_BUDGET
+    assert convert < _new_modules(["main", "tvtv2xmltv.server"])
+    assert _import_seconds(["main", "tvtv2xmltv.converter"]) < CONVERT_IMPORT_SECONDS
@@ -0,0 +1,140 @@
+"""
+Tests for the logging setup
+"""
+
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from tvtv2xmltv.log import (
+    DroppingQueueHandler,
+    JSONFormatter,
+    KeyValueFormatter,
+    RateLimitFilter,
+    parse_level,
+    parse_levels,
+    setup_logging,
+    shutdown_logging,
+)
+
+
+def _record(msg="Fetched grid batch", args=(), level=logging.INFO, name="tvtv2xmltv.x", **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+@pytest.fixture
+def log_output():
+    """Set up logging into a buffer, restoring the default afterwards"""
+    stream = io.StringIO()
+
+    def read():
+        shutdown_logging()  # Drains the queue
+        return stream.getvalue()
+
+    yield stream, read
+    shutdown_logging()
+    logger = logging.getLogger("tvtv2xmltv")
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.setLevel(logging.NOTSET)
+    logger.propagate = True
+
+
+def test_key_value_formatter_appends_extra_fields():
+    """Test that `extra=` fields are written as key=value pairs"""
+    line = KeyValueFormatter().format(
+        _record(lineup="USA-OTA30236", batch=3, latency=0.25, start="a b")
+    )
+    assert "INFO    tvtv2xmltv.x Fetched grid batch" in line
+    assert line.endswith('lineup=USA-OTA30236 batch=3 latency=0.25 start="a b"')
+
+
+def test_json_formatter():
+    """Test that JSON lines carry the message and fields"""
+    entry = json.loads(JSONFormatter().format(_record("Waiting %ss", (5,), day=2)))
+    assert entry["message"] == "Waiting 5s"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "tvtv2xmltv.x"
+    assert entry["day"] == 2
+
+
+def test_rate_limit_suppresses_repeats_and_reports_count():
+    """Test that repeats beyond the burst are dropped until the window passes"""
+    now = [0.0]
+    limiter = RateLimitFilter(burst=2, interval=60, clock=lambda: now[0])
+
+    # Same template, different arguments: still a repeat
+    passed = [limiter.filter(_record("Retry %s", (i,))) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert limiter.filter(_record("Other message"))
+
+    now[0] = 61
+    record = _record("Retry %s", (9,))
+    assert limiter.filter(record)
+    assert record.suppressed == 3
+
+
+def test_rate_limit_ignores_debug():
+    """Test that DEBUG records are never limited"""
+    limiter = RateLimitFilter(burst=1, interval=60)
+    assert all(limiter.filter(_record(level=logging.DEBUG)) for _ in range(5))
+
+
+def test_queue_handler_drops_instead_of_blocking():
+    """Test that a full queue drops records and counts them on the next one"""
+    log_queue = queue.Queue(1)
+    handler = DroppingQueueHandler(log_queue)
+    handler.handle(_record("first"))
+    handler.handle(_record("second"))  # Would block with a plain Queue.put
+    handler.handle(_record("third"))
+    assert handler.dropped == 2
+
+    log_queue.get_nowait()
+    handler.handle(_record("fourth %s", ("x",)))
+    record = log_queue.get_nowait()
+    assert record.getMessage() == "fourth x"
+    assert record.dropped == 2
+    assert handler.dropped == 0
+
+
+def test_parse_levels():
+    """Test per-module level parsing"""
+    assert parse_level("debug") == logging.DEBUG
+    assert parse_level("nonsense") == logging.INFO
+    assert parse_levels("tvtv_client=DEBUG, server=warning,bad=LOUD,=INFO") == {
+        "tvtv2xmltv.tvtv_client": logging.DEBUG,
+        "tvtv2xmltv.server": logging.WARNING,
+    }
+
+
+def test_setup_logging_applies_levels(log_output):
+    """Test that records are written through the queue with per-module levels"""
+    stream, read = log_output
+    setup_logging("INFO", "tvtv_client=DEBUG", stream=stream)
+    logging.getLogger("tvtv2xmltv.tvtv_client").debug("Batch", extra={"batch": 1})
+    logging.getLogger("tvtv2xmltv.converter").debug("Hidden")
+    logging.getLogger("tvtv2xmltv.converter").info("Fetched lineup", extra={"lineup": "A"})
+
+    output = read()
+    assert "tvtv2xmltv.tvtv_client Batch batch=1" in output
+    assert "Hidden" not in output
+    assert "Fetched lineup lineup=A" in output
+
+
+def test_setup_logging_again_resets_levels(log_output):
+    """Test that a second setup (e.g. on reload) replaces levels and format"""
+    stream, read = log_output
+    setup_logging("INFO", "tvtv_client=DEBUG", stream=io.StringIO())
+    setup_logging("INFO", "", fmt="json", stream=stream)
+    logging.getLogger("tvtv2xmltv.tvtv_client").debug("Batch")
+    logging.getLogger("tvtv2xmltv.server").warning("Slow", extra={"lineup": "A"})
+
+    lines = read().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["lineup"] == "A"
@@ -0,0 +1,155 @@
+"""
+Tests for the logo proxy cache
+"""
+
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+import responses
+from tvtv2xmltv.logo_cache import LogoCache, logo_name, upstream_logo_url
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+LOGO_URL = "https://s3.amazonaws.com/logos/s10212_h3_aa.png"
+
+
+def test_upstream_logo_url():
+    """Relative tvtv.us paths get the host; absolute URLs are kept"""
+    assert upstream_logo_url("/gn/i/assets/s1.png") == "https://www.tvtv.us/gn/i/assets/s1.png"
+    assert upstream_logo_url(LOGO_URL) == LOGO_URL
+    assert upstream_logo_url("//cdn.example/a.png") == "https://cdn.example/a.png"
+    assert upstream_logo_url("") is None
+    assert upstream_logo_url(None) is None
+
+
+def test_logo_name_is_stable():
+    """Names are derived from the URL and keep the image extension"""
+    assert logo_name(LOGO_URL) == logo_name(LOGO_URL)
+    assert logo_name(LOGO_URL).endswith(".png")
+    assert logo_name("https://x/logo?id=1").endswith(".png")
+    assert logo_name("https://x/a.JPG") != logo_name("https://x/b.jpg")
+
+
+@responses.activate
+def test_logos_downloaded_once_and_shared(tmp_path):
+    """Each logo is downloaded once; identical images share one blob"""
+    responses.add(responses.GET, LOGO_URL, body=PNG, content_type="image/png")
+    responses.add(responses.GET, "https://www.tvtv.us/copy.png", body=PNG, content_type="image/png")
+    cache = LogoCache(str(tmp_path))
+    cache.register([{"logo": LOGO_URL}, {"logo": "/copy.png"}, {"logo": ""}])
+
+    path, mimetype, digest = cache.get(logo_name(LOGO_URL))
+    with open(path, "rb") as f:
+        assert f.read() == PNG
+    assert mimetype == "image/png"
+    assert cache.get(logo_name(LOGO_URL))[2] == digest
+    assert cache.get(logo_name("https://www.tvtv.us/copy.png"))[0] == path
+    assert len(responses.calls) == 2
+    assert os.listdir(tmp_path / "blobs") == [os.path.basename(path)]
+    assert cache.get("unknown.png") is None
+
+    # The index survives a restart
+    restarted = LogoCache(str(tmp_path))
+    assert restarted.get(logo_name(LOGO_URL))[2] == digest
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_failed_refetch_keeps_cached_logo(tmp_path):
+    """Expired logos are refetched; failures keep the cached image"""
+    responses.add(responses.GET, LOGO_URL, body=PNG, content_type="image/png")
+    responses.add(responses.GET, LOGO_URL, status=503)
+    cache = LogoCache(str(tmp_path), ttl=0)
+    cache.register([{"logo": LOGO_URL}])
+
+    first = cache.get(logo_name(LOGO_URL))
+    assert cache.get(logo_name(LOGO_URL)) == first
+    assert len(responses.calls) == 2
+    # Not retried until the failure backoff has passed
+    assert cache.get(logo_name(LOGO_URL)) == first
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_non_image_responses_rejected(tmp_path):
+    """Error pages served with 200 are not cached as logos"""
+    responses.add(responses.GET, LOGO_URL, body="<html>", content_type="text/html")
+    cache = LogoCache(str(tmp_path))
+    cache.register([{"logo": LOGO_URL}])
+    assert cache.get(logo_name(LOGO_URL)) is None
+
+
+@responses.activate
+def test_resized_logos(tmp_path):
+    """Logos are scaled down to fit max_size when Pillow is installed"""
+    image_module = pytest.importorskip("PIL.Image")
+    image = image_module.new("RGB", (400, 200))
+    image.save(tmp_path / "big.png")
+    responses.add(
+        responses.GET, LOGO_URL, body=(tmp_path / "big.png").read_bytes(), content_type="image/png"
+    )
+    cache = LogoCache(str(tmp_path / "cache"), max_size=100)
+    cache.register([{"logo": LOGO_URL}])
+
+    path, mimetype, _ = cache.get(logo_name(LOGO_URL))
+    assert mimetype == "image/png"
+    with image_module.open(path) as resized:
+        assert resized.size == (100, 50)
+
+
+@responses.activate
+def test_oversized_images_are_served_unresized(tmp_path, monkeypatch):
+    """A decompression bomb is not resized; the original download is served"""
+    image_module = pytest.importorskip("PIL.Image")
+    image = image_module.new("RGB", (400, 200))
+    image.save(tmp_path / "big.png")
+    responses.add(
+        responses.GET, LOGO_URL, body=(tmp_path / "big.png").read_bytes(), content_type="image/png"
+    )
+    # Images over twice this many pixels raise DecompressionBombError
+    monkeypatch.setattr(image_module, "MAX_IMAGE_PIXELS", 1000)
+    cache = LogoCache(str(tmp_path / "cache"), max_size=100)
+    cache.register([{"logo": LOGO_URL}])
+
+    path, mimetype, _ = cache.get(logo_name(LOGO_URL))
+    assert mimetype == "image/png"
+    with open(path, "rb") as f:
+        assert f.read() == (tmp_path / "big.png").read_bytes()
+
+
+def test_concurrent_first_fetches_of_different_logos(tmp_path):
+    """Downloads of different logos finishing together all succeed and are indexed"""
+
+    class SlowSession:
+        def get(self, url, **kwargs):
+            time.sleep(0.01)  # Let the downloads overlap
+            response = requests.Response()
+            response.status_code = 200
+            response.headers["Content-Type"] = "image/png"
+            response.raw = io.BytesIO(PNG + url.encode("utf-8"))
+            return response
+
+    cache = LogoCache(str(tmp_path), session=SlowSession())
+    urls = [f"https://www.tvtv.us/logos/{n}.png" for n in range(64)]
+    cache.register([{"logo": url} for url in urls])
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(cache.get, [logo_name(url) for url in urls]))
+    assert all(result is not None for result in results)
+    assert LogoCache(str(tmp_path)).status()["logos"] == len(urls)
+
+
+def test_connection_errors_return_none(tmp_path):
+    """An unreachable upstream yields None for logos never downloaded"""
+
+    class FailingSession:
+        def get(self, *args, **kwargs):
+            raise requests.ConnectionError("unreachable")
+
+    cache = LogoCache(str(tmp_path), session=FailingSession())
+    cache.register([{"logo": LOGO_URL}])
+    assert cache.get(logo_name(LOGO_URL)) is None
+    assert cache.source(logo_name(LOGO_URL)) == LOGO_URL
@@ -0,0 +1,86 @@
+"""
+Tests for the merged multi-lineup guide
+"""
+
+from tvtv2xmltv.config import Config
+from tvtv2xmltv.converter import TVTVConverter
+from tvtv2xmltv.merged_guide import MergedGuide
+
+
+def _channel(number, station_id):
+    return {
+        "channelNumber": number,
+        "stationId": station_id,
+        "stationCallSign": f"S{station_id}",
+        "logo": "/logo.png",
+    }
+
+
+def _program(title, start):
+    return {"title": title, "startTime": start, "runTime": 30, "duration": 1800}
+
+
+def test_dedups_channels_and_programmes():
+    """Shared stations and repeated airings appear once"""
+    merged = MergedGuide()
+    merged.update(
+        "ONE",
+        [_channel("2.1", 1), _channel("4.1", 2)],
+        [
+            [
+                [_program("A", "2023-05-23T20:00:00.000Z")],
+                [_program("B", "2023-05-23T20:00:00.000Z")],
+            ]
+        ],
+    )
+    merged.update(
+        "TWO",
+        [_channel("4.1", 2)],
+        [
+            [
+                [
+                    _program("B", "2023-05-23T20:00:00.000Z"),
+                    _program("C", "2023-05-23T19:30:00.000Z"),
+                ]
+            ]
+        ],
+    )
+
+    lineup_data, listings_by_day = merged.build()
+    assert [c["stationId"] for c in lineup_data] == [1, 2]
+    assert [p["title"] for p in listings_by_day[0][1]] == ["C", "B"]
+
+
+def test_colliding_channel_numbers_get_unique_ids():
+    """Different stations sharing a channel number get distinct XMLTV ids"""
+    merged = MergedGuide()
+    merged.update("NY", [_channel("2.1", 1)], [])
+    merged.update("LA", [_channel("2.1", 9)], [])
+
+    lineup_data, _ = merged.build()
+    assert [c["xmltvId"] for c in lineup_data] == ["2.1-1", "2.1-9"]
+
+    merged.remove("LA")
+    lineup_data, _ = merged.build()
+    assert "xmltvId" not in lineup_data[0]
+    assert len(merged) == 1
+
+
+def test_converter_saves_merged_guide(tmp_path, monkeypatch):
+    """The converter writes all.xml alongside the per-lineup files"""
+    monkeypatch.chdir(tmp_path)
+    config = Config()
+    config.lineups = ["luUSA-OTA85142", "luUSA-AZ02490-X"]
+    config.mock_mode = True
+    config.merged_output = True
+    config.days = 1
+    converter = TVTVConverter(config)
+    monkeypatch.setattr("tvtv2xmltv.converter.time.sleep", lambda _: None)
+
+    converter.save_to_file()
+
+    merged = (tmp_path / "all.xml").read_text(encoding="utf-8")
+    assert converter.merged_file == str(tmp_path / "all.xml")
+    # Six stations in the first lineup; the second only adds shared stations
+    assert merged.count("<channel ") == 6
+    assert merged.count("PBS NewsHour") == 1
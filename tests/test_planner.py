@@ -0,0 +1,102 @@
+"""
+Tests for the request planner
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+import responses
+from tvtv2xmltv.config import Config
+from tvtv2xmltv.converter import TVTVConverter
+from tvtv2xmltv.planner import build_plan, format_plan
+from tvtv2xmltv.snapshot import snapshot_path, write_snapshot
+
+
+@pytest.fixture
+def converter(tmp_path):
+    """A converter with 45 stations cached for one lineup"""
+    config = Config()
+    config.lineups = ["USA-TEST12345"]
+    config.days = 2
+    config.update_interval = 3600
+    config.output_file = str(tmp_path / "xmltv.xml")
+    config.cache_dir = str(tmp_path / "cache")
+    converter = TVTVConverter(config)
+    channels = [{"channelNumber": str(n), "stationId": n} for n in range(45)]
+    converter.channel_cache.get("USA-TEST12345", lambda: channels)
+    return converter
+
+
+def test_plan_schedule(converter):
+    """Grid requests follow the batch size; cached channels cost nothing"""
+    plan = build_plan(converter, latency=1.0)
+
+    assert [r["stations"] for r in plan["schedule"]] == [20, 20, 5, 20, 20, 5]
+    assert {r["kind"] for r in plan["schedule"]} == {"grid"}
+    lineup = plan["lineups"][0]
+    assert lineup["channels_cached"] is True
+    assert lineup["requests_per_day"] == 3
+    # Six requests of 1.75s plus two pauses between batches on each day
+    assert plan["estimated_duration"] == pytest.approx(6 * 1.75 + 4 * 1.5)
+    assert plan["projection"]["requests_per_day"] == 6 * 24 + 1
+    assert plan["budget"] is None
+    assert "Schedule:" in format_plan(plan)
+
+
+def test_plan_budget_fit(converter):
+    """A tight budget reports how many days each refresh can fetch"""
+    converter.budget.per_day = 100
+    plan = build_plan(converter)
+    # 24 refreshes a day at 3 requests per day of guide data fit one day each
+    assert plan["budget"]["days_per_refresh"] == 1
+    assert plan["budget"]["degraded"] is True
+    assert "fewer days" in format_plan(plan)
+
+
+@responses.activate
+def test_plan_does_not_fetch_unknown_channels(tmp_path):
+    """Uncached lineups are reported with unknown channels unless fetching is allowed"""
+    responses.add(
+        responses.GET,
+        "https://www.tvtv.us/api/v1/lineup/USA-NEW00000/channels",
+        json=[{"channelNumber": "1", "stationId": 1}],
+        status=200,
+    )
+    config = Config()
+    config.lineups = ["USA-NEW00000"]
+    config.days = 2
+    config.output_file = str(tmp_path / "xmltv.xml")
+    converter = TVTVConverter(config)
+    converter.budget.per_day = 100
+
+    plan = build_plan(converter)
+    assert len(responses.calls) == 0
+    assert converter.budget.remaining() == 100
+    lineup = plan["lineups"][0]
+    assert lineup["stations"] is None and lineup["channels_known"] is False
+    assert plan["complete"] is False
+    assert [r["kind"] for r in plan["schedule"]] == ["channels"]
+    assert "--fetch-channels" in format_plan(plan)
+
+    plan = build_plan(converter, fetch_channels=True)
+    assert len(responses.calls) == 1
+    assert plan["lineups"][0]["stations"] == 1 and plan["complete"] is True
+
+
+def test_plan_uses_snapshot_channels(tmp_path):
+    """Without a cached lineup, the station count comes from the last snapshot"""
+    config = Config()
+    config.lineups = ["USA-TEST12345"]
+    config.output_file = str(tmp_path / "xmltv.xml")
+    converter = TVTVConverter(config)
+    guide = {
+        "lineup_data": [{"channelNumber": str(n), "stationId": n} for n in range(30)],
+        "listings_by_day": [],
+        "channel_key": None,
+        "fetched_at": datetime.now(timezone.utc),
+    }
+    write_snapshot(snapshot_path(config.output_file), "USA-TEST12345", guide)
+
+    lineup = build_plan(converter)["lineups"][0]
+    assert lineup["stations"] == 30 and lineup["requests_per_day"] == 2
+    assert lineup["channels_cached"] is False
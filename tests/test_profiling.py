@@ -0,0 +1,64 @@
+"""
+Tests for refresh profiling
+"""
+
+import json
+
+from tvtv2xmltv.profiling import Profiler, parse_captures
+
+
+def test_parse_captures():
+    """TVTV_PROFILE values map to capture sets"""
+    assert parse_captures("false") == set()
+    assert parse_captures("true") == {"spans"}
+    assert parse_captures("all") == {"spans", "cprofile", "tracemalloc"}
+    assert parse_captures("cprofile, bogus") == {"cprofile"}
+
+
+def test_spans_outside_session_are_noops():
+    """Nothing is recorded without a session"""
+    profiler = Profiler({"spans"})
+    with profiler.span("idle") as span:
+        span.set(ignored=True)
+    assert profiler.last_profile is None
+
+
+def test_session_records_chrome_trace(tmp_path):
+    """Spans become Chrome trace complete events and a summary"""
+    profiler = Profiler({"spans"}, output_dir=str(tmp_path))
+    with profiler.session("refresh"):
+        for _ in range(2):
+            with profiler.span("http", url="u") as span:
+                span.set(bytes=10)
+
+    profile = profiler.last_profile
+    events = profile["trace"]["traceEvents"]
+    assert [e["name"] for e in events] == ["http", "http", "refresh"]
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+    assert events[0]["args"] == {"url": "u", "bytes": 10}
+    assert {"name": "http", "count": 2} == {
+        k: v for k, v in profile["summary"][1].items() if k != "ms"
+    }
+
+    written = list(tmp_path.glob("refresh-*.trace.json"))
+    assert len(written) == 1
+    assert json.loads(written[0].read_text())["traceEvents"] == events
+
+
+def test_armed_capture_applies_once():
+    """Armed captures profile the next session only"""
+    profiler = Profiler()
+    with profiler.session("refresh"):
+        pass
+    assert profiler.last_profile is None
+
+    profiler.arm(["cprofile", "tracemalloc"])
+    with profiler.session("refresh"):
+        _ = [str(i) for i in range(1000)]
+    assert "cumulative" in profiler.last_profile["cprofile"]
+    assert "tracemalloc" in profiler.last_profile
+
+    profiler.last_profile = None
+    with profiler.session("refresh"):
+        pass
+    assert profiler.last_profile is None
@@ -0,0 +1,100 @@
+"""
+Tests for the render variant cache
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+from tvtv2xmltv.render_cache import RenderCache, make_variant, parse_profiles, select
+
+
+def _guide():
+    lineup_data = [
+        {"channelNumber": "2.1", "stationCallSign": "WABC", "logo": "/a.png"},
+        {"channelNumber": "4.1", "stationCallSign": "WNBC", "logo": "/b.png"},
+    ]
+    listings_by_day = [
+        [
+            [_program("Morning News", "2023-05-23T12:00:00.000Z")],
+            [_program("Talk Show", "2023-05-23T12:00:00.000Z")],
+        ],
+        [
+            [_program("Evening News", "2023-05-24T22:00:00.000Z")],
+            [_program("Late Show", "2023-05-24T22:00:00.000Z")],
+        ],
+    ]
+    return {
+        "lineup_data": lineup_data,
+        "listings_by_day": listings_by_day,
+        "channel_key": "digest",
+        "fetched_at": datetime(2023, 5, 23, tzinfo=timezone.utc),
+    }
+
+
+def _program(title, start):
+    return {"title": title, "startTime": start, "duration": 1800, "runTime": 30}
+
+
+def test_make_variant_validates():
+    """Variants normalise channels and reject bad timezones and day counts"""
+    variant = make_variant("UTC", None, " 4.1,2.1 ,2.1", "2")
+    assert variant.channels == ("2.1", "4.1")
+    assert variant.days == 2
+    assert make_variant() == make_variant(None, "", "", None)
+
+    with pytest.raises(ValueError):
+        make_variant("Mars/Olympus_Mons")
+    with pytest.raises(ValueError):
+        make_variant(days="0")
+
+
+def test_parse_profiles():
+    """Profiles come from a JSON object; invalid entries are skipped"""
+    profiles = parse_profiles(
+        '{"remote": {"timezone": "Europe/London", "channels": ["2.1"], "days": 1},'
+        ' "bad": {"colour": "blue"}, "worse": 3}'
+    )
+    assert list(profiles) == ["remote"]
+    assert profiles["remote"].timezone == "Europe/London"
+    assert parse_profiles("") == {}
+    assert parse_profiles("not json") == {}
+
+
+def test_select_channels_and_days():
+    """Selection keeps the listings aligned with the chosen channels"""
+    guide = _guide()
+    lineup_data, listings_by_day = select(
+        guide["lineup_data"], guide["listings_by_day"], ("4.1",), 1
+    )
+    assert [c["channelNumber"] for c in lineup_data] == ["4.1"]
+    assert listings_by_day == [[[_program("Talk Show", "2023-05-23T12:00:00.000Z")]]]
+
+
+def test_render_variants_are_cached_and_evicted():
+    """Variants render from one dataset, hit the cache and evict LRU by size"""
+    guide = _guide()
+    cache = RenderCache("America/New_York")
+
+    default = cache.render("lineup", guide, make_variant(), "http://src")
+    assert b"Late Show" in default and b"-0400" in default
+
+    london = make_variant("Europe/London", "http://tuner/{channel}", "2.1", 1)
+    data = cache.render("lineup", guide, london, "http://src")
+    assert b"+0100" in data and b"Talk Show" not in data and b"Evening News" not in data
+    assert b"<url>http://tuner/2.1</url>" in data
+
+    assert cache.render("lineup", guide, london, "http://src") is data
+    assert cache.status()["hits"] == 1 and cache.status()["misses"] == 2
+
+    # A new fetch is a different key
+    guide = dict(guide, fetched_at=datetime(2023, 5, 24, tzinfo=timezone.utc))
+    assert cache.render("lineup", guide, london, "http://src") is not data
+
+    small = RenderCache("UTC", max_bytes=len(default) + 10)
+    small.render("lineup", guide, make_variant(), "http://src")
+    small.render("lineup", guide, make_variant(days=1), "http://src")
+    assert small.status()["entries"] == 1
+    assert small.status()["bytes"] <= small.max_bytes
+
+    cache.invalidate("lineup")
+    assert cache.status()["entries"] == 0 and cache.status()["bytes"] == 0
@@ -0,0 +1,47 @@
+"""
+Tests for the upstream request budget
+"""
+
+import pytest
+from tvtv2xmltv.request_budget import BudgetExceeded, RequestBudget
+
+
+def test_unlimited_budget():
+    """Without limits every request is allowed"""
+    budget = RequestBudget()
+    assert not budget.enabled
+    assert budget.remaining() is None
+    for _ in range(100):
+        budget.consume()
+
+
+def test_hourly_and_daily_windows():
+    """The tighter of the two rolling windows applies"""
+    budget = RequestBudget(per_hour=2, per_day=3)
+    budget.consume(now=0)
+    budget.consume(now=10)
+    assert budget.remaining(now=20) == 0
+    with pytest.raises(BudgetExceeded):
+        budget.consume(now=20)
+
+    # An hour later the hourly window has room, but the daily one has one left
+    assert budget.remaining(now=3700) == 1
+    budget.consume(now=3700)
+    with pytest.raises(BudgetExceeded):
+        budget.consume(now=7300)
+
+    # A day later everything has expired
+    assert budget.remaining(now=90000) == 2
+
+
+def test_budget_persists(tmp_path):
+    """The ledger survives a restart"""
+    path = tmp_path / "budget.json"
+    budget = RequestBudget(per_day=5, state_path=str(path))
+    budget.consume()
+    budget.consume()
+    budget.save()
+
+    restored = RequestBudget(per_day=5, state_path=str(path))
+    assert restored.remaining() == 3
+    assert restored.status()["used_day"] == 2
@@ -0,0 +1,90 @@
+"""
+Tests for refresh scheduling and deadlines
+"""
+
+import pytest
+
+from tvtv2xmltv.scheduler import Deadline, DeadlineExceeded, RefreshSchedule
+
+
+class FakeClock:
+    """Manually advanced clock"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_deadline_limits_waits_and_ends_with_parent():
+    """Test that a child deadline ends with the earlier of itself and its parent"""
+    clock = FakeClock()
+    refresh = Deadline(60, "refresh", clock=clock)
+    lineup = refresh.child(100, "lineup")
+    assert lineup.remaining() == 60
+    assert lineup.cap(30) == 30
+
+    clock.now += 50
+    assert lineup.cap(30) == 10
+    # A 20 second backoff cannot finish in time
+    with pytest.raises(DeadlineExceeded, match="Refresh deadline of 60s"):
+        lineup.check(margin=20)
+    lineup.check()
+
+    clock.now += 10
+    assert lineup.expired and lineup.remaining() == 0
+    assert refresh.child(5, "lineup").expired
+
+    unlimited = Deadline(clock=clock).child(None, "lineup")
+    assert unlimited.remaining() is None and unlimited.cap(30) == 30
+    unlimited.check(margin=1000)
+
+
+def test_schedule_keeps_a_fixed_rate():
+    """Test that slots don't drift by the refresh duration and jitter doesn't accumulate"""
+    clock = FakeClock()
+    schedule = RefreshSchedule(100, jitter=10, clock=clock, rng=lambda: 0.5)
+    schedule.start(0)
+    assert schedule.due()
+
+    assert schedule.begin() == 0
+    clock.now += 30  # The refresh takes 30 seconds
+    schedule.end(30)
+    assert schedule.wait() == 75  # Slot 1: start + 100 + 5 jitter
+
+    clock.now += 75
+    assert schedule.begin() == 0  # Started exactly at its slot
+    clock.now += 30
+    schedule.end(30)
+    assert schedule.next_run() == 1000 + 200 + 5
+    assert schedule.status()["runs"] == 2 and schedule.status()["overruns"] == 0
+
+
+def test_schedule_reports_lag_and_skips_missed_slots():
+    """Test that an overrun is caught up once, without running every missed slot"""
+    clock = FakeClock()
+    schedule = RefreshSchedule(100, clock=clock)
+    schedule.start(0)
+    schedule.begin()
+    clock.now += 350  # A refresh overran three slots
+    schedule.end(350)
+    assert schedule.overruns == 1 and schedule.due()
+
+    assert schedule.begin() == 50  # Runs for slot 3 at 1300, 50 seconds late
+    assert schedule.skipped == 2
+    clock.now += 10
+    schedule.end(10)
+    assert schedule.next_run() == 1400
+    assert schedule.status()["max_lag"] == 50
+
+
+def test_schedule_reconfigure_keeps_last_slot():
+    """Test that a new interval applies from the last slot"""
+    clock = FakeClock()
+    schedule = RefreshSchedule(100, clock=clock)
+    schedule.start(0)
+    schedule.begin()
+    schedule.end(5)
+    schedule.reconfigure(40, 0)
+    assert schedule.next_run() == 1040
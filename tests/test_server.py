@@ -2,9 +2,17 @@
 Tests for the HTTP server
 """
 
+import copy
+import json
 import os
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
 
 import pytest
+import responses
+from tvtv2xmltv.logo_cache import logo_name
 from tvtv2xmltv.server import XMLTVServer
 from tvtv2xmltv.config import Config
 
@@ -84,3 +92,463 @@ def test_index_serves_xml_inline(test_config, tmp_path):
     assert "inline" in cd
     # Body should contain the XML declaration and content
     assert response.get_data(as_text=True).startswith("<?xml")
+
+
+def test_now_next_and_window_endpoints(test_config, tmp_path):
+    """Now/next and windowed queries are answered from the published index"""
+    test_config.lineups = ["luUSA-OTA85142"]
+    test_config.mock_mode = True
+    test_config.output_file = str(tmp_path / "guide.xml")
+    server = XMLTVServer(test_config)
+    client = server.app.test_client()
+
+    assert client.get("/luUSA-OTA85142/now").status_code == 503
+
+    server._update_xmltv()
+    assert "luUSA-OTA85142" in server.indexes
+
+    response = client.get("/luUSA-OTA85142/now?at=2025-12-28T20:30:00Z")
+    assert response.status_code == 200
+    programmes = response.get_json()["programmes"]
+    assert programmes[0]["title"] == "PBS NewsHour"
+    assert programmes[0]["channel"] == "2.1"
+
+    response = client.get("/luUSA-OTA85142/next?at=2025-12-28T19:00:00Z&channels=2.1")
+    assert response.get_json()["programmes"][0]["title"] == "PBS NewsHour"
+
+    response = client.get("/luUSA-OTA85142.xml?start=2025-12-28T20:00:00Z&hours=1&channels=2.1")
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert body.count("<channel ") == 1
+    assert "PBS NewsHour" in body
+
+    assert client.get("/luUSA-OTA85142.xml?start=bogus").status_code == 400
+    for query in ("hours=inf", "hours=nan", "hours=1e300", "start=nan", "start=-inf&hours=1"):
+        assert client.get(f"/luUSA-OTA85142.xml?{query}").status_code == 400, query
+    for value in ("nan", "inf", "1e20"):
+        assert client.get(f"/luUSA-OTA85142/now?at={value}").status_code == 400, value
+    assert client.get("/unknown/now").status_code == 404
+
+
+def test_stop_update_thread_interrupts_interval(test_config, monkeypatch):
+    """Stopping the update thread does not wait for the update interval"""
+    test_config.update_interval = 3600
+    server = XMLTVServer(test_config)
+    monkeypatch.setattr(server, "_update_xmltv", lambda: None)
+
+    server.start_update_thread()
+    started = time.monotonic()
+    server.stop_update_thread()
+
+    assert time.monotonic() - started < 2
+    assert not server.update_thread.is_alive()
+
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnhandledThreadExceptionWarning")
+def test_waitress_serving_mode(test_config):
+    """The production serving mode answers requests and shuts down cleanly"""
+    pytest.importorskip("waitress")
+    test_config.server_mode = "waitress"
+    test_config.host = "127.0.0.1"
+    test_config.port = 0
+    server = XMLTVServer(test_config)
+
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while server.http_server is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    port = server.http_server.effective_port
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=5) as response:
+        assert json.loads(response.read())["status"] == "healthy"
+
+    server.shutdown()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+
+
+def test_debug_profile_endpoint(tmp_path):
+    """Arming profiling captures the next refresh"""
+    config = Config()
+    config.lineups = ["luUSA-OTA85142"]
+    config.days = 1
+    config.mock_mode = True
+    config.snapshots = False
+    config.output_file = str(tmp_path / "xmltv.xml")
+    server = XMLTVServer(config)
+    client = server.app.test_client()
+
+    assert client.get("/debug/profile").status_code == 404
+    armed = client.post("/debug/profile?capture=cprofile").get_json()
+    assert armed == {"armed": ["cprofile"]}
+
+    client.get("/update")
+    summary = client.get("/debug/profile?format=summary").get_json()
+    names = {entry["name"] for entry in summary["summary"]}
+    assert {"refresh", "convert_lineup", "fetch", "render", "programmes", "write"} <= names
+
+    trace = client.get("/debug/profile").get_json()
+    assert trace["traceEvents"]
+    response = client.get("/debug/profile?format=cprofile")
+    assert response.mimetype == "text/plain"
+    assert client.get("/debug/profile?format=tracemalloc").status_code == 404
+
+
+def test_health_reports_upstream_outage(test_config):
+    """An open circuit marks the server degraded while it keeps serving"""
+    server = XMLTVServer(test_config)
+    for _ in range(test_config.breaker_threshold):
+        server.converter.breaker.record_failure("HTTP 503")
+
+    data = server.app.test_client().get("/health").get_json()
+    assert data["status"] == "degraded"
+    assert data["upstream"]["state"] == "open"
+    assert data["upstream"]["last_error"] == "HTTP 503"
+    assert data["guides"] == {}
+    assert 1 <= server._next_wait() <= test_config.update_interval
+
+
+def test_reload_config_applies_changes_incrementally(tmp_path, monkeypatch):
+    """A reload fetches only added lineups and re-renders without refetching"""
+    monkeypatch.chdir(tmp_path)
+    config = Config({})
+    config.lineups = ["luUSA-OTA85142"]
+    config.days = 1
+    config.mock_mode = True
+    config.snapshots = False
+    config.output_file = str(tmp_path / "xmltv.xml")
+    server = XMLTVServer(config)
+    server.converter.LINEUP_DELAY = 0
+    server._update_xmltv()
+
+    fetched = []
+    fetch_lineup = server.converter.fetch_lineup
+    monkeypatch.setattr(
+        server.converter,
+        "fetch_lineup",
+        lambda lineup_id: fetched.append(lineup_id) or fetch_lineup(lineup_id),
+    )
+    client = server.app.test_client()
+
+    # Adding a lineup fetches it alone; the existing one moves to its own file
+    new_config = copy.copy(config)
+    new_config.lineups = ["luUSA-OTA85142", "luUSA-AZ02490-X"]
+    assert "lineups" in server.reload_config(new_config)
+    assert fetched == ["luUSA-AZ02490-X"]
+    assert server.config is config and config.lineups == new_config.lineups
+    assert client.get("/luUSA-AZ02490-X.xml").status_code == 200
+    assert os.path.exists(tmp_path / "luUSA-OTA85142.xml")
+
+    # Rendering settings re-render the fetched data
+    new_config = copy.copy(config)
+    new_config.stream_base_url = "http://tuner:5004"
+    new_config.port = 9999
+    assert server.reload_config(new_config) == {"stream_base_url"}
+    assert fetched == ["luUSA-AZ02490-X"]
+    assert config.port == 8080
+    assert "http://tuner:5004" in client.get("/luUSA-OTA85142.xml").get_data(as_text=True)
+
+    # Removed lineups are no longer served
+    new_config = copy.copy(config)
+    new_config.lineups = ["luUSA-OTA85142"]
+    server.reload_config(new_config)
+    assert client.get("/luUSA-AZ02490-X.xml").status_code == 404
+    assert "luUSA-AZ02490-X" not in server.converter.guide_data
+    assert fetched == ["luUSA-AZ02490-X"]
+    server.converter.generator.close()
+
+
+def test_reload_config_keeps_settings_on_error(test_config, tmp_path, monkeypatch):
+    """A malformed config file leaves the running configuration untouched"""
+    path = tmp_path / "tvtv.env"
+    path.write_text("bogus\n", encoding="utf-8")
+    monkeypatch.setenv("TVTV_CONFIG_FILE", str(path))
+    server = XMLTVServer(test_config)
+
+    assert server.reload_config() == set()
+    assert server.config.lineups == ["USA-TEST12345"]
+
+
+def test_render_variant_endpoints(test_config, tmp_path):
+    """Per-client variants are rendered from the fetched data and cached"""
+    test_config.lineups = ["luUSA-OTA85142"]
+    test_config.mock_mode = True
+    test_config.snapshots = False
+    test_config.output_file = str(tmp_path / "guide.xml")
+    test_config.render_profiles = '{"remote": {"timezone": "UTC", "channels": "2.1"}}'
+    server = XMLTVServer(test_config)
+    client = server.app.test_client()
+
+    assert client.get("/luUSA-OTA85142.xml?profile=remote").status_code == 503
+    server._update_xmltv()
+
+    body = client.get("/luUSA-OTA85142.xml?profile=remote").get_data(as_text=True)
+    assert body.count("<channel ") == 1
+    assert "+0000" in body and "-0500" not in body
+
+    response = client.get("/xmltv.xml?profile=remote&tz=America/Chicago&stream_url=http://t:5004")
+    body = response.get_data(as_text=True)
+    assert "-0600" in body and "<url>http://t:5004/auto/v2.1</url>" in body
+
+    client.get("/luUSA-OTA85142.xml?profile=remote")
+    assert server.render_cache.status()["hits"] == 1
+    assert client.get("/luUSA-OTA85142.xml?profile=nope").status_code == 404
+    assert client.get("/luUSA-OTA85142.xml?tz=Nowhere").status_code == 400
+    assert client.get("/luUSA-OTA85142.xml?days=x").status_code == 400
+
+    # A refresh publishes new data and drops the cached renderings
+    server._update_xmltv()
+    assert server.render_cache.status()["entries"] == 0
+
+
+@responses.activate
+def test_logo_proxy(test_config, tmp_path):
+    """Guides link logos to the local proxy, which downloads each one once"""
+    test_config.lineups = ["luUSA-OTA85142"]
+    test_config.mock_mode = True
+    test_config.snapshots = False
+    test_config.output_file = str(tmp_path / "guide.xml")
+    test_config.cache_dir = str(tmp_path / "cache")
+    test_config.logo_proxy = True
+    server = XMLTVServer(test_config)
+    client = server.app.test_client()
+    server._update_xmltv()
+
+    logo = server.converter.guide_data["luUSA-OTA85142"]["lineup_data"][0]["logo"]
+    responses.add(responses.GET, logo, body=b"\x89PNG\r\n\x1a\nlogo", content_type="image/png")
+    name = logo_name(logo)
+    with open(test_config.output_file, encoding="utf-8") as f:
+        assert f'<icon src="{test_config.external_url}/logos/{name}" />' in f.read()
+
+    response = client.get(f"/logos/{name}")
+    assert response.status_code == 200
+    assert response.mimetype == "image/png"
+    assert response.cache_control.max_age == test_config.logo_ttl
+    etag = response.headers["ETag"]
+    response.close()
+
+    assert client.get(f"/logos/{name}", headers={"If-None-Match": etag}).status_code == 304
+    assert len(responses.calls) == 1
+    assert client.get("/logos/unknown.png").status_code == 404
+
+    # Logos that cannot be downloaded redirect clients upstream
+    other = server.converter.guide_data["luUSA-OTA85142"]["lineup_data"][1]["logo"]
+    responses.add(responses.GET, other, status=404)
+    response = client.get(f"/logos/{logo_name(other)}")
+    assert response.status_code == 302 and response.location == other
+
+
+def test_shard_manifest_endpoints(test_config, tmp_path):
+    """Per-day shards are published with a manifest and served immutably"""
+    test_config.lineups = ["luUSA-OTA85142"]
+    test_config.mock_mode = True
+    test_config.snapshots = False
+    test_config.days = 2
+    test_config.shards = True
+    test_config.output_file = str(tmp_path / "guide.xml")
+    server = XMLTVServer(test_config)
+    client = server.app.test_client()
+
+    assert client.get("/luUSA-OTA85142/manifest.json").status_code == 503
+    server._update_xmltv()
+
+    response = client.get("/luUSA-OTA85142/manifest.json")
+    assert response.status_code == 200
+    manifest = response.get_json()
+    assert len(manifest["days"]) == 2
+    # The mock returns the same listings every day, but each shard is dated
+    assert manifest["days"][0]["file"] != manifest["days"][1]["file"]
+    etag = response.headers["ETag"]
+    assert (
+        client.get("/luUSA-OTA85142/manifest.json", headers={"If-None-Match": etag}).status_code
+        == 304
+    )
+
+    day = manifest["days"][0]
+    assert day["url"].endswith(f"/luUSA-OTA85142/shards/{day['file']}")
+    response = client.get(f"/luUSA-OTA85142/shards/{day['file']}")
+    assert response.status_code == 200
+    assert "immutable" in response.headers["Cache-Control"]
+    body = response.get_data(as_text=True)
+    assert f'date="{day["date"]}T00:00:00.000Z"' in body
+    assert "PBS NewsHour" in body
+    response.close()
+
+    index = client.get("/manifest.json").get_json()
+    assert index["lineups"]["luUSA-OTA85142"]["version"] == manifest["version"]
+    assert client.get("/luUSA-OTA85142/shards/../guide.xml").status_code == 404
+
+    # An unchanged refresh republishes the same shards
+    server._update_xmltv()
+    assert client.get("/luUSA-OTA85142/manifest.json").get_json()["days"] == manifest["days"]
+
+
+def test_events_stream_announces_new_versions(test_config, tmp_path):
+    """Each published guide version is announced once on /events"""
+    test_config.lineups = ["luUSA-OTA85142"]
+    test_config.mock_mode = True
+    test_config.snapshots = False
+    test_config.output_file = str(tmp_path / "guide.xml")
+    server = XMLTVServer(test_config)
+    client = server.app.test_client()
+
+    response = client.get("/events", buffered=False)
+    assert response.mimetype == "text/event-stream"
+    stream = iter(response.response)
+    assert next(stream).startswith(b"retry:")
+
+    server._update_xmltv()
+    chunk = next(stream).decode()
+    assert chunk.startswith("id: 1\nevent: guide\n")
+    event = json.loads(chunk.split("data: ", 1)[1])
+    assert event["lineup"] == "luUSA-OTA85142"
+    assert event["changed_days"] and event["previous_version"] is None
+    assert server._guide_ages()["luUSA-OTA85142"]["version"] == event["version"]
+
+    # Unchanged data is not announced again
+    server._update_xmltv()
+    assert server.events.last_id == 1
+    response.close()
+
+    assert client.get("/events?last_event_id=x").status_code == 400
+
+
+def test_history_endpoints(test_config, tmp_path):
+    """Archived guide versions are listed and rendered as of a time"""
+    test_config.lineups = ["luUSA-OTA85142"]
+    test_config.mock_mode = True
+    test_config.snapshots = False
+    test_config.history_dir = str(tmp_path / "history")
+    test_config.output_file = str(tmp_path / "guide.xml")
+    server = XMLTVServer(test_config)
+    client = server.app.test_client()
+
+    before = datetime.now(timezone.utc).isoformat()
+    server._update_xmltv()
+    server._update_xmltv()
+    entries = client.get("/luUSA-OTA85142/history").get_json()["entries"]
+    # The unchanged second refresh is not archived
+    assert [entry["kind"] for entry in entries] == ["full"]
+
+    response = client.get("/luUSA-OTA85142.xml", query_string={"at": entries[0]["published_at"]})
+    assert response.status_code == 200
+    assert response.headers["X-Guide-Published-At"] == entries[0]["published_at"]
+    assert "PBS NewsHour" in response.get_data(as_text=True)
+    assert client.get("/luUSA-OTA85142.xml", query_string={"at": before}).status_code == 404
+    assert client.get("/luUSA-OTA85142.xml?at=soon").status_code == 400
+    assert client.get("/health").get_json()["history"]["lineups"]["luUSA-OTA85142"]["entries"] == 1
+
+
+def test_scheduled_refreshes_keep_a_fixed_rate(test_config, tmp_path):
+    """Refreshes are planned from their slots, not from when the last one ended"""
+    test_config.lineups = ["luUSA-OTA85142"]
+    test_config.mock_mode = True
+    test_config.snapshots = False
+    test_config.update_jitter = 0
+    test_config.output_file = str(tmp_path / "guide.xml")
+    server = XMLTVServer(test_config)
+
+    server.schedule.start(0)
+    slot = server.schedule.next_run()
+    server._scheduled_update()
+    assert server.schedule.next_run() == slot + test_config.update_interval
+    # Not due yet: an early retry (open circuit) does not use up the slot
+    server._scheduled_update()
+    assert server.schedule.runs == 1
+
+    schedule = server.app.test_client().get("/health").get_json()["schedule"]
+    assert schedule["runs"] == 1 and schedule["skipped_slots"] == 0
+    assert schedule["refresh_deadline"] == test_config.refresh_deadline
+    assert datetime.fromisoformat(schedule["next_run"]).timestamp() == pytest.approx(
+        slot + test_config.update_interval
+    )
+
+
+def test_demand_driven_refreshes(test_config, tmp_path, monkeypatch):
+    """Requested lineups refresh more often, and stale data is refreshed on demand"""
+    monkeypatch.chdir(tmp_path)
+    test_config.lineups = ["luUSA-OTA85142", "luUSA-AZ02490-X"]
+    test_config.mock_mode = True
+    test_config.snapshots = False
+    test_config.update_interval = 3600
+    test_config.min_update_interval = 900
+    test_config.max_update_interval = 14400
+    test_config.demand_refresh = True
+    server = XMLTVServer(test_config)
+    server.converter.LINEUP_DELAY = 0
+    assert server.schedule.interval == 900
+    client = server.app.test_client()
+
+    # Lineups without data are always due
+    server._refresh()
+    assert set(server.converter.guide_data) == set(test_config.lineups)
+
+    # Two hours later only the requested lineup is due; the idle one waits four hours
+    for guide in server.converter.guide_data.values():
+        guide["fetched_at"] -= timedelta(hours=2)
+    server._attempted = {lineup_id: at - 7200 for lineup_id, at in server._attempted.items()}
+    for _ in range(12):
+        server.demand.record("luUSA-OTA85142")
+    assert server._lineup_interval("luUSA-OTA85142") == pytest.approx(1800)
+    idle = server.converter.guide_data["luUSA-AZ02490-X"]
+    server._refresh()
+    assert server._age("luUSA-OTA85142") < 60
+    assert server.converter.guide_data["luUSA-AZ02490-X"] is idle
+
+    # A request for the stale idle lineup refreshes it once in the background
+    refreshed = threading.Event()
+    refresh_lineups = server._refresh_lineups
+    server._refresh_lineups = lambda ids, max_age=None: (
+        refreshed.wait(5),
+        refresh_lineups(ids, max_age),
+    )
+    assert client.get("/luUSA-AZ02490-X.xml").status_code == 200
+    assert client.get("/luUSA-AZ02490-X/now").status_code == 200
+    assert server.on_demand_refreshes == 1
+    refreshed.set()
+    server._on_demand_thread.join(5)
+    assert server._age("luUSA-AZ02490-X") < 60
+
+    demand = client.get("/health").get_json()["demand"]
+    assert demand["on_demand_refreshes"] == 1
+    assert demand["lineups"]["luUSA-OTA85142"]["refresh_interval"] == pytest.approx(1800)
+
+
+def test_failed_demand_refreshes_back_off(test_config, tmp_path, monkeypatch):
+    """A lineup whose refresh keeps failing is not refetched on every request or tick"""
+    monkeypatch.chdir(tmp_path)
+    test_config.lineups = ["luUSA-OTA85142", "luUSA-AZ02490-X"]
+    test_config.mock_mode = True
+    test_config.snapshots = False
+    test_config.update_interval = 3600
+    test_config.min_update_interval = 900
+    test_config.demand_refresh = True
+    server = XMLTVServer(test_config)
+    server.converter.LINEUP_DELAY = 0
+    server._refresh()
+    for guide in server.converter.guide_data.values():
+        guide["fetched_at"] -= timedelta(hours=5)
+    server._attempted = {lineup_id: at - 18000 for lineup_id, at in server._attempted.items()}
+
+    # Every fetch fails from now on: the stale data is kept
+    attempts = []
+    server.converter.save_lineups = lambda fetch_ids=(), **kwargs: attempts.append(fetch_ids) or {}
+    client = server.app.test_client()
+    assert client.get("/luUSA-OTA85142/now").status_code == 200
+    server._on_demand_thread.join(5)
+    assert attempts == [["luUSA-OTA85142"]]
+
+    for _ in range(3):
+        client.get("/luUSA-OTA85142/now")
+    # The tick only tries the idle lineup, whose interval has passed
+    server._refresh()
+    server._refresh()
+    assert server.on_demand_refreshes == 1
+    assert attempts == [["luUSA-OTA85142"], ["luUSA-AZ02490-X"]]
+
+    # After min_update_interval the lineup is tried again
+    server._attempted["luUSA-OTA85142"] -= 900
+    client.get("/luUSA-OTA85142/now")
+    server._on_demand_thread.join(5)
+    assert attempts[-1] == ["luUSA-OTA85142"] and server.on_demand_refreshes == 2
@@ -0,0 +1,51 @@
+"""
+Tests for per-day guide shards
+"""
+
+import os
+from datetime import datetime, timezone
+
+from tvtv2xmltv.shards import day_dates, read_manifest, shard_name, write_shards
+
+FETCHED_AT = datetime(2025, 12, 31, 12, 0, tzinfo=timezone.utc)
+
+
+def test_day_dates_cross_month_boundaries():
+    """Test that day dates count from the fetch date"""
+    assert day_dates(FETCHED_AT, 3) == ["2025-12-31", "2026-01-01", "2026-01-02"]
+
+
+def test_write_shards_only_adds_changed_days(tmp_path):
+    """Test that unchanged days keep their file and manifest entry"""
+    directory = str(tmp_path / "shards" / "A")
+    first = write_shards(directory, "A", [("d1", "<tv>1</tv>"), ("d2", "<tv>2</tv>")], FETCHED_AT)
+    assert [day["file"] for day in first["days"]] == [
+        shard_name(b"<tv>1</tv>"),
+        shard_name(b"<tv>2</tv>"),
+    ]
+    assert read_manifest(directory) == first
+
+    unchanged = os.path.join(directory, first["days"][0]["file"])
+    mtime = os.stat(unchanged).st_mtime_ns
+    second = write_shards(directory, "A", [("d1", "<tv>1</tv>"), ("d2", "<tv>2b</tv>")], FETCHED_AT)
+    assert second["days"][0] == first["days"][0]
+    assert second["days"][1]["file"] != first["days"][1]["file"]
+    assert second["version"] != first["version"]
+    assert os.stat(unchanged).st_mtime_ns == mtime
+
+
+def test_write_shards_keeps_previous_manifest_files(tmp_path):
+    """Test that shards of the previous manifest survive one more refresh"""
+    directory = str(tmp_path)
+    write_shards(directory, "A", [("d1", "v1")], FETCHED_AT)
+    write_shards(directory, "A", [("d1", "v2")], FETCHED_AT)
+    assert os.path.exists(os.path.join(directory, shard_name(b"v1")))
+
+    write_shards(directory, "A", [("d1", "v3")], FETCHED_AT)
+    assert not os.path.exists(os.path.join(directory, shard_name(b"v1")))
+    assert os.path.exists(os.path.join(directory, shard_name(b"v2")))
+
+
+def test_read_manifest_missing(tmp_path):
+    """Test that a missing manifest reads as None"""
+    assert read_manifest(str(tmp_path)) is None
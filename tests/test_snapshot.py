@@ -0,0 +1,130 @@
+"""
+Tests for the binary guide snapshot format
+"""
+
+import struct
+from datetime import datetime, timezone
+
+import pytest
+from tvtv2xmltv.config import Config
+from tvtv2xmltv.server import XMLTVServer
+from tvtv2xmltv.snapshot import _RECORD, SnapshotError, load_snapshot, snapshot_path, write_snapshot
+from tvtv2xmltv.xmltv_generator import XMLTVGenerator
+
+
+@pytest.fixture
+def guide():
+    """Fetched data in the converter's layout"""
+    program = {
+        "programId": "EP1",
+        "title": "Show & Tell",
+        "subtitle": "Pilot",
+        "startTime": "2023-05-23T20:00:00.000Z",
+        "duration": 1800,
+        "runTime": 30,
+        "type": "S",
+        "flags": ["HD", "New"],
+    }
+    return {
+        "lineup_data": [
+            {"channelNumber": "2.1", "stationId": 1, "stationCallSign": "WABC", "logo": "/a.png"},
+            {"channelNumber": "4.1", "stationId": 2, "stationCallSign": "WNBC", "logo": "/b.png"},
+        ],
+        "listings_by_day": [
+            [[program, dict(program, startTime="2023-05-23T20:30:00.000Z", flags=[])], []],
+            [[], [dict(program, title="Late", subtitle="")]],
+        ],
+        "channel_key": "abc123",
+        "fetched_at": datetime(2023, 5, 23, 12, tzinfo=timezone.utc),
+    }
+
+
+def test_round_trip(tmp_path, guide):
+    """A loaded snapshot renders exactly like the original data"""
+    path = str(tmp_path / "guide.snap")
+    write_snapshot(path, "USA-ONE", guide)
+    loaded = load_snapshot(path)
+
+    assert loaded.pop("lineup_id") == "USA-ONE"
+    assert loaded["fetched_at"] == guide["fetched_at"]
+    assert loaded["channel_key"] == "abc123"
+    assert loaded["listings_by_day"][0][0][0] == guide["listings_by_day"][0][0][0]
+
+    gen = XMLTVGenerator()
+    assert gen.generate(loaded["lineup_data"], loaded["listings_by_day"], "x") == gen.generate(
+        guide["lineup_data"], guide["listings_by_day"], "x"
+    )
+
+
+def test_invalid_snapshots(tmp_path):
+    """Missing or corrupt snapshots raise SnapshotError"""
+    with pytest.raises(SnapshotError):
+        load_snapshot(str(tmp_path / "missing.snap"))
+
+    corrupt = tmp_path / "corrupt.snap"
+    corrupt.write_bytes(b"TVTVSNP1" + b"\xff" * 8)
+    with pytest.raises(SnapshotError):
+        load_snapshot(str(corrupt))
+
+    assert snapshot_path("/data/xmltv.xml") == "/data/xmltv.snap"
+
+
+def test_truncated_record_tables(tmp_path, guide):
+    """A record table shorter than the programme counts raises SnapshotError"""
+    path = tmp_path / "guide.snap"
+    write_snapshot(str(path), "USA-ONE", guide)
+    data = path.read_bytes()
+
+    path.write_bytes(data[: -_RECORD.size])
+    with pytest.raises(SnapshotError, match="Truncated"):
+        load_snapshot(str(path))
+
+    # A record count lowered to match a shorter file
+    size = _RECORD.size
+    count_at = len(data) - 3 * size - 4
+    path.write_bytes(data[:count_at] + struct.pack("<I", 2) + data[count_at + 4 : -size])
+    with pytest.raises(SnapshotError, match="Record count"):
+        load_snapshot(str(path))
+
+
+def test_out_of_range_durations_are_stored_as_zero(tmp_path, guide):
+    """A negative or non-numeric run time does not stop the snapshot from being written"""
+    odd = guide["listings_by_day"][0][0][0]
+    odd.update(runTime=-5, duration="n/a")
+    path = str(tmp_path / "guide.snap")
+    write_snapshot(path, "USA-ONE", guide)
+    loaded = load_snapshot(path)["listings_by_day"][0][0][0]
+    assert (loaded["runTime"], loaded["duration"]) == (0, 0)
+    assert loaded["title"] == odd["title"]
+
+
+def test_null_fields_are_stored_as_empty(tmp_path, guide):
+    """Null strings from the API do not stop the snapshot from being written"""
+    odd = guide["listings_by_day"][0][0][0]
+    odd.update(title=None, subtitle=None, type=None, programId=None, flags=[None, "HD"])
+    path = str(tmp_path / "guide.snap")
+    write_snapshot(path, "USA-ONE", guide)
+    loaded = load_snapshot(path)["listings_by_day"][0][0][0]
+    for field in ("title", "subtitle", "type", "programId"):
+        assert loaded[field] == "", field
+    assert loaded["flags"] == ["HD"]
+
+
+def test_server_restart_serves_snapshot_without_refetch(tmp_path):
+    """A restarted server loads the saved guide instead of refetching"""
+    config = Config()
+    config.lineups = ["luUSA-OTA85142"]
+    config.mock_mode = True
+    config.days = 1
+    config.output_file = str(tmp_path / "xmltv.xml")
+    XMLTVServer(config)._update_xmltv()
+    assert (tmp_path / "xmltv.snap").exists()
+
+    restarted = XMLTVServer(config)
+    restarted.converter.fetch_lineup = lambda _: pytest.fail("must not refetch")
+    wait = restarted._load_snapshots()
+
+    assert wait > 0
+    assert restarted.last_update is not None
+    assert "luUSA-OTA85142" in restarted.indexes
+    assert restarted.converter.render_lineup("luUSA-OTA85142").startswith("<?xml")
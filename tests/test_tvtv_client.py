@@ -3,7 +3,11 @@ Tests for the TVTV API client
 """
 
 import pytest
+import requests
 import responses
+from tvtv2xmltv.circuit_breaker import CircuitBreaker, CircuitOpenError
+from tvtv2xmltv.request_budget import BudgetExceeded, RequestBudget
+from tvtv2xmltv.scheduler import Deadline, DeadlineExceeded
 from tvtv2xmltv.tvtv_client import TVTVClient
 
 
@@ -130,3 +134,168 @@ def test_request_retry_on_failure(client):
     result = client_with_retry.get_lineup_channels()
     assert result == []
     assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_grid_batch_shrinks_after_throttle(monkeypatch):
+    """A rate-limited batch shrinks the size used for the following batches"""
+    monkeypatch.setattr("tvtv2xmltv.tvtv_client.time.sleep", lambda _: None)
+    client = TVTVClient("USA-TEST12345")
+    channels = list(range(1000, 1030))
+    base = (
+        "https://www.tvtv.us/api/v1/lineup/USA-TEST12345/grid/"
+        "2023-05-23T04:00:00.000Z/2023-05-24T03:59:00.000Z/"
+    )
+
+    first_batch = base + ",".join(str(c) for c in channels[:20])
+    responses.add(responses.GET, first_batch, status=429)
+    responses.add(responses.GET, first_batch, json=[[] for _ in range(20)], status=200)
+    responses.add(
+        responses.GET,
+        base + ",".join(str(c) for c in channels[20:30]),
+        json=[[] for _ in range(10)],
+        status=200,
+    )
+
+    result = client.get_grid_data("2023-05-23T04:00:00.000Z", "2023-05-24T03:59:00.000Z", channels)
+
+    assert len(result) == 30
+    assert len(responses.calls) == 3
+    # The batch after the 429 used the halved size, then grew again on success
+    assert responses.calls[2].request.url.endswith("1029")
+    assert client.batch_sizer.batch_size == 15
+
+
+@responses.activate
+def test_request_budget_blocks_requests():
+    """Requests beyond the budget raise instead of being sent"""
+    responses.add(
+        responses.GET,
+        "https://www.tvtv.us/api/v1/lineup/USA-TEST12345/channels",
+        json=[],
+        status=200,
+    )
+    client = TVTVClient("USA-TEST12345", budget=RequestBudget(per_hour=1))
+    client.REQUEST_DELAY = 0
+    client.get_lineup_channels()
+
+    with pytest.raises(BudgetExceeded):
+        client.get_lineup_channels()
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_circuit_breaker_short_circuits(monkeypatch):
+    """Sustained failures open the circuit and stop further requests"""
+    monkeypatch.setattr("tvtv2xmltv.tvtv_client.time.sleep", lambda _: None)
+    responses.add(
+        responses.GET,
+        "https://www.tvtv.us/api/v1/lineup/USA-TEST12345/channels",
+        status=503,
+    )
+    breaker = CircuitBreaker(failure_threshold=2)
+    client = TVTVClient("USA-TEST12345", max_retries=3, breaker=breaker)
+
+    # The second failure opens the circuit, so the third attempt is never sent
+    with pytest.raises(requests.HTTPError):
+        client.get_lineup_channels()
+    assert len(responses.calls) == 2
+
+    with pytest.raises(CircuitOpenError):
+        client.get_lineup_channels()
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_probe_cut_short_does_not_wedge_circuit():
+    """A probe refused by the budget or deadline lets the next request probe"""
+    responses.add(
+        responses.GET,
+        "https://www.tvtv.us/api/v1/lineup/USA-TEST12345/channels",
+        json=[],
+        status=200,
+    )
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure("outage")
+    assert breaker.state == "open"
+
+    exhausted = TVTVClient("USA-TEST12345", budget=RequestBudget(per_hour=1), breaker=breaker)
+    exhausted.budget.consume()
+    with pytest.raises(BudgetExceeded):
+        exhausted.get_lineup_channels()
+    assert breaker.state == "open" and breaker.retry_in() == 0
+
+    # The deadline passes while the probe is waiting for the upstream
+    now = [0.0]
+
+    def hang(request):
+        now[0] += 60
+        raise requests.ConnectionError("timed out")
+
+    responses.add_callback(
+        responses.GET, "https://www.tvtv.us/api/v1/lineup/USA-TEST12345/grid/s/e/1", callback=hang
+    )
+    late = TVTVClient("USA-TEST12345", breaker=breaker, deadline=Deadline(30, clock=lambda: now[0]))
+    with pytest.raises(DeadlineExceeded):
+        late.get_grid_data("s", "e", [1])
+    assert breaker.state == "open" and breaker.retry_in() == 0
+
+    client = TVTVClient("USA-TEST12345", breaker=breaker)
+    client.REQUEST_DELAY = 0
+    assert client.get_lineup_channels() == []
+    assert breaker.state == "closed" and len(responses.calls) == 2
+
+
+@responses.activate
+def test_client_errors_do_not_open_circuit():
+    """A 404 means the upstream is up"""
+    responses.add(
+        responses.GET,
+        "https://www.tvtv.us/api/v1/lineup/USA-TEST12345/channels",
+        status=404,
+    )
+    breaker = CircuitBreaker(failure_threshold=1)
+    client = TVTVClient("USA-TEST12345", max_retries=1, breaker=breaker)
+    with pytest.raises(requests.HTTPError):
+        client.get_lineup_channels()
+    assert breaker.state == "closed"
+
+
+@responses.activate
+def test_invalid_grid_response_is_retried(monkeypatch):
+    """A garbage grid body counts as a failed request"""
+    monkeypatch.setattr("tvtv2xmltv.tvtv_client.time.sleep", lambda _: None)
+    responses.add(
+        responses.GET,
+        "https://www.tvtv.us/api/v1/lineup/USA-TEST12345/grid/s/e/1",
+        body="<html>Attention required</html>",
+        status=200,
+    )
+    client = TVTVClient("USA-TEST12345", max_retries=2)
+    with pytest.raises(requests.exceptions.InvalidJSONError):
+        client.get_grid_data("s", "e", [1])
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_deadline_stops_retries_without_opening_circuit(monkeypatch):
+    """A backoff that would outlast the deadline gives up instead of waiting"""
+    sleeps = []
+    monkeypatch.setattr("tvtv2xmltv.tvtv_client.time.sleep", sleeps.append)
+    responses.add(
+        responses.GET,
+        "https://www.tvtv.us/api/v1/lineup/USA-TEST12345/channels",
+        status=429,
+    )
+    breaker = CircuitBreaker(failure_threshold=5)
+    client = TVTVClient("USA-TEST12345", breaker=breaker, deadline=Deadline(3))
+    with pytest.raises(DeadlineExceeded):
+        client.get_lineup_channels()
+    # The first 5 second backoff does not fit in the 3 second deadline
+    assert len(responses.calls) == 1 and sleeps == []
+    assert client._timeout() <= 3
+
+    expired = TVTVClient("USA-TEST12345", deadline=Deadline(0))
+    with pytest.raises(DeadlineExceeded):
+        expired.get_lineup_channels()
+    assert len(responses.calls) == 1
@@ -0,0 +1,221 @@
+"""
+Tests for distributed fetching through the work queue
+"""
+
+import os
+import sqlite3
+import subprocess  # nosec B404 - runs this interpreter only
+import sys
+import time
+
+import requests
+
+from tvtv2xmltv.config import Config
+from tvtv2xmltv.converter import TVTVConverter, day_windows
+from tvtv2xmltv.scheduler import Deadline
+from tvtv2xmltv.work_queue import CLAIMED, DONE, FAILED, PENDING, QueueWorker, WorkQueue
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+LINEUPS = ["luUSA-OTA85142", "luUSA-AZ02490-X"]
+
+
+class FakeClient:
+    """Grid client returning canned data or raising"""
+
+    def __init__(self, lineup_id, error=None):
+        self.lineup_id = lineup_id
+        self.error = error
+        self.calls = 0
+
+    def get_grid_data(self, start_time, end_time, channels):  # pylint: disable=unused-argument
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return [[{"title": f"{self.lineup_id} {start_time}"}] for _ in channels]
+
+
+def _config(tmp_path, **settings):
+    config = Config({})
+    config.lineups = list(LINEUPS)
+    config.mock_mode = True
+    config.snapshots = False
+    config.days = 2
+    config.work_queue = str(tmp_path / "queue.sqlite")
+    for name, value in settings.items():
+        setattr(config, name, value)
+    return config
+
+
+def test_claim_complete_and_results(tmp_path):
+    """Test the job life cycle"""
+    queue = WorkQueue(str(tmp_path / "q.sqlite"))
+    batch = queue.start_batch()
+    queue.enqueue(batch, "A", 1, "s1", "e1", ["10", "11"])
+    queue.enqueue(batch, "A", 0, "s0", "e0", ["10", "11"])
+
+    job = queue.claim("w1")
+    assert (job.lineup, job.day, job.stations, job.attempts) == ("A", 1, ["10", "11"], 1)
+    assert queue.claim("w2").day == 0
+    assert queue.claim("w3") is None
+    assert queue.progress(batch) == {"A": {CLAIMED: 2}}
+    assert queue.status()["workers"] == ["w1", "w2"]
+
+    assert not queue.complete(job.id, "w2", [])  # Not w2's job
+    assert queue.complete(job.id, "w1", [[{"title": "News"}], []])
+    assert queue.results(batch, "A")[1] == (1, [[{"title": "News"}], []], None)
+
+    queue.finish_batch(batch)
+    assert queue.progress(batch) == {}
+
+
+def test_expired_leases_are_reclaimed_then_failed(tmp_path):
+    """Test that jobs of vanished workers are retried, up to max_attempts"""
+    queue = WorkQueue(str(tmp_path / "q.sqlite"), lease=0, max_attempts=2)
+    batch = queue.start_batch()
+    queue.enqueue(batch, "A", 0, "s", "e", ["10"])
+
+    first = queue.claim("dead-worker")
+    time.sleep(0.01)
+    second = queue.claim("w2")
+    assert second.id == first.id and second.attempts == 2
+    assert not queue.renew(first.id, "dead-worker")
+
+    time.sleep(0.01)
+    assert queue.claim("w3") is None
+    assert queue.progress(batch) == {"A": {FAILED: 1}}
+
+
+def test_worker_retries_failed_fetches(tmp_path):
+    """Test that failed attempts go back to the queue until max_attempts"""
+    queue = WorkQueue(str(tmp_path / "q.sqlite"), max_attempts=2)
+    batch = queue.start_batch()
+    queue.enqueue(batch, "A", 0, "s", "e", ["10"])
+    client = FakeClient("A", requests.ConnectionError("down"))
+    worker = QueueWorker(queue, lambda lineup_id: client, identity="w")
+
+    assert worker.run_once()
+    assert queue.progress(batch) == {"A": {PENDING: 1}}
+    assert worker.run_once()
+    assert not worker.run_once()
+    assert queue.results(batch, "A") == [(0, None, "down")]
+    assert client.calls == 2
+
+
+def test_coordinator_fetches_alone_without_workers(tmp_path):
+    """Test that with no workers the coordinator's own worker does the jobs"""
+    converter = TVTVConverter(_config(tmp_path))
+    files = converter.save_to_file()
+
+    assert [os.path.basename(f) for f in files] == [f"{lid}.xml" for lid in LINEUPS]
+    single = TVTVConverter(_config(tmp_path, work_queue=None))
+    for lineup_id in LINEUPS:
+        single.fetch_lineup(lineup_id)
+        distributed = converter.guide_data[lineup_id]
+        assert distributed["listings_by_day"] == single.guide_data[lineup_id]["listings_by_day"]
+        assert distributed["channel_key"] == single.guide_data[lineup_id]["channel_key"]
+    assert converter.work_queue.status()["jobs"] == {}
+    for path in files:
+        os.remove(path)
+
+
+def test_coordinator_keeps_stale_data_when_jobs_fail(tmp_path, monkeypatch):
+    """Test that failed jobs leave the previous data in place"""
+    converter = TVTVConverter(_config(tmp_path, lineups=LINEUPS[:1]))
+    previous = {"lineup_data": [], "listings_by_day": [], "channel_key": None, "fetched_at": 0}
+    converter.guide_data[LINEUPS[0]] = previous
+    monkeypatch.setattr(converter.work_queue, "max_attempts", 1)
+
+    original = converter.create_client
+
+    def failing_client(lineup_id):
+        client = original(lineup_id)
+        client.get_grid_data = FakeClient(lineup_id, requests.Timeout("slow")).get_grid_data
+        return client
+
+    monkeypatch.setattr(converter, "create_client", failing_client)
+    # pylint: disable=protected-access
+    assert list(converter._fetch_distributed()) == LINEUPS[:1]
+    assert converter.guide_data[LINEUPS[0]] is previous
+    assert "slow" in converter.stale[LINEUPS[0]]
+
+
+def test_worker_processes_share_the_jobs(tmp_path):
+    """Test a coordinator with separate worker processes"""
+    config = _config(tmp_path, days=3, work_queue_local=False)
+    env = dict(
+        os.environ,
+        PYTHONPATH=SRC,
+        TVTV_MOCK_MODE="true",
+        TVTV_WORK_QUEUE=config.work_queue,
+        TVTV_LOG_LEVEL="WARNING",
+    )
+    workers = [
+        subprocess.Popen(  # nosec B603 - fixed arguments
+            [sys.executable, os.path.join(SRC, "main.py"), "--mode", "worker"], env=env
+        )
+        for _ in range(2)
+    ]
+    try:
+        converter = TVTVConverter(config)
+        converter.work_queue.finish_batch = lambda batch: None  # Keep the jobs to inspect
+        completed = list(converter._fetch_distributed())  # pylint: disable=protected-access
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait(timeout=30)
+
+    with sqlite3.connect(config.work_queue) as conn:
+        states = conn.execute("SELECT DISTINCT state FROM jobs").fetchall()
+        claimed_by = {row[0].split(":")[1] for row in conn.execute("SELECT worker FROM jobs")}
+    assert states == [(DONE,)]
+    assert claimed_by <= {str(worker.pid) for worker in workers}
+    assert sorted(completed) == sorted(LINEUPS)
+    for lineup_id in LINEUPS:
+        assert len(converter.guide_data[lineup_id]["listings_by_day"]) == 3
+    assert all(worker.returncode == 0 for worker in workers)
+
+
+def test_coordinator_survives_deadline_during_channel_fetch(tmp_path):
+    """Test that a deadline passing before the jobs are queued keeps every lineup's data"""
+    converter = TVTVConverter(_config(tmp_path))
+    for lineup_id in LINEUPS:
+        converter.guide_data[lineup_id] = {
+            "lineup_data": [],
+            "listings_by_day": [],
+            "channel_key": None,
+            "fetched_at": 0,
+        }
+    finished = []
+    finish_batch = converter.work_queue.finish_batch
+    converter.work_queue.finish_batch = lambda batch: (finished.append(batch), finish_batch(batch))
+    converter.deadline = Deadline(0)
+
+    # pylint: disable=protected-access
+    assert list(converter._fetch_distributed()) == LINEUPS
+    for lineup_id in LINEUPS:
+        assert "Refresh deadline of 0s" in converter.stale[lineup_id]
+    assert len(finished) == 1
+    assert converter.work_queue.status()["jobs"] == {}
+
+
+def test_coordinator_keeps_empty_days_in_place(tmp_path, monkeypatch):
+    """Test that a job returning no listings leaves an empty day, not a gap"""
+    converter = TVTVConverter(_config(tmp_path, lineups=LINEUPS[:1], days=3))
+    original = converter.create_client
+
+    def client(lineup_id):
+        fake = original(lineup_id)
+        canned = FakeClient(lineup_id).get_grid_data
+        starts = [start for start, _ in day_windows(3)]
+        fake.get_grid_data = lambda start_time, end_time, channels: (
+            [] if start_time == starts[1] else canned(start_time, end_time, channels)
+        )
+        return fake
+
+    monkeypatch.setattr(converter, "create_client", client)
+    # pylint: disable=protected-access
+    assert list(converter._fetch_distributed()) == LINEUPS[:1]
+    listings_by_day = converter.guide_data[LINEUPS[0]]["listings_by_day"]
+    assert len(listings_by_day) == 3
+    assert listings_by_day[1] == [] and listings_by_day[2]
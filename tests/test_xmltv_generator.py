@@ -3,6 +3,7 @@ Tests for the XMLTV generator
 """
 
 import pytest
+from tvtv2xmltv.logo_cache import logo_name
 from tvtv2xmltv.xmltv_generator import XMLTVGenerator
 
 
@@ -24,6 +25,33 @@ def test_generate_channel():
     assert "https://www.tvtv.us/path/to/logo.png" in result
 
 
+def test_generate_channel_logo_urls():
+    """Absolute logo URLs are kept, and the logo proxy rewrites icons locally"""
+    logo = "https://s3.amazonaws.com/logos/s10212_h3_aa.png"
+    channel = {"channelNumber": "2.1", "stationCallSign": "KAET", "logo": logo}
+
+    assert f'<icon src="{logo}" />' in XMLTVGenerator()._generate_channel(channel)
+
+    gen = XMLTVGenerator(logo_base_url="http://guide:8080/logos")
+    assert f'<icon src="http://guide:8080/logos/{logo_name(logo)}" />' in gen._generate_channel(
+        channel
+    )
+
+    channel["logo"] = None
+    assert "<icon" not in gen._generate_channel(channel)
+
+
+def test_generate_channel_stream_urls():
+    """Stream URLs use the HDHomeRun layout or a {channel} template"""
+    channel = {"channelNumber": "2.1", "stationCallSign": "WABC", "logo": "/logo.png"}
+
+    result = XMLTVGenerator(stream_base_url="http://hdhr:5004")._generate_channel(channel)
+    assert "<url>http://hdhr:5004/auto/v2.1</url>" in result
+
+    gen = XMLTVGenerator(stream_base_url="http://tuner/play?ch={channel}&fmt=ts")
+    assert "<url>http://tuner/play?ch=2.1&amp;fmt=ts</url>" in gen._generate_channel(channel)
+
+
 def test_generate_programme():
     """Test programme generation"""
     gen = XMLTVGenerator("America/New_York")
@@ -139,3 +167,51 @@ def test_escape_special_characters():
     assert "Show &amp; Movie" in result
     # The escape function escapes &, <, > but not quotes by default
     assert 'Episode with "quotes"' in result or "Episode with &quot;quotes&quot;" in result
+
+
+def test_channel_block_memoised_by_key():
+    """Channel elements are rendered once per channel digest"""
+    gen = XMLTVGenerator()
+    lineup_data = [{"channelNumber": "2.1", "stationCallSign": "WABC", "logo": "/logo.png"}]
+
+    first = gen.generate(lineup_data, [], channel_key="abc")
+    lineup_data[0]["stationCallSign"] = "WXYZ"
+    cached = gen.generate(lineup_data, [], channel_key="abc")
+    rerendered = gen.generate(lineup_data, [], channel_key="def")
+
+    assert "WABC" in first
+    assert "WABC" in cached
+    assert "WXYZ" in rerendered
+
+
+def test_parallel_rendering_matches_serial():
+    """Process pool rendering produces the same document as serial rendering"""
+    lineup_data = [
+        {"channelNumber": f"{n}.1", "stationCallSign": f"W{n}", "logo": "/logo.png"}
+        for n in range(1, 6)
+    ]
+    listings_by_day = [
+        [
+            [
+                {
+                    "title": f"Show {day}-{n}-{i}",
+                    "startTime": f"2023-05-2{day}T{10 + i:02d}:00:00.000Z",
+                    "duration": 3600,
+                    "runTime": 60,
+                    "flags": ["HD"],
+                }
+                for i in range(3)
+            ]
+            for n in range(1, 6)
+        ]
+        for day in range(1, 3)
+    ]
+
+    serial = XMLTVGenerator("America/New_York")
+    parallel = XMLTVGenerator("America/New_York", render_workers=2, parallel_threshold=0)
+    try:
+        parallel_result = parallel.generate(lineup_data, listings_by_day, "http://test.local")
+    finally:
+        parallel.close()
+
+    assert parallel_result == serial.generate(lineup_data, listings_by_day, "http://test.local")